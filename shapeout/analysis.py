@@ -9,17 +9,20 @@ import chaco.api as ca
 from chaco.color_mapper import ColorMapper
 import codecs
 import copy
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
 import numpy as np
 import os
 import warnings
 
 # dclab imports
 import dclab
-from dclab.rtdc_dataset import RTDC_DataSet
 from dclab.polygon_filter import PolygonFilter
 import dclab.definitions as dfn
 from dclab import config
 
+from .hashcache import fingerprint_file
+from .rtdc_dataset import RTDC_DataSet, axis_summary
 from .tlabwrap import IGNORE_AXES
 
 
@@ -32,28 +35,64 @@ class Analysis(object):
      - common configuration parameters of the data sets
      - Plotting parameters
     """
-    def __init__(self, data, search_path="./"):
+    def __init__(self, data, search_path="./", workers=1,
+                 worker_type="process", callback=None, lazy=False,
+                 sort_index=False, hash_cache=None):
         """ Analysis data object.
+        
+        Parameters
+        ----------
+        data : list or str
+            List of .tdms files or RTDC_DataSet instances, or path
+            to a session index file.
+        search_path : str
+            Relative search path for tdms files of a session
+            (see `self._ImportDumped`).
+        workers : int
+            Number of workers used for loading the measurements.
+            If set to 1, the measurements are loaded sequentially.
+            If set to 0, one worker per CPU is used.
+        worker_type : str
+            Either "process" or "thread"; determines whether
+            measurements are loaded in a process or a thread pool.
+        callback : callable or None
+            Called with the arguments `(loaded, total, filename)`
+            each time a measurement has been loaded.
+        lazy : bool
+            Only load data columns from the tdms files when they are
+            accessed (see `shapeout.rtdc_dataset.RTDC_DataSet`).
+        sort_index : bool
+            Compute box filters with sorted indices of the data
+            columns (see `shapeout.rtdc_dataset.RTDC_DataSet`).
+        hash_cache : str or None
+            Path to a hash cache database for the file hashes of
+            the measurements (see `shapeout.hashcache.HashCache`).
         """
         self.measurements = list()
+        loadkw = {"workers": workers,
+                  "worker_type": worker_type,
+                  "callback": callback,
+                  "lazy": lazy,
+                  "sort_index": sort_index,
+                  "hash_cache": hash_cache}
         if isinstance(data, list):
             # New analysis
-            for f in data:
-                if os.path.exists(unicode(f)):
-                    # filename
-                    self.measurements.append(RTDC_DataSet(f))
-                else:
-                    # RTDC data set
-                    self.measurements.append(f)
+            self.measurements = list(data)
+            # indices of file names in `data`
+            fids = [ ii for ii, f in enumerate(data)
+                     if os.path.exists(unicode(f)) ]
+            loaded = load_measurements([data[ii] for ii in fids], **loadkw)
+            for ii, mm in zip(fids, loaded):
+                self.measurements[ii] = mm
         elif isinstance(data, (unicode, str)) and os.path.exists(data):
             # We are opening a session "index.txt" file
-            self._ImportDumped(data, search_path=search_path)
+            self._ImportDumped(data, search_path=search_path, **loadkw)
         else:
             raise ValueError("Argument not an index file or list of"+\
                              " .tdms files: {}".format(data))
 
 
-    def _ImportDumped(self, indexname, search_path="./"):
+    def _ImportDumped(self, indexname, search_path="./", **loadkw):
         """ Loads data from index file as saved using `self.DumpData`.
         
         Parameters
@@ -63,6 +102,8 @@ class Analysis(object):
         search_path : str
             Relative search path where to look for tdms files if
             the absolute path stored in index.txt cannot be found.
+        loadkw : dict
+            Keyword arguments for `load_measurements`.
         """
         ## Read index file and locate tdms file.
         thedir = os.path.dirname(indexname)
@@ -77,10 +118,19 @@ class Analysis(object):
         # The identifier (in brackets []) contains a number before the first
         # underscore "_" which determines the order of the plots:
         keys.sort(key=lambda x: int(x.split("_")[0]))
-        for key in keys:
+        tlocs = [ session_get_tdms_file(datadict[key], search_path)
+                  for key in keys ]
+        # Fingerprints are only stored since version 0.6.3. Comparing
+        # them is fast and detects modified files before anything
+        # is loaded.
+        for key, tloc in zip(keys, tlocs):
+            if not session_check_fingerprints(datadict[key], tloc):
+                raise ValueError("Hashes don't match for file {}.".
+                                 format(tloc))
+        # The order of `mms` is the order of `keys`.
+        mms = load_measurements(tlocs, **loadkw)
+        for key, tloc, mm in zip(keys, tlocs, mms):
             data = datadict[key]
-            tloc = session_get_tdms_file(data, search_path)
-            mm = RTDC_DataSet(tloc)
             if "title" in data:
                 # title saved starting version 0.5.6.dev6
                 mm.title = data["title"]
@@ -138,6 +188,14 @@ class Analysis(object):
             out.append("tdms hash = "+mm.file_hashes[0][1])
             out.append("camera.ini hash = "+mm.file_hashes[1][1])
             out.append("para.ini hash = "+mm.file_hashes[2][1])
+            out.append("tdms fingerprint = "+
+                       fingerprint_file(mm.file_hashes[0][0]))
+            out.append("camera.ini fingerprint = "+
+                       fingerprint_file(mm.file_hashes[1][0]))
+            out.append("para.ini fingerprint = "+
+                       fingerprint_file(mm.file_hashes[2][0]))
+            out.append("tdms size = {}".format(
+                       os.path.getsize(mm.file_hashes[0][0])))
             out.append("name = "+mm.name+".tdms")
             out.append("fdir = "+mm.fdir)
             try:
@@ -324,9 +382,7 @@ class Analysis(object):
         unusable = []
         for ax in dfn.uid:
             for mm in self.measurements:
-                # Get the attribute name for the axis
-                atname = dfn.cfgmaprev[ax]
-                if np.sum(np.abs(getattr(mm, atname))) == 0:
+                if not axis_summary(mm, ax)["present"]:
                     unusable.append(ax)
                     break
         return unusable
@@ -360,10 +416,11 @@ class Analysis(object):
                 if k.startswith(ax) or k.endswith(ax):
                     conf.pop(k)
         # remove axes that are not owned by all measurements
+        unusable = self.GetUnusableAxes()
         for k in list(conf.keys()):
             if k.endswith("Min") or k.endswith("Max"):
                 ax = k[:-4]
-                if ax in self.GetUnusableAxes():
+                if ax in unusable:
                     conf.pop(k)
         return conf
 
@@ -410,10 +467,9 @@ class Analysis(object):
             for mm in self.measurements:
                 # uid is defined in definitions
                 for name in dfn.uid:
-                    if hasattr(mm, dfn.cfgmaprev[name]):
-                        att = getattr(mm, dfn.cfgmaprev[name])
-                        minmaxdict["{} Min".format(name)].append(att.min())
-                        minmaxdict["{} Max".format(name)].append(att.max())
+                    summary = axis_summary(mm, name)
+                    minmaxdict["{} Min".format(name)].append(summary["min"])
+                    minmaxdict["{} Max".format(name)].append(summary["max"])
             # set contour accuracy for every element
             for name in dfn.uid:
                 atmax = np.average(minmaxdict["{} Max".format(name)])
@@ -489,8 +545,87 @@ def darkjet(myrange, **traits):
     return ColorMapper.from_segment_map(_data, range=myrange, **traits)
 
 
+def _load_measurement(args):
+    """ Helper for `load_measurements` (must be picklable) """
+    ii, tdms_file, kwargs = args
+    return ii, RTDC_DataSet(tdms_file, **kwargs)
+
+
+def load_measurements(tdms_files, workers=1, worker_type="process",
+                      callback=None, lazy=False, sort_index=False,
+                      hash_cache=None):
+    """ Load several tdms files, optionally in parallel
+    
+    Parameters
+    ----------
+    tdms_files : list of str
+        Paths to the tdms files.
+    workers : int
+        Number of workers. If set to 1, the files are loaded
+        sequentially. If set to 0, one worker per CPU is used.
+    worker_type : str
+        Either "process" or "thread".
+    callback : callable or None
+        Called with the arguments `(loaded, total, filename)` each
+        time a measurement has been loaded. The callback is always
+        called from the calling thread.
+    lazy : bool
+        Only load data columns when they are accessed.
+    sort_index : bool
+        Use sorted indices of the data columns for box filters.
+    hash_cache : str or None
+        Path to a hash cache database (see
+        `shapeout.hashcache.HashCache`).
+    
+    Returns
+    -------
+    measurements : list of RTDC_DataSet
+        The measurements in the order given by `tdms_files`.
+    """
+    if not worker_type in ["process", "thread"]:
+        raise ValueError("Unknown worker type: {}".format(worker_type))
+    total = len(tdms_files)
+    measurements = [None]*total
+    if workers == 0:
+        workers = mp.cpu_count()
+    workers = min(workers, total)
+    # keyword arguments for RTDC_DataSet
+    kwargs = {"lazy": lazy,
+              "sort_index": sort_index,
+              "hash_cache": hash_cache}
+    
+    if workers <= 1:
+        for ii, f in enumerate(tdms_files):
+            measurements[ii] = RTDC_DataSet(f, **kwargs)
+            if callback is not None:
+                callback(ii+1, total, f)
+    else:
+        if worker_type == "process":
+            pool = mp.Pool(processes=workers)
+        else:
+            pool = ThreadPool(processes=workers)
+        try:
+            args = [ (ii, f, kwargs) for ii, f in enumerate(tdms_files) ]
+            results = pool.imap_unordered(_load_measurement, args)
+            # Results arrive in the order in which they are loaded.
+            for loaded, (ii, mm) in enumerate(results):
+                measurements[ii] = mm
+                if callback is not None:
+                    callback(loaded+1, total, tdms_files[ii])
+        finally:
+            pool.close()
+            pool.join()
+    return measurements
+
+
 def session_check_index(indexname, search_path="./"):
     """ Check a session file index for existance of all measurement files
+    
+    Returns a dictionary with the key "missing tdms". Each missing
+    measurement is a list containing the identifier in the index
+    file, the path to the tdms file, the hash, the fingerprint, and
+    the size of the tdms file. The fingerprint and the size are
+    `None` for sessions created before version 0.6.3.
     """
     missing_files = []
     
@@ -503,12 +638,39 @@ def session_check_index(indexname, search_path="./"):
         data = datadict[key]
         tdms = session_get_tdms_file(data, search_path)
         if not os.path.exists(tdms):
-            missing_files.append([key, tdms, data["tdms hash"]])
+            size = data.get("tdms size", None)
+            if size is not None:
+                size = int(size)
+            missing_files.append([key, tdms, data["tdms hash"],
+                                  data.get("tdms fingerprint", None),
+                                  size])
     
     messages = {"missing tdms": missing_files}
     return messages
 
 
+def session_check_fingerprints(index_dict, tdms_file):
+    """ Compare the fingerprints of a measurement to a session index
+    
+    The index dictionary is created from an entry in the index.txt
+    file. Returns `False` if one of the measurement files has a
+    fingerprint that is different from the one stored in the index
+    dictionary (see `shapeout.hashcache.fingerprint_file`). Missing
+    files and fingerprints are ignored.
+    """
+    fdir, name = os.path.split(tdms_file)
+    mx = os.path.join(fdir, name.split("_")[0])
+    files = {"tdms": tdms_file,
+             "camera.ini": mx+"_camera.ini",
+             "para.ini": mx+"_para.ini"}
+    for name in files:
+        key = name+" fingerprint"
+        if key in index_dict and os.path.exists(files[name]):
+            if fingerprint_file(files[name]) != index_dict[key]:
+                return False
+    return True
+
+
 def session_get_tdms_file(index_dict,
                           search_path="./",
                           errors="ignore"):
@@ -0,0 +1,442 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" ShapeOut - batch filtering of measurements
+
+Apply a filter configuration to many measurements and compute
+statistics. This module does not depend on wx. It is used by the
+batch filtering dialog and can be run from the command line:
+
+    python -m shapeout.batch -c config.txt -o statistics.tsv folder
+
+"""
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+import codecs
+import copy
+import gc
+import json
+import multiprocessing as mp
+import os
+import sys
+import threading
+
+import dclab
+from dclab import config as dc_config
+from dclab import GetProjectNameFromPath, GetTDMSFiles
+from dclab.polygon_filter import PolygonFilter
+
+from .resultcache import ResultCache, canonical_settings
+from .rtdc_dataset import RTDC_DataSet
+
+
+def process_measurement(tdms_file, filter_config, axes=None, columns=None,
+                        hash_cache=None):
+    """ Filter one measurement and compute its statistics
+
+    Parameters
+    ----------
+    tdms_file : str
+        Path to the tdms file.
+    filter_config : dict
+        Configuration that is applied to the measurement (see
+        `RTDC_DataSet.UpdateConfiguration`).
+    axes, columns : list of str or None
+        Axes and statistical parameters (see
+        `dclab.statistics.get_statistics`).
+    hash_cache : str or None
+        Path to a hash cache database (see
+        `shapeout.hashcache.HashCache`).
+
+    Returns
+    -------
+    head : list of str
+        The column names.
+    row : list
+        The tdms file, the title, and the statistics.
+    """
+    mm = RTDC_DataSet(tdms_file, lazy=True, hash_cache=hash_cache)
+    # `UpdateConfiguration` modifies the given configuration
+    mm.UpdateConfiguration(copy.deepcopy(filter_config))
+    mm.ApplyFilter()
+    head, values = dclab.statistics.get_statistics(rtdc_ds=mm,
+                                                   columns=columns,
+                                                   axes=axes)
+    return (["TDMS file", "Title"] + head,
+            [mm.tdms_filename, mm.title] + values)
+
+
+def measurement_title(tdms_file):
+    """ The title of a measurement (see `RTDC_DataSet.title`) """
+    name = os.path.split(tdms_file)[1].split(".tdms")[0]
+    return u"{} - {}".format(GetProjectNameFromPath(tdms_file),
+                             name.split("_")[0])
+
+
+def _process_measurement(args):
+    """ Helper for `batch_statistics` (must be picklable) """
+    ii, tdms_file, polygons, kwargs, cache = args
+    if cache is not None:
+        result_cache = ResultCache(cache[0])
+        key = result_cache.GetKey(tdms_file, cache[1])
+        result = result_cache.Get(key)
+        if result is not None:
+            # The title depends on the location of the measurement,
+            # only the statistics are cached.
+            head, row = result
+            return (ii, ["TDMS file", "Title"] + head,
+                    [tdms_file, measurement_title(tdms_file)] + row, True)
+    # Polygon filters are referenced by their id in the filter
+    # configuration and have to be created in worker processes.
+    for axes, points, name, unique_id in polygons:
+        if not PolygonFilter.instace_exists(unique_id):
+            PolygonFilter(axes=axes, points=points, name=name,
+                          unique_id=unique_id)
+    head, row = process_measurement(tdms_file, **kwargs)
+    # release the memory of the measurement before the next one
+    # is loaded
+    gc.collect()
+    if cache is not None:
+        result_cache.Set(key, head[2:], row[2:])
+    return ii, head, row, False
+
+
+def batch_statistics(tdms_files, filter_config, axes=None, columns=None,
+                     workers=0, callback=None, abort=None, hash_cache=None,
+                     max_in_flight=None, result_cache=None):
+    """ Compute the statistics of several measurements
+
+    Each measurement is loaded, filtered, summarized, and released
+    in a separate worker process (see `process_measurement`). Only
+    the rows of the measurements are kept, such that the memory
+    usage does not depend on the number of measurements.
+
+    Parameters
+    ----------
+    tdms_files : list of str
+        Paths to the tdms files.
+    filter_config, axes, columns, hash_cache :
+        See `process_measurement`.
+    workers : int
+        Number of worker processes. If set to 1, the measurements
+        are processed sequentially. If set to 0, one worker per CPU
+        is used.
+    callback : callable or None
+        Called with the arguments `(done, total, tdms_file)` each
+        time a measurement has been processed.
+    abort : threading.Event or None
+        If set, no further results are produced and the worker
+        processes are terminated.
+    max_in_flight : int or None
+        Maximum number of measurements that are being processed
+        or whose rows have not yet been consumed. If set to None,
+        this is the number of workers. Measurements are only passed
+        to the workers if the consumer keeps up.
+    result_cache : str or None
+        Path to a result cache database (see
+        `shapeout.resultcache.ResultCache`). Measurements whose
+        files and settings did not change are not processed again.
+
+    Yields
+    ------
+    index, head, row, cached :
+        The index of the measurement in `tdms_files`, the result
+        of `process_measurement`, and whether the result was taken
+        from `result_cache`, in the order in which the workers
+        finish.
+    """
+    total = len(tdms_files)
+    if workers == 0:
+        workers = mp.cpu_count()
+    workers = min(workers, total)
+    polygons = [ (p.axes, p.points, p.name, p.unique_id)
+                 for p in PolygonFilter.instances ]
+    kwargs = {"filter_config": filter_config,
+              "axes": axes,
+              "columns": columns,
+              "hash_cache": hash_cache}
+    if result_cache is None:
+        cache = None
+    else:
+        cache = (result_cache, canonical_settings(filter_config, axes,
+                                                  columns))
+    if max_in_flight is None:
+        max_in_flight = max(workers, 1)
+    # The pool takes the arguments from this generator. A slot is
+    # released each time a row has been consumed.
+    slots = threading.Semaphore(max_in_flight)
+    stop = threading.Event()
+    def args():
+        for ii, f in enumerate(tdms_files):
+            slots.acquire()
+            if stop.is_set():
+                return
+            yield ii, f, polygons, kwargs, cache
+
+    if workers <= 1:
+        pool = None
+        results = ( _process_measurement(a) for a in args() )
+    else:
+        pool = mp.Pool(processes=workers)
+        results = _iter_results(pool.imap_unordered(_process_measurement,
+                                                    args()), abort)
+    try:
+        for done, (ii, head, row, cached) in enumerate(results):
+            if abort is not None and abort.is_set():
+                break
+            if callback is not None:
+                callback(done+1, total, tdms_files[ii])
+            yield ii, head, row, cached
+            slots.release()
+    finally:
+        # unblock the generator of arguments
+        stop.set()
+        for _ii in range(max_in_flight):
+            slots.release()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def _iter_results(results, abort, interval=.2):
+    """ Iterate over the results of a pool until `abort` is set """
+    while True:
+        try:
+            yield results.next(timeout=interval)
+        except mp.TimeoutError:
+            if abort is not None and abort.is_set():
+                return
+        except StopIteration:
+            return
+
+
+def batch_filter(tdms_files, out_tsv_file, filter_config, axes=None,
+                 columns=None, workers=0, callback=None, abort=None,
+                 hash_cache=None, max_in_flight=None, result_cache=None,
+                 resume=True):
+    """ Compute the statistics of several measurements and save them
+
+    The rows are appended to a journal file (`out_tsv_file` with
+    the extension ".journal") as soon as they are computed (see
+    `batch_statistics` for the parameters). Only one row is kept in
+    memory at a time. When all measurements have been processed,
+    `out_tsv_file` is created from the journal in one step and the
+    journal is removed.
+
+    If the job was interrupted (or `abort` was set), running it
+    again with the same settings only processes the measurements
+    that are not in the journal. Set `resume` to False to start
+    from scratch.
+
+    Returns
+    -------
+    report : dict
+        The number of rows ("rows", less than the number of
+        measurements if `abort` was set), how many of them were
+        taken from the journal ("resumed"), from the result cache
+        ("cache hits"), or computed ("cache misses"), and whether
+        `out_tsv_file` was written ("complete").
+    """
+    journal_file = out_tsv_file + ".journal"
+    settings = canonical_settings(filter_config, axes, columns)
+    paths = [ os.path.abspath(f) for f in tdms_files ]
+    done = set()
+    if resume:
+        for path, _head, _row in read_journal(journal_file, settings):
+            done.add(path)
+    done &= set(paths)
+    todo = [ f for f, path in zip(tdms_files, paths) if not path in done ]
+    report = {"rows": len(done), "resumed": len(done), "cache hits": 0,
+              "cache misses": 0, "complete": False}
+
+    if done:
+        mode = "a"
+    else:
+        mode = "w"
+    with codecs.open(journal_file, mode, encoding="utf-8") as fd:
+        if mode == "w":
+            _write_journal_line(fd, {"settings": settings})
+        elif not _ends_with_newline(journal_file):
+            # incomplete last line of an interrupted job
+            fd.write("\n")
+        if callback is not None:
+            total = len(tdms_files)
+            def journal_callback(ndone, _total, tdms_file):
+                callback(len(done)+ndone, total, tdms_file)
+        else:
+            journal_callback = None
+        for ii, head, row, cached in batch_statistics(todo, filter_config,
+                                            axes=axes, columns=columns,
+                                            workers=workers,
+                                            callback=journal_callback,
+                                            abort=abort,
+                                            hash_cache=hash_cache,
+                                            max_in_flight=max_in_flight,
+                                            result_cache=result_cache):
+            row = row[:2] + [ float(v) for v in row[2:] ]
+            _write_journal_line(fd, {"path": os.path.abspath(todo[ii]),
+                                     "head": head,
+                                     "row": row})
+            report["rows"] += 1
+            if cached:
+                report["cache hits"] += 1
+            else:
+                report["cache misses"] += 1
+
+    if report["rows"] == len(tdms_files):
+        _assemble_tsv(journal_file, settings, set(paths), out_tsv_file)
+        os.remove(journal_file)
+        report["complete"] = True
+    return report
+
+
+def read_journal(journal_file, settings):
+    """ The rows in the journal of a batch job
+
+    Parameters
+    ----------
+    journal_file : str
+        Path to the journal (see `batch_filter`).
+    settings : str
+        The settings of the batch job (see
+        `shapeout.resultcache.canonical_settings`). If the journal
+        was written with different settings, it is ignored.
+
+    Yields
+    ------
+    path, head, row :
+        The absolute path to the tdms file and the results (see
+        `process_measurement`). Incomplete lines (e.g. when the job
+        was interrupted while writing) are skipped.
+    """
+    if not os.path.exists(journal_file):
+        return
+    with codecs.open(journal_file, "r", encoding="utf-8") as fd:
+        for ii, line in enumerate(fd):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if ii == 0:
+                if entry.get("settings") != settings:
+                    return
+            elif "path" in entry:
+                yield entry["path"], entry["head"], entry["row"]
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as fd:
+        fd.seek(-1, os.SEEK_END)
+        return fd.read(1) == b"\n"
+
+
+def _write_journal_line(fd, entry):
+    fd.write(json.dumps(entry)+"\n")
+    # make sure the entry is on disk before the next measurement
+    fd.flush()
+    os.fsync(fd.fileno())
+
+
+def _assemble_tsv(journal_file, settings, paths, out_tsv_file):
+    """ Write the rows of the journal to `out_tsv_file` atomically """
+    tmp_file = out_tsv_file + ".tmp"
+    head = None
+    written = set()
+    with codecs.open(tmp_file, "w", encoding="utf-8") as fd:
+        for path, h, row in read_journal(journal_file, settings):
+            if not path in paths or path in written:
+                continue
+            if head is None:
+                head = h
+                fd.write("# "+"\t".join(head)+"\n")
+            elif h != head:
+                raise ValueError("Problem with available columns/axes!")
+            fd.write(format_row(row)+"\n")
+            written.add(path)
+        fd.flush()
+        os.fsync(fd.fileno())
+    try:
+        os.rename(tmp_file, out_tsv_file)
+    except OSError:
+        # Windows does not replace existing files
+        os.remove(out_tsv_file)
+        os.rename(tmp_file, out_tsv_file)
+
+
+def format_row(row):
+    """ A row of `process_measurement` as a line of a tsv file """
+    fmt = ["{:s}"]*2 + ["{:.10e}"]*(len(row)-2)
+    return "\t".join(fmt).format(*row)
+
+
+def get_tdms_files(paths):
+    """ The tdms files in `paths` (files and directories) """
+    tdms_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            tdms_files += GetTDMSFiles(path)
+        else:
+            tdms_files.append(path)
+    return tdms_files
+
+
+def main(args=None):
+    """ Command line interface (see `python -m shapeout.batch -h`) """
+    parser = argparse.ArgumentParser(
+        description="Apply a filter configuration to RT-DC measurements "
+                    "and save their statistics.")
+    parser.add_argument("paths", nargs="+",
+                        help="tdms files or folders containing measurements")
+    parser.add_argument("-c", "--config", required=True,
+                        help="configuration file with the filter settings, "
+                             "e.g. a 'config.txt' from a session")
+    parser.add_argument("-o", "--output", required=True,
+                        help="output tsv file")
+    parser.add_argument("-p", "--polygons",
+                        help="polygon filter file (.poly)")
+    parser.add_argument("-a", "--axes",
+                        help="comma-separated axes (default: all), "
+                             "e.g. 'Area,Defo'")
+    parser.add_argument("-s", "--statistics",
+                        help="comma-separated statistical parameters "
+                             "(default: all), e.g. 'Mean,SD'")
+    parser.add_argument("-w", "--workers", type=int, default=0,
+                        help="number of worker processes (default: one "
+                             "per CPU)")
+    parser.add_argument("--cache",
+                        help="result cache database; measurements whose "
+                             "files and settings did not change are not "
+                             "processed again")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore the journal of an interrupted run")
+    parser.add_argument("-m", "--max-in-flight", type=int,
+                        help="maximum number of measurements processed at "
+                             "a time (default: number of workers)")
+    args = parser.parse_args(args)
+
+    filter_config = dc_config.load_config_file(args.config)
+    if args.polygons:
+        PolygonFilter.import_all(args.polygons)
+    axes = args.axes.split(",") if args.axes else None
+    columns = args.statistics.split(",") if args.statistics else None
+    tdms_files = get_tdms_files(args.paths)
+
+    def callback(done, total, tdms_file):
+        print("{}/{}: {}".format(done, total, tdms_file))
+
+    report = batch_filter(tdms_files, args.output, filter_config, axes=axes,
+                          columns=columns, workers=args.workers,
+                          callback=callback, hash_cache=args.cache,
+                          max_in_flight=args.max_in_flight,
+                          result_cache=args.cache,
+                          resume=not args.restart)
+    if report["resumed"]:
+        print("Resumed {} measurement(s) from the journal".format(
+                                                        report["resumed"]))
+    if args.cache:
+        print("Cache hits: {}, misses: {}".format(report["cache hits"],
+                                                  report["cache misses"]))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" ShapeOut - persistent catalog of measurements
+
+The catalog is an SQLite database that stores the metadata of
+measurements (event count, region, flow rate) together with
+the size and the modification time of the measurement files. The
+metadata of a measurement are only determined again if one of its
+files changed.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import os
+import sqlite3
+
+from dclab import GetTDMSFiles
+from . import tlabwrap
+from .hashcache import HashCache
+
+
+# Increment this if the table layout changes
+CATALOG_VERSION = 2
+
+
+class MeasurementCatalog(object):
+    def __init__(self, path):
+        """ Persistent catalog of measurements
+
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite database file. The file is created
+            if it does not exist.
+        """
+        self.path = path
+        self._init_database()
+
+
+    def _connect(self):
+        # A new connection is used for every transaction, such that
+        # the catalog can be used from several threads and processes.
+        return sqlite3.connect(self.path, timeout=30)
+
+
+    def _init_database(self):
+        conn = self._connect()
+        try:
+            with conn:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version != CATALOG_VERSION:
+                    conn.execute("DROP TABLE IF EXISTS measurements")
+                conn.execute("""CREATE TABLE IF NOT EXISTS measurements (
+                                    path TEXT PRIMARY KEY,
+                                    stamp TEXT,
+                                    valid INTEGER,
+                                    events INTEGER,
+                                    region TEXT,
+                                    flow_rate REAL)""")
+                conn.execute("PRAGMA user_version = {}".format(
+                                                            CATALOG_VERSION))
+        finally:
+            conn.close()
+
+
+    def _get_row(self, conn, path):
+        return conn.execute("SELECT stamp, valid, events, region, "
+                            "flow_rate FROM measurements "
+                            "WHERE path=?", (path,)).fetchone()
+
+
+    def GetHash(self, path):
+        """ The sha256 hash of a tdms file
+
+        The hashes are cached in the same database file (see
+        `shapeout.hashcache.HashCache`).
+        """
+        return HashCache(self.path).GetHash(path)
+
+
+    def GetInfo(self, path):
+        """ Metadata of a measurement
+
+        See `tlabwrap.GetMeasurementInfo`. The metadata are only read
+        from the measurement files if they changed since the last
+        call.
+        """
+        return self.Scan([path])[os.path.realpath(path)]
+
+
+    def Scan(self, tdms_files):
+        """ Get the metadata of several measurements
+
+        Parameters
+        ----------
+        tdms_files : list of str
+            Paths to tdms files.
+
+        Returns
+        -------
+        infos : dict
+            The metadata (see `tlabwrap.GetMeasurementInfo`) for each
+            (real) path in `tdms_files`.
+        """
+        infos = {}
+        conn = self._connect()
+        try:
+            with conn:
+                for path in tdms_files:
+                    path = os.path.realpath(path)
+                    stamp = file_stamp(path)
+                    row = self._get_row(conn, path)
+                    if row is not None and row[0] == stamp:
+                        if row[1]:
+                            infos[path] = {"events": row[2],
+                                           "region": row[3],
+                                           "flow rate": row[4]}
+                        else:
+                            infos[path] = None
+                    else:
+                        infos[path] = self._update(conn, path, stamp)
+        finally:
+            conn.close()
+        return infos
+
+
+    def ScanDirectory(self, directory):
+        """ Get the metadata of all measurements in a directory
+
+        Entries of files that have been removed from `directory`
+        are removed from the catalog.
+
+        Returns
+        -------
+        infos : dict
+            The metadata for each tdms file in `directory` (see
+            `tlabwrap.GetMeasurementInfo`).
+        """
+        directory = os.path.realpath(directory)
+        files = GetTDMSFiles(directory)
+        infos = self.Scan(files)
+        self.RemoveMissing(directory, infos.keys())
+        return infos
+
+
+    def RemoveMissing(self, directory, tdms_files):
+        """ Remove catalog entries of deleted measurements
+        
+        Parameters
+        ----------
+        directory : str
+            All catalog entries of tdms files in this directory
+            (recursively) that are not in `tdms_files` are removed.
+        tdms_files : list of str
+            Real paths to the tdms files that still exist in
+            `directory`.
+        """
+        directory = os.path.realpath(directory)
+        keep = set(tdms_files)
+        conn = self._connect()
+        try:
+            with conn:
+                prefix = os.path.join(directory, "")
+                rows = conn.execute("SELECT path FROM measurements WHERE "
+                                    "substr(path, 1, ?)=?",
+                                    (len(prefix), prefix)).fetchall()
+                for (path,) in rows:
+                    if not path in keep:
+                        conn.execute("DELETE FROM measurements WHERE path=?",
+                                     (path,))
+        finally:
+            conn.close()
+
+
+    def _update(self, conn, path, stamp):
+        info = tlabwrap.GetMeasurementInfo(path)
+        if info is None:
+            values = (path, stamp, 0, None, None, None)
+        else:
+            values = (path, stamp, 1, info["events"], info["region"],
+                      info["flow rate"])
+        conn.execute("INSERT OR REPLACE INTO measurements (path, stamp, "
+                     "valid, events, region, flow_rate) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", values)
+        return info
+
+
+
+def file_stamp(path):
+    """ Size and modification time of a measurement's files
+
+    The stamp changes if the tdms file or one of the ini files of
+    the measurement are modified.
+    """
+    fdir, name = os.path.split(path)
+    stem = os.path.join(fdir, name.split("_")[0])
+    stamp = []
+    for f in [path, stem+"_para.ini", stem+"_camera.ini"]:
+        try:
+            st = os.stat(f)
+        except OSError:
+            stamp.append("-")
+        else:
+            stamp.append("{}:{!r}".format(st.st_size, st.st_mtime))
+    return ";".join(stamp)
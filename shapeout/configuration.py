@@ -43,6 +43,15 @@ class ConfigurationFile(object):
         self.GetWorkingDirectory()
 
 
+    def GetCatalogPath(self):
+        """ Returns the path of the measurement catalog
+        
+        The catalog (see `shapeout.catalog`) is stored next to
+        the configuration file.
+        """
+        return join(dirname(self.cfgfile), "shapeout_catalog.sqlite")
+
+
     def GetWorkingDirectory(self, name="Main"):
         """ Returns the current working directory """
         wd = default = "./"
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" ShapeOut - in-memory cache of kernel density estimates
+
+Scatter and contour plots are redrawn whenever a filter is changed,
+also for measurements whose data and plotting parameters did not
+change. The densities are stored in a least-recently-used cache with
+a memory limit, such that they only have to be computed once.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import collections
+import threading
+
+
+#: Default memory limit of the density cache in bytes
+MAX_BYTES = 256 * 1024**2
+
+
+class DensityCache(object):
+    def __init__(self, max_bytes=MAX_BYTES):
+        """ Least-recently-used cache of kernel density estimates
+
+        Parameters
+        ----------
+        max_bytes : int
+            The total size of the cached arrays is limited to
+            `max_bytes`. The least recently used entries are removed
+            first.
+
+        Notes
+        -----
+        The values must be ndarrays, objects with an `nbytes`
+        attribute, or tuples thereof.
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def Clear(self):
+        """ Remove all entries """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+    def Get(self, key):
+        """ The cached value for `key` or None """
+        with self._lock:
+            if not key in self._entries:
+                return None
+            value, size = self._entries.pop(key)
+            self._entries[key] = value, size
+            return value
+
+
+    def Set(self, key, value):
+        """ Store `value` under `key`
+
+        Values that are larger than `self.max_bytes` are not stored.
+        """
+        size = value_nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            while self.nbytes + size > self.max_bytes:
+                _key, (_value, old) = self._entries.popitem(last=False)
+                self.nbytes -= old
+            self._entries[key] = value, size
+            self.nbytes += size
+
+
+
+def value_nbytes(value):
+    """ Memory used by the arrays of a cache entry """
+    if isinstance(value, tuple):
+        return sum([value_nbytes(v) for v in value])
+    return getattr(value, "nbytes", 0)
@@ -5,15 +5,15 @@
 """
 from __future__ import division, print_function
 
-import codecs
-import numpy as np
 import os
+import threading
 import wx
 from wx.lib.scrolledpanel import ScrolledPanel
 
 import dclab
-from .. import analysis
+from .. import batch
 from .. import tlabwrap
+from ..rtdc_dataset import axis_summary
 
 
 
@@ -130,7 +130,6 @@ class BatchFilterFolder(wx.Frame):
 
 
     def OnBatch(self, e=None):
-        wx.BeginBusyCursor()
         # Get selected axes
         axes = []
         for ch in self.axes_panel.GetChildren():
@@ -154,39 +153,79 @@ class BatchFilterFolder(wx.Frame):
             mhere = self.analysis.measurements[self.dropdown.GetSelection()] 
             f_config = mhere.Configuration
         
-        # Make analysis from tdms files
-        anal = analysis.Analysis(self.tdms_files)
-        # Apply configuration
-        [ mm.UpdateConfiguration(f_config) for mm in anal.measurements ]
-        # Apply filters
-        [ mm.ApplyFilter() for mm in anal.measurements ]
-        
-        # Compute statistics
-        head = None
-        rows = []
-        for mm in anal.measurements:
-            h, v = dclab.statistics.get_statistics(rtdc_ds=mm,
-                                                   columns=columns,
-                                                   axes=axes)
-            if head is None:
-                head = h
-            else:
-                assert h==head, "Problem with available columns/axes!"
-            
-            rows.append([mm.tdms_filename, mm.title]+v)
-        
-        head = ["TDMS file", "Title"] + head
-        
-        with codecs.open(self.out_tsv_file, "w", encoding="utf-8") as fd:
-            header = u"\t".join([ h for h in head ])
-            fd.write("# "+header+"\n")
-        
-        with open(self.out_tsv_file, "ab") as fd:
-            for row in rows:
-                fmt=["{:s}"]*2+["{:.10e}"]*len(v)
-                line="\t".join(fmt).format(*row)
-                fd.write(line+"\n")
-        wx.EndBusyCursor()
+        # The batch engine runs in a separate thread and computes the
+        # statistics in worker processes. The progress is polled with
+        # a timer.
+        self._batch_abort = threading.Event()
+        self._batch_state = {"done": 0,
+                             "total": len(self.tdms_files),
+                             "finished": False,
+                             "error": None,
+                             "report": None}
+        self._batch_dialog = wx.ProgressDialog(_("Batch filtering"),
+                 _("Processing measurements..."),
+                 maximum=len(self.tdms_files), parent=self,
+                 style=wx.PD_CAN_ABORT|wx.PD_APP_MODAL|wx.PD_ELAPSED_TIME|
+                       wx.PD_REMAINING_TIME)
+        kwargs = {"tdms_files": self.tdms_files,
+                  "out_tsv_file": self.out_tsv_file,
+                  "filter_config": f_config,
+                  "axes": axes,
+                  "columns": columns,
+                  "abort": self._batch_abort,
+                  "hash_cache": self.parent.config.GetCatalogPath(),
+                  "result_cache": self.parent.config.GetCatalogPath()}
+        thread = threading.Thread(target=self._RunBatch, kwargs=kwargs)
+        thread.daemon = True
+        thread.start()
+        self._batch_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnBatchTimer, self._batch_timer)
+        self._batch_timer.Start(200)
+
+
+    def _RunBatch(self, **kwargs):
+        """ Run the batch engine (called in a separate thread) """
+        state = self._batch_state
+        def callback(done, total, tdms_file):
+            state["done"] = done
+        try:
+            state["report"] = batch.batch_filter(callback=callback, **kwargs)
+        except Exception as exc:
+            state["error"] = exc
+        finally:
+            state["finished"] = True
+
+
+    def OnBatchTimer(self, e=None):
+        """ Display the progress of the batch engine """
+        state = self._batch_state
+        if state["finished"]:
+            self._batch_timer.Stop()
+            self._batch_dialog.Destroy()
+            if state["error"] is not None:
+                wx.MessageBox(_("Batch filtering failed: {}").format(
+                              state["error"]), _("Error"),
+                              wx.OK|wx.ICON_ERROR, self)
+            elif state["report"] is not None:
+                report = state["report"]
+                if report["complete"]:
+                    msg = _("Processed {} measurement(s), {} taken from "
+                            "the cache.").format(report["rows"],
+                                                 report["cache hits"])
+                else:
+                    msg = _("Batch filtering was cancelled after {} "
+                            "measurement(s). Start it again with the same "
+                            "settings to resume.").format(report["rows"])
+                wx.MessageBox(msg, _("Batch filtering"),
+                              wx.OK|wx.ICON_INFORMATION, self)
+        elif not self._batch_abort.is_set():
+            # do not close the dialog before the engine has finished
+            done = min(state["done"], state["total"]-1)
+            cont = self._batch_dialog.Update(done,
+                        _("Processed {} of {} measurements.").format(
+                        state["done"], state["total"]))[0]
+            if not cont:
+                self._batch_abort.set()
 
 
     def OnBrowse(self, e=None):
@@ -210,7 +249,8 @@ class BatchFilterFolder(wx.Frame):
             self.WXfold_text1.SetLabel(thepath)
             self.parent.config.SetWorkingDirectory(thepath, "BatchFD")
             # Search directory
-            tree, _cols = tlabwrap.GetTDMSTreeGUI(thepath)
+            tree, _cols = tlabwrap.GetTDMSTreeGUI(thepath,
+                                catalog=self.parent.config.GetCatalogPath())
             self.WXfold_text2.SetLabel(_("Found {} measurement(s).").
                                        format(len(tree)))
             self.tdms_files = [ t[1][1] for t in tree]
@@ -274,7 +314,7 @@ class BatchFilterFolder(wx.Frame):
             sel = self.dropdown.GetSelection()
             mm = self.analysis.measurements[sel]
             for c in dclab.dfn.rdv:
-                if np.sum(np.abs(getattr(mm, c))):
+                if axis_summary(mm, dclab.dfn.cfgmap[c])["present"]:
                     checks.append(dclab.dfn.cfgmap[c])
         else:
             for c in dclab.dfn.rdv:
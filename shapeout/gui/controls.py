@@ -20,6 +20,7 @@ from dclab import config as dc_config
 from ..configuration import ConfigurationFile
 from .. import tlabwrap
 from .. import util
+from .. import kde_methods
 from .. import lin_mix_mod
 
 from .polygonselect import LineDrawerWindow
@@ -463,6 +464,8 @@ class SubPanel(ScrolledPanel):
         ignore_axes = tlabwrap.IGNORE_AXES+analysis.GetUnusableAxes()
         choices = dc_config.get_config_entry_choices(key, item[0],
                                                      ignore_axes=ignore_axes)
+        if key == "Plotting" and item[0] == "KDE":
+            choices = kde_methods.KDE_TYPES
 
         if len(choices) != 0:
             if choices[0] in dclab.dfn.axlabels:
@@ -547,6 +550,8 @@ class SubPanelAnalysis(SubPanel):
             # axes dropdown
             self.axes = analysis.GetUsableAxes()
             axeslist = [dclab.dfn.axlabels[a] for a in self.axes]
+            # fit the model for all axes and adjust the p-Values
+            axeslist.append(_("All axes"))
             self.WXCB_axes = wx.ComboBox(self, -1, choices=axeslist,
                                     value=_("None"), name="None",
                                     style=wx.CB_DROPDOWN|wx.CB_READONLY)
@@ -600,34 +605,51 @@ class SubPanelAnalysis(SubPanel):
         """
         Perfrom LME4 computation
         """
-        # Get axis name
-        axname = self.axes[self.WXCB_axes.GetSelection()]
-        # Get axis property
-        axprop = dclab.dfn.cfgmaprev[axname]
+        # Get axis names
+        axid = self.WXCB_axes.GetSelection()
+        if axid == len(self.axes):
+            # The user selected _("All axes")
+            axnames = self.axes
+        else:
+            axnames = [self.axes[axid]]
         
         # loop through analysis
         treatment = []
         timeunit = []
-        xs = []
+        measurements = []
         
         for ii, mm in enumerate(self.analysis.measurements):
             # get treatment (ignore 0)
             if self.WXCB_treatment[ii].GetSelection() == 0:
                 # The user selected _("None")
                 continue
-            xs.append(getattr(mm, axprop)[mm._filter])
+            measurements.append(mm)
             treatment.append(self.WXCB_treatment[ii].GetValue())
             # get repetition
             timeunit.append(int(self.WXCB_repetition[ii].GetValue()))
-            
+        
+        features = []
+        for axname in axnames:
+            # Get axis property
+            axprop = dclab.dfn.cfgmaprev[axname]
+            xs = [getattr(mm, axprop)[mm._filter] for mm in measurements]
+            features.append((dclab.dfn.axlabels[axname], xs))
+        
         # run lme4
-        result = lin_mix_mod.linmixmod(xs=xs,
-                                       treatment=treatment,
-                                       timeunit=timeunit)
+        if len(features) == 1:
+            result = lin_mix_mod.linmixmod(xs=features[0][1],
+                                           treatment=treatment,
+                                           timeunit=timeunit)
+            text = result["Full Summary"]
+        else:
+            results = lin_mix_mod.linmixmod_batch(features=features,
+                                                  treatment=treatment,
+                                                  timeunit=timeunit)
+            text = lin_mix_mod.batch_summary(results)
         # display results
         # write to temporary file and display with webbrowser
         with tempfile.NamedTemporaryFile(mode="w", prefix="linmixmod_", suffix=".txt", delete=False) as fd:
-            fd.writelines(result["Full Summary"])
+            fd.writelines(text)
             
         webbrowser.open(fd.name)
     
@@ -35,6 +35,7 @@ class ExplorerPanel(ScrolledPanel):
         self.col_width = col_width
 
         self.treelist = []
+        self.measurement_info = dict()
         
         # Set up box
         box = wx.StaticBox(self, label=_("Measurement browser"))
@@ -138,6 +139,17 @@ class ExplorerPanel(ScrolledPanel):
         self.external_analyze(files)
 
 
+    def GetMeasurementInfo(self, tdms_file):
+        """ Metadata of a measurement in the tree
+        
+        See `tlabwrap.GetMeasurementInfo`.
+        """
+        if not tdms_file in self.measurement_info:
+            info = tlabwrap.GetMeasurementInfo(tdms_file)
+            self.measurement_info[tdms_file] = info
+        return self.measurement_info[tdms_file]
+
+
     def OnSelectAll(self, e=None):
         r = self.htreectrl.GetRootItem()
         for c in r.GetChildren():
@@ -149,9 +161,9 @@ class ExplorerPanel(ScrolledPanel):
         r = self.htreectrl.GetRootItem()
         for c in r.GetChildren():
             for k in c.GetChildren():
-                f = k.GetData()
-                if ( not tlabwrap.GetRegion(f).lower() == "reservoir"
-                     and frate == tlabwrap.GetFlowRate(f) ):
+                info = self.GetMeasurementInfo(k.GetData())
+                if ( not info["region"] == "reservoir"
+                     and frate == info["flow rate"] ):
 
                     self.htreectrl.CheckItem(k)
 
@@ -162,9 +174,9 @@ class ExplorerPanel(ScrolledPanel):
         r = self.htreectrl.GetRootItem()
         for c in r.GetChildren():
             for k in c.GetChildren():
-                f = k.GetData()
-                if ( not tlabwrap.GetRegion(f).lower() == "reservoir"
-                     and frate == tlabwrap.GetFlowRate(f) ):
+                info = self.GetMeasurementInfo(k.GetData())
+                if ( not info["region"] == "reservoir"
+                     and frate == info["flow rate"] ):
                     self.htreectrl.CheckItem(k)        
 
 
@@ -174,9 +186,9 @@ class ExplorerPanel(ScrolledPanel):
         r = self.htreectrl.GetRootItem()
         for c in r.GetChildren():
             for k in c.GetChildren():
-                f = k.GetData()
-                if ( not tlabwrap.GetRegion(f).lower() == "reservoir"
-                     and frate == tlabwrap.GetFlowRate(f) ):
+                info = self.GetMeasurementInfo(k.GetData())
+                if ( not info["region"] == "reservoir"
+                     and frate == info["flow rate"] ):
                     self.htreectrl.CheckItem(k)  
 
 
@@ -226,6 +238,12 @@ class ExplorerPanel(ScrolledPanel):
                         checked.append(f)
         
         self.treelist = treelist
+        # metadata of the measurements
+        self.measurement_info = dict()
+        for project in treelist:
+            for meas in project[1:]:
+                if len(meas) > 2:
+                    self.measurement_info[meas[1]] = meas[2]
 
         # enable or disable window
         if len(self.treelist) == 0:
@@ -281,8 +299,54 @@ class ExplorerPanel(ScrolledPanel):
 
 
     def SetProjectTreeAdd(self, data):
-        """ Convenience wrapper around SetProjectTree with True `add`"""
-        self.SetProjectTree(data, add=True)
+        """ Append measurements to the tree view
+
+        Unlike `SetProjectTree` with `add=True`, the tree is not
+        rebuilt and checked items are kept. Only new folders and
+        measurements are appended, which makes adding the partial
+        results of a running search cheap. The flow rate buttons are
+        updated by the next call of `SetProjectTree`.
+
+        Parameters
+        ----------
+        data : tuple (treelist, cols)
+            The return value of `tlabwrap.GetTDMSTreeGUI`.
+        """
+        treelist, cols = data
+        rroot = self.htreectrl.GetRootItem()
+        if rroot is None or len(self.treelist) == 0:
+            # empty tree or "No measurements found."
+            self.SetProjectTree(data, add=True)
+            return
+
+        roots = dict([ (c.GetData(), c) for c in rroot.GetChildren() ])
+        projects = dict([ (p[0][1], p) for p in self.treelist ])
+        for project in treelist:
+            path = project[0][1]
+            if path in projects:
+                tproject = projects[path]
+                root = roots[path]
+            else:
+                tproject = [project[0]]
+                self.treelist.append(tproject)
+                root = self.htreectrl.AppendItem(rroot, project[0][0],
+                                                 ct_type=1,
+                                                 data=path)
+            for meas in project[1:]:
+                if meas in tproject:
+                    continue
+                tproject.append(meas)
+                if len(meas) > 2:
+                    self.measurement_info[meas[1]] = meas[2]
+                self.htreectrl.AppendItem(root, meas[0],
+                                          ct_type=1,
+                                          data=meas[1])
+            self.htreectrl.Expand(root)
+
+        self.Enable()
+        self.btn_selall.Enable()
+        self.btn_selnon.Enable()
+        self.btn_add.Enable()
 
 
     def Update(self, e=None):
@@ -312,7 +376,7 @@ class ExplorerPanel(ScrolledPanel):
             for item in self.treelist:
                 # First tree item contains path to measurements
                 for meas in item[1:]:
-                    flr.append(tlabwrap.GetFlowRate(meas[1]))
+                    flr.append(self.GetMeasurementInfo(meas[1])["flow rate"])
             flr = np.unique(flr)
             flr.sort()
 
@@ -12,6 +12,7 @@ import wx
 
 import dclab
 from .. import tlabwrap
+from ..rtdc_dataset import axis_summary
 
 
 class ExportAnalysisEventsTSV(wx.Frame):
@@ -41,7 +42,7 @@ class ExportAnalysisEventsTSV(wx.Frame):
         # find out which are actually used in the analysis
         for c in dclab.dfn.rdv:
             for m in self.analysis.measurements:
-                if np.sum(np.abs(getattr(m, c))):
+                if axis_summary(m, dclab.dfn.cfgmap[c])["present"]:
                     checks.append(dclab.dfn.cfgmap[c])
         checks = list(set(checks))
         checks.sort()
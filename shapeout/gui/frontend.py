@@ -18,14 +18,13 @@ import traceback
 import wx
 import zipfile
 
-import dclab
-
 from ..configuration import ConfigurationFile
 from ..util import findfile
 from .controls import ControlPanel
 from .explorer import ExplorerPanel
 import gaugeframe
 from .. import analysis
+from ..rtdc_dataset import RTDC_DataSet
 from .. import tlabwrap
 from . import update
 from . import plot_main
@@ -113,7 +112,7 @@ class Frame(gaugeframe.GaugeFrame):
         # Fake analysis
         ddict = {"Area" : np.arange(10)*30,
                  "Defo" : np.arange(10)*.02}
-        rtdc_ds = dclab.RTDC_DataSet(ddict=ddict)
+        rtdc_ds = RTDC_DataSet(ddict=ddict)
         rtdc_ds.Configuration["Plotting"]["Contour Color"] = "white"
         self.NewAnalysis([rtdc_ds])
 
@@ -269,7 +268,17 @@ class Frame(gaugeframe.GaugeFrame):
     def NewAnalysis(self, data, search_path="./"):
         """ Create new analysis object and show data """
         wx.BeginBusyCursor()
-        anal = analysis.Analysis(data, search_path=search_path)
+        def progress(loaded, total, tdms_file):
+            msg = _("Loaded {}").format(os.path.basename(tdms_file))
+            self.GaugeProgress(loaded, total, msg=msg)
+        # load measurements in parallel (one process per CPU);
+        # data columns are only read when they are needed and
+        # box filters use sorted indices of the data columns;
+        # file hashes are cached in the measurement catalog
+        anal = analysis.Analysis(data, search_path=search_path,
+                                 workers=0, callback=progress,
+                                 lazy=True, sort_index=True,
+                                 hash_cache=self.config.GetCatalogPath())
         # Get Plotting and Filtering parameters from previous analysis
         if hasattr(self, "analysis"):
             fpar = self.analysis.GetParameters("Filtering")
@@ -473,7 +482,6 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
             # There are missing tdms files. We need to modify the extracted
             # index file with a folder.
             missing = messages["missing tdms"]
-            directories = [] # search directories
             updict = {}      # new dicts for individual measurements
             # Ask user for directory
             miss = os.path.basename(missing[0][1])
@@ -503,23 +511,36 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
             if mod != wx.ID_OK:
                 break
 
-            # Add search directory            
-            directories.insert(0, path)
-            
-            # Try to find all measurements with that directory (also relative)
+            # Find all measurements with that directory. The directory
+            # is walked only once and the candidates are hashed in
+            # parallel.
             wx.BeginBusyCursor()
-            remlist = []
-            for m in missing:
-                key, tdms, thash = m
-                newfile = tlabwrap.search_hashed_tdms(tdms, thash, directories)
+            hash_cache = self.config.GetCatalogPath()
+            found = tlabwrap.relocate_tdms_files([ m[1:] for m in missing ],
+                                                 [path],
+                                                 hash_cache=hash_cache)
+            # Measurements that were moved together are usually
+            # close to each other. Search the directory two levels
+            # above the found measurements for the remaining ones.
+            remaining = [ m for m, f in zip(missing, found) if f is None ]
+            directories = []
+            for newfile in found:
                 if newfile is not None:
                     newdir = os.path.dirname(newfile)
-                    updict[key] = {"fdir": newdir}
-                    directories.insert(0, os.path.dirname(newdir))
-                    directories.insert(0, os.path.dirname(os.path.dirname(newdir)))
-                    remlist.append(m)
-            for m in remlist:
-                missing.remove(m)
+                    newdir = os.path.dirname(os.path.dirname(newdir))
+                    if not newdir in directories:
+                        directories.append(newdir)
+            if remaining and directories:
+                refound = tlabwrap.relocate_tdms_files(
+                                                [ m[1:] for m in remaining ],
+                                                directories,
+                                                hash_cache=hash_cache)
+                for m, newfile in zip(remaining, refound):
+                    found[missing.index(m)] = newfile
+            for m, newfile in zip(list(missing), found):
+                if newfile is not None:
+                    updict[m[0]] = {"fdir": os.path.dirname(newfile)}
+                    missing.remove(m)
             wx.EndBusyCursor()
 
             # Update the extracted index file.
@@ -554,12 +575,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
             path = dlg.GetPath()
             self.config.SetWorkingDirectory(path, name="Main")
             dlg.Destroy()
-            self.GaugeIndefiniteStart(
-                                func=tlabwrap.GetTDMSTreeGUI,
-                                func_args=(path,),
-                                post_call=self.PanelLeft.SetProjectTree,
-                                msg=_("Searching for .tdms files")
-                                     )
+            self.SearchProjectTree(path, add=False)
 
 
     def OnMenuSearchPathAdd(self, e=None, add=True, path=None,
@@ -574,15 +590,41 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
             dlg.Destroy()
             if answer != wx.ID_OK:
                 return
-            
+        
+        self.SearchProjectTree(path, add=add, marked=marked)
+
+
+    def SearchProjectTree(self, path, add=True, marked=[]):
+        """ Search `path` for measurements in the background
+        
+        Folders are appended to `PanelLeft` while the search is still
+        running (see `SetProjectTreeAdd`), such that the user can start
+        selecting measurements. When the search is finished,
+        `PanelLeft.SetProjectTree` is called once with all
+        measurements found.
+        """
+        state = {"add": add}
+        def add_folders(data):
+            # called from the search thread
+            if state["add"]:
+                wx.CallAfter(self.PanelLeft.SetProjectTreeAdd, data)
+            else:
+                # replace the current tree with the first folder
+                wx.CallAfter(self.PanelLeft.SetProjectTree, data,
+                             add=False, marked=marked)
+            state["add"] = True
+
         self.GaugeIndefiniteStart(
                         func=tlabwrap.GetTDMSTreeGUI,
-                        func_args=(path,),
+                        func_args=(path, self.config.GetCatalogPath(),
+                                   add_folders),
                         post_call=self.PanelLeft.SetProjectTree,
                         post_call_kwargs = {"add":add, "marked":marked},
-                        msg=_("Searching for .tdms files")
+                        msg=_("Searching for .tdms files"),
+                        in_thread=True
                                  )
 
+
     def OnMenuQuit(self, e=None):
         if hasattr(self, "analysis") and self.analysis is not None:
             # Ask to save the session
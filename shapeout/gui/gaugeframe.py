@@ -52,7 +52,8 @@ class ResultEvent(wx.PyEvent):
 class WorkerThread(td.Thread):
     """Worker Thread Class."""
     def __init__(self, notify_window, longfunction, func_args,
-                 post_call, post_call_kwargs, worker_id=8472, msg=""):
+                 post_call, post_call_kwargs, worker_id=8472, msg="",
+                 in_thread=False):
         """Init Worker Thread Class."""
         td.Thread.__init__(self)
         self._notify_window = notify_window
@@ -62,6 +63,9 @@ class WorkerThread(td.Thread):
         self._post_call_kwargs = post_call_kwargs
         self._worker_id = worker_id
         self._msg=msg
+        self._in_thread = in_thread
+        self._abort_event = td.Event()
+        self.daemon = in_thread
         # This starts the thread running on creation, but you could
         # also make the GUI thread responsible for calling this
         self.start()
@@ -73,6 +77,17 @@ class WorkerThread(td.Thread):
         # a long process (well, 10s here) as a simple loop - you will
         # need to structure your processing so that you periodically
         # peek at the abort variable
+        if self._in_thread:
+            res = self._longfunction(*self._func_args,
+                                     abort=self._abort_event)
+            if not self._abort_event.is_set():
+                wx.PostEvent(self._notify_window,
+                             ResultEvent((self._post_call,
+                                          self._post_call_kwargs,
+                                          res,
+                                          self._worker_id)))
+            return
+
         self.pool = mp.Pool(processes = 1)
         result = self.pool.apply_async(self._longfunction, self._func_args)
 
@@ -107,7 +122,9 @@ class WorkerThread(td.Thread):
     def abort(self):
         """abort worker thread."""
         # Method for use by main thread to signal an abort
-        self.pool.terminate()
+        self._abort_event.set()
+        if not self._in_thread:
+            self.pool.terminate()
 
 
 
@@ -161,7 +178,7 @@ class GaugeFrame(wx.Frame):
     def GaugeIndefiniteStart(self, event=None, func=dummywait,
                              func_args=(), post_call=None, 
                              post_call_kwargs = {},
-                             msg="", worker_id=8472):
+                             msg="", worker_id=8472, in_thread=False):
         """Start a long running function (worker)
         
         Parameters
@@ -186,6 +203,12 @@ class GaugeFrame(wx.Frame):
             worker can be run at a time. Subsequent calls with the same
             `worker_id` to `GaugeIndefiniteStart` will kill the spawned
             worker and start a new one.
+        in_thread : bool
+            Run `func` in a thread of this process instead of a
+            separate process. This allows `func` to communicate with
+            the GUI (e.g. via `wx.CallAfter`). `func` is called with
+            the additional keyword argument `abort`, a
+            `threading.Event` that is set when the worker is stopped.
         
         
         Returns
@@ -218,7 +241,8 @@ class GaugeFrame(wx.Frame):
                                                post_call=post_call,
                                                post_call_kwargs=post_call_kwargs,
                                                worker_id=worker_id,
-                                               msg=msg
+                                               msg=msg,
+                                               in_thread=in_thread
                                               )
 
 
@@ -253,6 +277,35 @@ class GaugeFrame(wx.Frame):
             self.Unbind(wx.EVT_TIMER)
 
 
+    def GaugeProgress(self, value, maximum, msg=""):
+        """ Display the progress of a task that runs in the main thread
+        
+        Parameters
+        ----------
+        value : int
+            Number of steps that have been completed.
+        maximum : int
+            Total number of steps.
+        msg : str
+            A message displayed in the statusbar of the gauge frame.
+        
+        
+        Notes
+        -----
+        This method yields to the event loop, such that the gauge
+        is redrawn. The gauge is hidden when `value` equals `maximum`
+        and no other workers are running.
+        """
+        self.gauge.Show()
+        self.gauge.SetRange(maximum)
+        self.gauge.SetValue(value)
+        self.statusbar.SetStatusText(msg, 0)
+        wx.SafeYield(None, True)
+        if value >= maximum and len(self.workers) == 0:
+            self.gauge.Hide()
+            self.statusbar.SetStatusText("", 0)
+
+
     def _OnResult(self, event):
         """Show Result status."""
         func = event.data[0]
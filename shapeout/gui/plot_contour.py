@@ -11,6 +11,7 @@ import chaco.tools.api as cta
 from dclab import *  # @UnusedWildImport
 
 from . import misc
+from ..rtdc_dataset import compute_contours
 from ..tlabwrap import isoelastics
 
 
@@ -124,7 +125,13 @@ def contour_plot(measurements, levels=[0.5,0.95],
     return contour_plot
 
 
-def set_contour_data(plot, measurements, levels=[0.5,0.95]):
+def set_contour_data(plot, measurements, levels=[0.5,0.95], accuracy=1):
+    """ Compute the contours and add them to the plot
+
+    The densities are only evaluated in detail where the contour
+    lines are (see `rtdc_dataset.compute_contours`). `accuracy` is
+    a factor for the "Contour Accuracy" settings.
+    """
     pd = plot.data
     # Plotting area
     m0 = measurements[0]
@@ -148,12 +155,18 @@ def set_contour_data(plot, measurements, levels=[0.5,0.95]):
         circmax = getattr(m0, dfn.cfgmaprev[yax]).max()
 
 
+    # Compute the densities of all measurements in parallel (one
+    # process per CPU, the pool is reused on every filter change),
+    # the contours are plotted in this thread.
+    contours = compute_contours(measurements, yax=yax, xax=xax, workers=0,
+                                levels=levels, accuracy=accuracy)
+
     for ii, mm in enumerate(measurements):
         cname = "con_{}_{}_{}".format(mm.name, mm.identifier, ii)
         if cname in plot.plots:
             plot.delplot(cname)
 
-        (X,Y,density) = mm.GetKDE_Contour(yax=yax, xax=xax)
+        (X,Y,density) = contours[ii]
         pd.set_data(cname, density)
   
         plev = [np.max(density)*i for i in levels]
@@ -12,6 +12,12 @@ import os
 import warnings
 import wx
 
+from . import plot_contour
+
+
+# Factor for the contour accuracy of exported plots
+EXPORT_CONTOUR_ACCURACY = .25
+
 
 def export_plot_pdf(parent):
     dlg = wx.FileDialog(parent, _("Export plot as PDF"), 
@@ -70,6 +76,14 @@ def export_plot_pdf(parent):
                     comp.marker_size /= 2
         
         
+        # Finer contour lines
+        contour_plots = [ p for p in container.plot_components
+                          if p.id == "ShapeOut_contour_plot" ]
+        for aplot in contour_plots:
+            plot_contour.set_contour_data(aplot,
+                                          parent.analysis.measurements,
+                                          accuracy=EXPORT_CONTOUR_ACCURACY)
+
         dest_box = (.01, .01, -.01, -.01)
         try:
             gc = PdfPlotGraphicsContext(filename=path,
@@ -89,6 +103,10 @@ def export_plot_pdf(parent):
         container.set_outer_bounds(0, bx)
         container.set_outer_bounds(1, by)
 
+        for aplot in contour_plots:
+            plot_contour.set_contour_data(aplot,
+                                          parent.analysis.measurements)
+
         for c in container.components:
             for comp in c.components:
                 if isinstance(comp, class_sp):
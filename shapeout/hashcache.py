@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" ShapeOut - persistent cache of file hashes
+
+Computing the sha256 hash of a measurement requires reading the
+entire tdms file. The hashes are stored in an SQLite database
+together with the size and the modification time of each file and
+are only computed again if one of them changed.
+
+The fingerprint of a file (see `fingerprint_file`) is computed
+from its size and its first and last block. It can be used to
+quickly rule out that a file has a certain hash, without reading
+the entire file.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import hashlib
+import os
+import sqlite3
+
+from dclab.rtdc_dataset import hashfile
+
+
+# Increment this if the table layout changes
+HASHCACHE_VERSION = 1
+
+
+class HashCache(object):
+    def __init__(self, path):
+        """ Persistent cache of file hashes
+
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite database file. The file is created
+            if it does not exist. The same file can be used for a
+            `shapeout.catalog.MeasurementCatalog`.
+        """
+        self.path = path
+        self._init_database()
+
+
+    def _connect(self):
+        # A new connection is used for every transaction, such that
+        # the cache can be used from several threads and processes.
+        return sqlite3.connect(self.path, timeout=30)
+
+
+    def _init_database(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("""CREATE TABLE IF NOT EXISTS hash_version (
+                                    version INTEGER)""")
+                row = conn.execute("SELECT version FROM hash_version"
+                                   ).fetchone()
+                if row is None or row[0] != HASHCACHE_VERSION:
+                    conn.execute("DROP TABLE IF EXISTS hashes")
+                    conn.execute("DELETE FROM hash_version")
+                    conn.execute("INSERT INTO hash_version VALUES (?)",
+                                 (HASHCACHE_VERSION,))
+                conn.execute("""CREATE TABLE IF NOT EXISTS hashes (
+                                    path TEXT PRIMARY KEY,
+                                    size INTEGER,
+                                    mtime REAL,
+                                    fingerprint TEXT,
+                                    hash TEXT)""")
+        finally:
+            conn.close()
+
+
+    def _get(self, path, column, compute):
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT size, mtime, fingerprint, hash "
+                               "FROM hashes WHERE path=?",
+                               (path,)).fetchone()
+            if row is not None and (row[0], row[1]) == (st.st_size,
+                                                        st.st_mtime):
+                values = {"fingerprint": row[2], "hash": row[3]}
+            else:
+                # new or modified file
+                values = {"fingerprint": None, "hash": None}
+            if values[column] is None:
+                values[column] = compute(path)
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO hashes (path, size, "
+                                 "mtime, fingerprint, hash) "
+                                 "VALUES (?, ?, ?, ?, ?)",
+                                 (path, st.st_size, st.st_mtime,
+                                  values["fingerprint"], values["hash"]))
+            return values[column]
+        finally:
+            conn.close()
+
+
+    def GetFingerprint(self, path):
+        """ The fingerprint of a file (see `fingerprint_file`) """
+        return self._get(path, "fingerprint", fingerprint_file)
+
+
+    def GetHash(self, path):
+        """ The sha256 hash of a file
+
+        The hash is only computed if the file is not in the cache
+        or if its size or modification time changed.
+        """
+        return self._get(path, "hash", hashfile)
+
+
+    def VerifyHash(self, path, thash, fingerprint=None):
+        """ Check whether a file has the hash `thash`
+
+        Parameters
+        ----------
+        path : str
+            Path to the file.
+        thash : str
+            The sha256 hash of the file (see `GetHash`).
+        fingerprint : str or None
+            The fingerprint of the file (see `fingerprint_file`).
+            If given, the fingerprints are compared first and the
+            file is only hashed if they match.
+        """
+        if (fingerprint is not None and
+            self.GetFingerprint(path) != fingerprint):
+            return False
+        return self.GetHash(path) == thash
+
+
+
+def fingerprint_file(fname, blocksize=65536):
+    """ A fast fingerprint of a file
+
+    The fingerprint is the sha256 hash of the size, the first block,
+    and the last block of the file. Files with different fingerprints
+    have different hashes (see `dclab.rtdc_dataset.hashfile`).
+    """
+    size = os.path.getsize(fname)
+    hasher = hashlib.sha256()
+    hasher.update("{}".format(size).encode("utf-8"))
+    with open(fname, "rb") as fd:
+        hasher.update(fd.read(blocksize))
+        if size > blocksize:
+            fd.seek(max(blocksize, size-blocksize))
+            hasher.update(fd.read(blocksize))
+    return hasher.hexdigest()
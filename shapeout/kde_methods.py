@@ -0,0 +1,513 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" ShapeOut - kernel density estimation methods
+
+In addition to the methods of `dclab.kde_methods`, the density can
+be estimated on a grid ("Binned"): The events are binned onto a
+regular grid, the bin counts are convolved with the Gaussian kernel
+via FFT, and the density is interpolated at the output positions.
+The computational cost does not depend on the product of the number
+of events and the number of output positions.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import numpy as np
+from scipy import ndimage, signal
+
+from dclab.cached import Cache
+from dclab.kde_methods import kde_gauss, kde_none
+from dclab.kde_methods import kde_multivariate as _kde_multivariate
+
+
+#: Names of the KDE methods for the "KDE" plotting option
+KDE_TYPES = ["None", "Gauss", "Multivariate", "Binned"]
+
+#: Maximum number of grid points along each axis of "Multivariate"
+#: (1024**2 points use 8 MB per array)
+MAX_BINS = 1024
+
+#: "Multivariate" is computed exactly if the number of events times
+#: the number of output points is smaller than this
+MULTIVARIATE_EXACT_SIZE = 5e6
+
+#: Tolerance of "Multivariate" relative to the maximum density
+MULTIVARIATE_TOL = 1e-2
+
+
+@Cache
+def kde_binned(events_x, events_y, xout=None, yout=None, bins=512,
+               **kwargs):
+    """ Binned Gaussian Kernel Density Estimation
+
+    The bandwidth (Scott's rule) and the kernel covariance are the
+    same as for `kde_gauss`.
+
+    Parameters
+    ----------
+    events_x, events_y : 1D ndarray
+        The input points for kernel density estimation. Input
+        is flattened automatically.
+    xout, yout : ndarray
+        The coordinates at which the KDE should be computed.
+        If set to none, input coordinates are used.
+    bins : int
+        Number of grid points along each axis.
+
+    Returns
+    -------
+    density : ndarray, same shape as `xout`
+        The KDE for the points in (xout, yout)
+
+    See Also
+    --------
+    `kde_binned_error` : bound of the deviation from `kde_gauss`
+    """
+    assert (xout is None and yout is None) or (xout is not None and yout is not None)
+    if yout is None and yout is None:
+        xout = events_x
+        yout = events_y
+
+    grid = _BinnedGrid(events_x, events_y, bins)
+    return grid.evaluate(xout, yout)
+
+
+def kde_binned_error(events_x, events_y, xout=None, yout=None, bins=512,
+                     **kwargs):
+    """ Upper bound of the error of `kde_binned`
+
+    Parameters
+    ----------
+    events_x, events_y, xout, yout, bins :
+        See `kde_binned`.
+
+    Returns
+    -------
+    error : ndarray, same shape as `xout`
+        The maximum absolute deviation of `kde_binned` from the
+        exact estimator (`kde_gauss`) at the points (xout, yout).
+
+    Notes
+    -----
+    Linear binning of the events and bilinear interpolation of the
+    grid each introduce an error of at most
+    (dx**2*|d2f/dx2| + dy**2*|d2f/dy2|)/8 in a grid cell, where dx
+    and dy are the grid spacings [1]_. The second derivatives of the
+    estimate f are bounded by convolving the binned events with an
+    upper bound of the absolute second derivatives of the kernel in
+    the neighborhood of each grid offset. The kernel is truncated at
+    five standard deviations, which adds at most K(0)*exp(-12.5).
+
+    References
+    ----------
+    .. [1] Hall, P. and Wand, M. P. (1996). On the accuracy of binned
+           kernel density estimators. Journal of Multivariate
+           Analysis, 56(2), 165-184.
+    """
+    assert (xout is None and yout is None) or (xout is not None and yout is not None)
+    if yout is None and yout is None:
+        xout = events_x
+        yout = events_y
+
+    grid = _BinnedGrid(events_x, events_y, bins, error=True)
+    return grid.evaluate(xout, yout, grid.error)
+
+
+@Cache
+def kde_multivariate(events_x, events_y, bw, xout=None, yout=None,
+                     tol=MULTIVARIATE_TOL, **kwargs):
+    """ Multivariate Kernel Density Estimation
+
+    Same as `dclab.kde_methods.kde_multivariate` (Gaussian kernels
+    with the bandwidths `bw`), but the density is approximated on a
+    grid (see `kde_binned`) unless `tol` is zero.
+
+    The cost of the grid depends on the extent of the data in units
+    of the bandwidths, the cost of the exact estimator on the number
+    of events times the number of output points. The exact estimator
+    is used if the latter is smaller than `MULTIVARIATE_EXACT_SIZE`
+    or if the tolerance cannot be met with `MAX_BINS` grid points
+    along each axis (e.g. because of outliers).
+
+    Parameters
+    ----------
+    events_x, events_y : 1D ndarray
+        The input points for kernel density estimation. Input
+        is flattened automatically.
+    bw : tuple (bwx, bwy)
+        The bandwith for kernel density estimation.
+    xout, yout : ndarray
+        The coordinates at which the KDE should be computed.
+        If set to none, input coordinates are used.
+    tol : float
+        Tolerance of the approximation relative to the maximum of
+        the density (default `MULTIVARIATE_TOL`). The grid is refined
+        until the error bound (see `kde_binned_error`) is below the
+        tolerance. If set to zero, the exact estimator is used.
+
+    Returns
+    -------
+    density : ndarray, same shape as `xout`
+        The KDE for the points in (xout, yout)
+    """
+    assert (xout is None and yout is None) or (xout is not None and yout is not None)
+    if yout is None and yout is None:
+        xout = events_x
+        yout = events_y
+
+    if tol and not _multivariate_exact(events_x, np.size(xout)):
+        grid = _multivariate_grid(events_x, events_y, bw, tol)
+    else:
+        grid = None
+    if grid is None:
+        return _kde_multivariate(events_x, events_y, bw=bw,
+                                 xout=np.asarray(xout),
+                                 yout=np.asarray(yout))
+    return grid.evaluate(xout, yout)
+
+
+def uses_grid(kde_type, events_x, size=None):
+    """ Whether `kde_type` is evaluated on a grid (see `kde_grid`)
+
+    Parameters
+    ----------
+    kde_type : str
+        Name of the KDE method (see `KDE_TYPES`).
+    events_x : 1D ndarray
+        The input points for kernel density estimation.
+    size : int or None
+        Number of output points. If set to None, the density is
+        evaluated at the input points. "Multivariate" is computed
+        exactly for small problems (see `kde_multivariate`).
+    """
+    kde_type = kde_type.lower()
+    if size is None:
+        size = np.size(events_x)
+    if kde_type == "binned":
+        return True
+    elif kde_type == "multivariate" and MULTIVARIATE_TOL:
+        return not _multivariate_exact(events_x, size)
+    else:
+        return False
+
+
+def kde_grid(kde_type, events_x, events_y, bw=None, size=None):
+    """ The grid of the binned KDE methods
+
+    Parameters
+    ----------
+    kde_type : str
+        Name of the KDE method (see `KDE_TYPES`).
+    events_x, events_y : 1D ndarray
+        The input points for kernel density estimation.
+    bw : tuple (bwx, bwy)
+        The bandwith for "Multivariate".
+    size : int or None
+        Number of output points (see `uses_grid`).
+
+    Returns
+    -------
+    grid : object or None
+        The density estimate on a grid or None if `kde_type` is not
+        computed on a grid (for "Multivariate" also if the problem is
+        small or if the grid would be too large, see
+        `kde_multivariate`). The density is evaluated
+        at the points (xout, yout) with `grid.evaluate(xout, yout)` and
+        `grid.nbytes` is the memory used by the grid.
+    """
+    kde_type = kde_type.lower()
+    if not uses_grid(kde_type, events_x, size):
+        return None
+    elif kde_type == "binned":
+        return _BinnedGrid(events_x, events_y, 512)
+    else:
+        return _multivariate_grid(events_x, events_y, bw, MULTIVARIATE_TOL)
+
+
+def _multivariate_exact(events_x, size):
+    """ Whether "Multivariate" is computed exactly for `size` output
+    points (see `MULTIVARIATE_EXACT_SIZE`)
+    """
+    return np.size(events_x)*size < MULTIVARIATE_EXACT_SIZE
+
+
+def _multivariate_grid(events_x, events_y, bw, tol):
+    """ The grid for `kde_multivariate` or None if the tolerance
+    requires more than `MAX_BINS` grid points along each axis
+    """
+    cov = np.diag(np.array(bw, dtype=float)**2)
+    bins = min(256, MAX_BINS)
+    while True:
+        grid = _BinnedGrid(events_x, events_y, bins, cov=cov, error=True)
+        ratio = grid.error.max() / (tol*grid.density.max())
+        if ratio <= 1:
+            break
+        elif bins >= MAX_BINS:
+            return None
+        # The error decreases with the square of the grid spacing.
+        bins = int(np.ceil(1.1*bins*np.sqrt(ratio)))
+        if bins > 2*MAX_BINS:
+            # too large, even if the estimate is off
+            return None
+        bins = min(MAX_BINS, bins)
+    grid.error = None
+    return grid
+
+
+def contour_density(density_fct, xlin, ylin, levels, step=None):
+    """ Evaluate a density for contour lines with adaptive refinement
+
+    The density is evaluated on a coarse grid first. Only the grid
+    cells that are crossed by a contour level (relative to the
+    maximum density), that contain the maximum, or that are next to
+    such cells are refined until the resolution of (xlin, ylin) is
+    reached. The density in the other cells is interpolated
+    bilinearly, such that they are not crossed by contour lines.
+
+    Parameters
+    ----------
+    density_fct : callable
+        Called with the arguments `(xout, yout)` (1D ndarrays) and
+        returns the density at these points.
+    xlin, ylin : 1D ndarray
+        The equidistant grid coordinates.
+    levels : list of floats in interval (0,1)
+        The contour levels relative to the maximum density.
+    step : int or None
+        The coarse grid consists of every `step`-th point of
+        (xlin, ylin); must be a power of two. If set to None, the
+        largest step with at least 16 coarse cells along each axis
+        (at most 16) is used.
+
+    Returns
+    -------
+    density : 2D ndarray of shape (len(ylin), len(xlin))
+        The density on the grid `np.meshgrid(xlin, ylin)`.
+    evaluations : int
+        The number of points at which the density was evaluated.
+
+    Notes
+    -----
+    After the refinement, all interpolated cells that are crossed by
+    the final contour levels are evaluated, such that the contour
+    lines are identical to those of the fully evaluated grid, unless
+    a density feature is smaller than a coarse grid cell and does not
+    show up at its corners or those of its neighbors.
+    """
+    ny, nx = len(ylin), len(xlin)
+    density = np.zeros((ny, nx))
+    exact = np.zeros((ny, nx), dtype=bool)
+    evaluations = [0]
+
+    def evaluate(mask):
+        mask = mask & ~exact
+        rows, cols = np.nonzero(mask)
+        if rows.size:
+            density[rows, cols] = density_fct(xlin[cols], ylin[rows])
+            exact[rows, cols] = True
+            evaluations[0] += rows.size
+
+    if step is None:
+        step = 1
+        while step < 16 and (min(nx, ny) - 1) // (2*step) >= 16:
+            step *= 2
+    if min(nx, ny) < 2:
+        step = 1
+
+    rows = np.arange(ny).reshape(-1, 1)
+    cols = np.arange(nx).reshape(1, -1)
+    # cells at the current step that have to be evaluated
+    active = np.ones((_ncells(ny, step), _ncells(nx, step)), dtype=bool)
+    # interpolated cells: (step, cells, corner minimum, corner maximum)
+    filled = []
+    while True:
+        cell_r = np.minimum(rows // step, active.shape[0]-1)
+        cell_c = np.minimum(cols // step, active.shape[1]-1)
+        r0 = cell_r * step
+        r1 = np.minimum(r0 + step, ny-1)
+        c0 = cell_c * step
+        c1 = np.minimum(c0 + step, nx-1)
+        corner = (((rows == r0) | (rows == r1)) &
+                  ((cols == c0) | (cols == c1)))
+        evaluate(corner & active[cell_r, cell_c])
+        if step == 1:
+            break
+        # corner values of the cells
+        vr0 = np.arange(active.shape[0]) * step
+        vr1 = np.minimum(vr0 + step, ny-1)
+        vc0 = np.arange(active.shape[1]) * step
+        vc1 = np.minimum(vc0 + step, nx-1)
+        corners = np.array([density[np.ix_(vr0, vc0)],
+                            density[np.ix_(vr0, vc1)],
+                            density[np.ix_(vr1, vc0)],
+                            density[np.ix_(vr1, vc1)]])
+        cmin = corners.min(axis=0)
+        cmax = corners.max(axis=0)
+        dmax = density.max()
+        refine = cmax >= dmax
+        for lev in levels:
+            # The maximum (and thus the level) may increase when the
+            # grid is refined.
+            refine |= (cmin <= 1.1*lev*dmax) & (cmax >= lev*dmax)
+        refine = ndimage.binary_dilation(refine, structure=np.ones((3, 3)))
+        refine &= active
+        filled.append((step, active & ~refine, cmin, cmax))
+        step //= 2
+        active = np.kron(refine, np.ones((2, 2), dtype=bool))
+        active = active[:_ncells(ny, step), :_ncells(nx, step)]
+
+    # cells that are crossed by the final levels are evaluated
+    dmax = None
+    while dmax != density.max():
+        dmax = density.max()
+        for step, cells, cmin, cmax in filled:
+            crossed = np.zeros(cells.shape, dtype=bool)
+            for lev in levels:
+                crossed |= (cmin <= lev*dmax) & (cmax >= lev*dmax)
+            cell_r = np.minimum(rows // step, cells.shape[0]-1)
+            cell_c = np.minimum(cols // step, cells.shape[1]-1)
+            evaluate((cells & crossed)[cell_r, cell_c])
+
+    # bilinear interpolation of the remaining points
+    for step, cells, _cmin, _cmax in filled[::-1]:
+        cell_r = np.minimum(rows // step, cells.shape[0]-1)
+        cell_c = np.minimum(cols // step, cells.shape[1]-1)
+        todo = cells[cell_r, cell_c] & ~exact
+        if not np.any(todo):
+            continue
+        pr, pc = np.nonzero(todo)
+        r0 = cell_r[pr, 0] * step
+        r1 = np.minimum(r0 + step, ny-1)
+        c0 = cell_c[0, pc] * step
+        c1 = np.minimum(c0 + step, nx-1)
+        ty = (pr - r0) / (r1 - r0)
+        tx = (pc - c0) / (c1 - c0)
+        density[pr, pc] = ((1-ty)*(1-tx)*density[r0, c0] +
+                           (1-ty)*tx*density[r0, c1] +
+                           ty*(1-tx)*density[r1, c0] +
+                           ty*tx*density[r1, c1])
+        exact[pr, pc] = True
+    return density, evaluations[0]
+
+
+def _ncells(npoints, step):
+    """ Number of grid cells of size `step` along an axis """
+    return max(1, int(np.ceil((npoints-1) / step)))
+
+
+class _BinnedGrid(object):
+    # kernel truncation in standard deviations
+    truncate = 5
+
+    def __init__(self, events_x, events_y, bins, cov=None, error=False):
+        """ Kernel density estimate on a regular grid
+
+        `cov` is the covariance of the Gaussian kernel and defaults
+        to that of `kde_gauss`. If `error` is True, an upper bound of
+        the error (see `kde_binned_error`) is computed as well.
+        """
+        x = np.asarray(events_x, dtype=float).flatten()
+        y = np.asarray(events_y, dtype=float).flatten()
+        n = x.size
+        if cov is None:
+            # kernel covariance of `scipy.stats.gaussian_kde`
+            factor = n**(-1/6)
+            cov = np.atleast_2d(np.cov(x, y)) * factor**2
+        sigma = np.sqrt(np.diag(cov))
+        # grid including the kernel extent
+        pad = self.truncate*sigma
+        self.x0 = x.min() - pad[0]
+        self.y0 = y.min() - pad[1]
+        self.dx = (x.max() + pad[0] - self.x0) / (bins-1)
+        self.dy = (y.max() + pad[1] - self.y0) / (bins-1)
+        self.bins = bins
+        self.cov = cov
+        self.prec = np.linalg.inv(cov)
+        self.kmax = 1 / (2*np.pi*np.sqrt(np.linalg.det(cov)))
+
+        self.error = None
+        counts = self._bin(x, y)
+        self.density = signal.fftconvolve(counts, self._kernel(),
+                                          mode="same") / n
+        if error:
+            bound = 2*signal.fftconvolve(counts, self._kernel_bound(),
+                                         mode="same") / n
+            bound += self.kmax*np.exp(-self.truncate**2/2)
+            # An output position is interpolated from the four
+            # corners of its grid cell.
+            self.error = ndimage.maximum_filter(bound, size=3)
+
+
+    def _bin(self, x, y):
+        """ Linear binning (each event is distributed to the four
+        surrounding grid points)
+        """
+        bins = self.bins
+        gx = (x - self.x0) / self.dx
+        gy = (y - self.y0) / self.dy
+        ix = np.minimum(np.floor(gx).astype(int), bins-2)
+        iy = np.minimum(np.floor(gy).astype(int), bins-2)
+        fx = gx - ix
+        fy = gy - iy
+        counts = np.zeros(bins*bins)
+        for ox, wx in [(0, 1-fx), (1, fx)]:
+            for oy, wy in [(0, 1-fy), (1, fy)]:
+                counts += np.bincount((ix+ox)*bins + iy+oy, weights=wx*wy,
+                                      minlength=bins*bins)
+        return counts.reshape(bins, bins)
+
+
+    def _offsets(self):
+        """ The grid offsets covered by the truncated kernel """
+        nx = int(np.ceil(self.truncate*np.sqrt(self.cov[0, 0])/self.dx))
+        ny = int(np.ceil(self.truncate*np.sqrt(self.cov[1, 1])/self.dy))
+        return np.meshgrid(np.arange(-nx, nx+1)*self.dx,
+                           np.arange(-ny, ny+1)*self.dy, indexing="ij")
+
+
+    def _kernel(self):
+        """ The Gaussian kernel on the grid offsets """
+        ox, oy = self._offsets()
+        prec = self.prec
+        mahal = prec[0, 0]*ox**2 + 2*prec[0, 1]*ox*oy + prec[1, 1]*oy**2
+        return self.kmax * np.exp(-mahal/2)
+
+
+    def _kernel_bound(self):
+        """ Upper bound of the binning and interpolation error of the
+        kernel in the neighborhood (two grid cells) of the grid offsets
+        """
+        ox, oy = self._offsets()
+        # lower bound of the Mahalanobis distance in the neighborhood
+        dist2 = (np.maximum(np.abs(ox) - 2*self.dx, 0)**2 +
+                 np.maximum(np.abs(oy) - 2*self.dy, 0)**2)
+        mahal = np.linalg.eigvalsh(self.prec).min() * dist2
+        # |d2K/dx2| <= K(0)*prec[0,0]*h(m) with
+        # h(m) = max(1, m-1)*exp(-m/2) and m the Mahalanobis distance;
+        # `envelope` is the decreasing envelope of h.
+        envelope = np.maximum(np.maximum(1, mahal-1)*np.exp(-mahal/2),
+                              np.where(mahal < 3, 2*np.exp(-1.5), 0))
+        return (self.kmax * envelope *
+                (self.dx**2*self.prec[0, 0] + self.dy**2*self.prec[1, 1]) / 8)
+
+
+    @property
+    def nbytes(self):
+        nbytes = self.density.nbytes
+        if self.error is not None:
+            nbytes += self.error.nbytes
+        return nbytes
+
+
+    def evaluate(self, xout, yout, values=None):
+        """ Bilinear interpolation of the density (or `values` on the
+        grid) at (xout, yout)
+        """
+        if values is None:
+            values = self.density
+        x = np.asarray(xout, dtype=float).flatten()
+        y = np.asarray(yout, dtype=float).flatten()
+        coords = np.vstack([(x - self.x0) / self.dx,
+                            (y - self.y0) / self.dy])
+        result = ndimage.map_coordinates(values, coords, order=1,
+                                         mode="nearest")
+        return result.reshape(np.shape(xout))
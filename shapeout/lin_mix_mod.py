@@ -11,16 +11,170 @@ Install the "lme4" library with:
 """
 from __future__ import division, print_function
 
+import atexit
+import contextlib
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
 import numpy as np
+import os
 import pyper
+from scipy import linalg, optimize, stats
+import tempfile
+import threading
 
 from .util import cran
 
-def linmixmod(xs, treatment, timeunit, RCMD=cran.rcmd):
+
+class RSessionPool(object):
+    def __init__(self, RCMD=cran.rcmd, size=2):
+        """ A pool of R sessions with the "lme4" library loaded
+        
+        Starting R and loading "lme4" takes much longer than fitting
+        a model. The sessions of the pool are reused in subsequent
+        calls.
+        
+        Parameters
+        ----------
+        RCMD : str
+            Path to the R binary.
+        size : int
+            Maximum number of idle sessions that are kept.
+        """
+        self.RCMD = RCMD
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+
+    def _start(self):
+        r = pyper.R(use_pandas=True, RCMD=self.RCMD)
+        #Load the necessary library for Linear Mixed Models    
+        lme4resp = r("library(lme4)") 
+        if lme4resp.count("Error"):
+            _stop_session(r)
+            # Tell the user that something went wrong
+            raise OSError("R installation at {}: {}\n".format(self.RCMD,
+                                                              lme4resp)+
+                  """Please install 'lme4' via:
+                  {} -e "install.packages('lme4', repos='http://cran.r-project.org')
+                  """.format(self.RCMD)
+                          )
+        return r
+
+
+    def Close(self):
+        """ Stop all idle sessions """
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for r in idle:
+            _stop_session(r)
+
+
+    def Resize(self, size):
+        """ Set the maximum number of idle sessions
+
+        Idle sessions in excess of `size` are stopped.
+        """
+        with self._lock:
+            self.size = size
+            excess = self._idle[size:]
+            self._idle = self._idle[:size]
+        for r in excess:
+            _stop_session(r)
+
+
+    def Run(self, func):
+        """ Call `func` with an R session as its only argument
+        
+        If the R process dies while `func` is running, `func` is
+        called again with a new session.
+        """
+        with self.Session() as r:
+            try:
+                return func(r)
+            except Exception:
+                if _session_alive(r):
+                    raise
+        # The R process died (the session is not reused)
+        with self.Session() as r:
+            return func(r)
+
+
+    @contextlib.contextmanager
+    def Session(self):
+        """ Context manager that provides an R session
+        
+        The session is returned to the pool when the context is left.
+        Sessions in which an exception occurred are stopped.
+        """
+        r = None
+        with self._lock:
+            while self._idle and r is None:
+                r = self._idle.pop()
+                if not _session_alive(r):
+                    r = None
+        if r is None:
+            r = self._start()
+        try:
+            yield r
+        except:
+            # The session may be in an undefined state.
+            _stop_session(r)
+            raise
+        keep = False
+        if _session_alive(r):
+            # remove all variables from the session
+            r("rm(list=ls())")
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(r)
+                    keep = True
+        if not keep:
+            _stop_session(r)
+
+
+
+def _session_alive(r):
+    return r.prog is not None and r.prog.poll() is None
+
+
+def _stop_session(r):
+    # see `pyper.R.__del__`
+    if r.prog is not None:
+        try:
+            r.sendAll(r.prog, 'q("no")'+r.newline)
+            r.prog.wait()
+        except:
+            pass
+        r.prog = None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_session_pool(RCMD=cran.rcmd):
+    """ The `RSessionPool` for the R binary `RCMD` """
+    with _pools_lock:
+        if not RCMD in _pools:
+            _pools[RCMD] = RSessionPool(RCMD)
+        return _pools[RCMD]
+
+
+@atexit.register
+def _close_session_pools():
+    for pool in _pools.values():
+        pool.Close()
+
+
+def linmixmod(xs, treatment, timeunit, RCMD=cran.rcmd, backend="R",
+              significance="lrt", aggregated=False, **kwargs):
     '''
     Linear Mixed-Effects Model computation for one fixed effect and one 
     random effect.
-    This function uses the R packages "lme4" and "stats".
+    This function uses the R packages "lme4" and "stats" or, with
+    `backend="numpy"`, an equivalent implementation with NumPy and
+    SciPy.
     
     The response variable is modeled using two linear mixed effect models 
     (Model and Nullmodel) of the form:
@@ -47,6 +201,22 @@ def linmixmod(xs, treatment, timeunit, RCMD=cran.rcmd):
         enumeration matches the index of `xs`.
         (e.g. list containing integers "1" and "2" according to the day
         at which the content in `xs` was measured)          
+    RCMD: str
+        Path to the R binary (only for `backend="R"`).
+    backend: str
+        Either "R" (R and "lme4") or "numpy" (NumPy and SciPy,
+        does not require R).
+    significance: str
+        Either "lrt" (asymptotic likelihood ratio test), "bootstrap"
+        (parametric bootstrap), or "permutation" (permutation test).
+        For the resampling tests, the keyword arguments are passed
+        to `resampling_test` and its results are added to the
+        returned dictionary.
+    aggregated: bool
+        If True, each item of `xs` is not an array of response
+        variables but a tuple of the number of events, the mean,
+        and the sum of squared deviations from the mean (see
+        `summarize`). Requires `backend="numpy"`.
 
     Returns
     -------
@@ -58,6 +228,24 @@ def linmixmod(xs, treatment, timeunit, RCMD=cran.rcmd):
     -Std Error for the Fixed Effect
     -p-Value
     
+    Notes
+    -----
+    The computation is done in an R session of the session pool
+    of `RCMD` (see `get_session_pool`). The response variable is
+    transferred to R via a temporary binary file; treatment and
+    time unit are transferred for each measurement (not for each
+    event).
+
+    The "numpy" backend minimizes the profiled REML criterion and
+    the profiled deviance (for the likelihood ratio test) in the
+    same way as "lme4" [3]_. Since the design only depends on the
+    measurement, the fit only requires the number of events, the
+    mean, and the sum of squared deviations of `xs` for each
+    measurement. With `aggregated=True`, these are computed
+    beforehand (e.g. with `summarize` from the filtered events of
+    each measurement), such that the events of all measurements
+    never have to be in memory at the same time.
+    
     References
     ----------
     .. [1] R package "lme4":
@@ -68,6 +256,10 @@ def linmixmod(xs, treatment, timeunit, RCMD=cran.rcmd):
     .. [2] R function "anova" from package "stats":
            Chambers, J. M. and Hastie, T. J. (1992) Statistical Models in S, 
            Wadsworth & Brooks/Cole
+
+    .. [3] Bates D, Maechler M, Bolker B and Walker S (2015). Fitting
+           Linear Mixed-Effects Models Using lme4. Journal of
+           Statistical Software, 67(1), 1-48.
     
     Example
     -------
@@ -99,9 +291,272 @@ def linmixmod(xs, treatment, timeunit, RCMD=cran.rcmd):
     #         significant effect)
     '''
     
-    modelfunc="xs~treatment+(1+treatment|timeunit)"
-    nullmodelfunc = "xs~(1+treatment|timeunit)"
+    _check_input(xs, treatment, timeunit)
+    results = _linmixmod_features([xs], treatment, timeunit, RCMD=RCMD,
+                                  backend=backend, aggregated=aggregated)[0]
+    if significance != "lrt":
+        resampled = resampling_test(xs, treatment, timeunit,
+                                    method=significance,
+                                    aggregated=aggregated, **kwargs)
+        results.update(resampled)
+        results["Full Summary"] += ("\n{} TEST: \n p-Value {:.4g} "
+            "(95% confidence interval {:.4g} to {:.4g}, {} resamples)\n"
+            ).format(significance.upper(), resampled["p-Value"],
+                     resampled["Confidence Interval"][0],
+                     resampled["Confidence Interval"][1],
+                     resampled["Resamples"])
+    return results
+
+
+def resampling_test(xs, treatment, timeunit, method="bootstrap",
+                    resamples=1000, seed=42, workers=0, ci_width=.01,
+                    chunk_size=25, aggregated=False):
+    """ Resampling test for the significance of the treatment
+    
+    The likelihood ratio statistic of the model and the null model
+    (see `linmixmod`) is compared to its distribution under the null
+    hypothesis. The distribution is obtained either by a parametric
+    bootstrap [6]_ (data simulated from the maximum likelihood fit of
+    the null model) or by permutations of the treatments among the
+    measurements of each time unit. The models are fitted with the
+    "numpy" backend.
+    
+    Parameters
+    ----------
+    xs, treatment, timeunit, aggregated:
+        See `linmixmod`.
+    method: str
+        Either "bootstrap" or "permutation".
+    resamples: int
+        Maximum number of resamples.
+    seed: int
+        Seed of the random number generator. The result does not
+        depend on the number of workers.
+    workers: int
+        Number of worker processes. If set to 1, the resamples are
+        computed sequentially. If set to 0, one worker per CPU is
+        used.
+    ci_width: float
+        The resampling stops early if the 95% confidence interval
+        (Clopper-Pearson) of the p-Value is narrower than this.
+    chunk_size: int
+        Number of resamples computed by a worker at a time. The
+        stopping rule is checked after each chunk.
+    
+    Returns
+    -------
+    results: dict
+        The p-Value ("p-Value"), its confidence interval
+        ("Confidence Interval"), and the number of resamples
+        ("Resamples").
+    
+    References
+    ----------
+    .. [6] Halekoh, U. and Hojsgaard, S. (2014). A Kenward-Roger
+           approximation and parametric bootstrap methods for tests
+           in linear mixed models - the R package pbkrtest. Journal
+           of Statistical Software, 59(9), 1-30.
+    """
+    if not method in ["bootstrap", "permutation"]:
+        raise ValueError("Unknown method: {}".format(method))
+    _check_input(xs, treatment, timeunit)
+    treatment_levels, treatment_codes = _factorize(treatment)
+    timeunit_levels, timeunit_codes = _factorize(timeunit)
+    k = len(treatment_levels)
+    if k < 2:
+        raise ValueError("Please define at least two different treatments")
+    G = len(timeunit_levels)
+    summaries = _summaries(xs, aggregated)
+    groups, yty, n, _center = _lmm_design(summaries, treatment_codes,
+                                          timeunit_codes, k, G)
+    _model, nullmodel, chisq = _lmm_lrt(groups, k, yty, n)
+    null = (nullmodel["beta"][0], nullmodel["sigma2"], nullmodel["L"])
+
+    # Each chunk has its own seed, such that the resamples do not
+    # depend on the order in which the chunks are computed.
+    nchunks = int(np.ceil(resamples/chunk_size))
+    seeds = np.random.RandomState(seed).randint(2**31-1, size=nchunks)
+    args = [ (method, summaries, treatment_codes, timeunit_codes, k, G,
+              null, sd, min(chunk_size, resamples-ii*chunk_size))
+             for ii, sd in enumerate(seeds) ]
+    if workers == 0:
+        workers = mp.cpu_count()
+    workers = min(workers, nchunks)
+
+    exceed = 0
+    total = 0
+    if workers <= 1:
+        pool = None
+        chunks = (_resample_lrt(a) for a in args)
+    else:
+        pool = mp.Pool(processes=workers)
+        chunks = pool.imap(_resample_lrt, args)
+    try:
+        for chisq_resampled in chunks:
+            # small tolerance for the numerical optimization
+            exceed += np.sum(chisq_resampled >= chisq*(1-1e-8))
+            total += chisq_resampled.size
+            low, high = _clopper_pearson(exceed, total)
+            if high - low < ci_width:
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return {"p-Value": (exceed+1)/(total+1),
+            "Confidence Interval": (low, high),
+            "Resamples": total}
+
+
+def _clopper_pearson(k, n, alpha=.05):
+    """ Confidence interval of a binomial proportion """
+    low = stats.beta.ppf(alpha/2, k, n-k+1) if k > 0 else 0.
+    high = stats.beta.ppf(1-alpha/2, k+1, n-k) if k < n else 1.
+    return low, high
+
+
+def _resample_lrt(args):
+    """ Likelihood ratio statistics of resampled data
+    
+    See `resampling_test`. This function is called in the worker
+    processes.
+    """
+    (method, summaries, treatment_codes, timeunit_codes, k, G, null, seed,
+     size) = args
+    counts, means, ss = summaries
+    state = np.random.RandomState(seed)
+    chisq = np.zeros(size)
+    for ii in range(size):
+        tcodes = treatment_codes
+        if method == "bootstrap":
+            beta0, sigma2, L = null
+            # random effects of each time unit
+            b = np.sqrt(sigma2) * state.normal(size=(G, k)).dot(L.T)
+            mu = np.zeros(len(counts))
+            for jj, (t, g) in enumerate(zip(treatment_codes, timeunit_codes)):
+                mu[jj] = beta0 + b[g-1, 0] + (b[g-1, t-1] if t > 1 else 0)
+            # mean and sum of squares of normally distributed events
+            means = mu + np.sqrt(sigma2/counts)*state.normal(size=len(counts))
+            ss = sigma2*state.chisquare(np.maximum(counts-1, 1))
+            ss[counts == 1] = 0
+        else:
+            tcodes = treatment_codes.copy()
+            for g in range(1, G+1):
+                idx = np.where(timeunit_codes == g)[0]
+                tcodes[idx] = state.permutation(tcodes[idx])
+        groups, yty, n, _center = _lmm_design((counts, means, ss), tcodes,
+                                              timeunit_codes, k, G)
+        chisq[ii] = _lmm_lrt(groups, k, yty, n)[2]
+    return chisq
+
+
+def linmixmod_batch(features, treatment, timeunit, RCMD=cran.rcmd,
+                    backend="R", workers=0, aggregated=False):
+    """ Linear mixed-effects models for several features
+    
+    The model (see `linmixmod`) is fitted for each feature with the
+    same treatments and time units. The fits are distributed to a
+    pool of `workers` threads (R sessions for the "R" backend).
+    
+    Parameters
+    ----------
+    features: list of tuples (name, xs)
+        The name of a feature (e.g. "Area") and the response variables
+        for each measurement (see `xs` in `linmixmod`).
+    treatment, timeunit, RCMD, backend, aggregated:
+        See `linmixmod`.
+    workers: int
+        Number of workers. If set to 0, one worker per CPU is used.
+    
+    Returns
+    -------
+    results: list of tuples (name, result)
+        The results (see `linmixmod`) in the order of `features`.
+        Each result additionally contains the p-Values adjusted for
+        the number of features with the methods of Holm
+        ("p-Value (Holm)") and of Benjamini and Hochberg
+        ("p-Value (FDR)"), see `adjust_pvalues`.
+        If the fit fails for a feature, its result only contains the
+        error message ("Error") and the p-Values are adjusted for
+        the number of the other features.
+    """
+    for _name, xs in features:
+        _check_input(xs, treatment, timeunit)
+    if workers == 0:
+        workers = mp.cpu_count()
+    results = _linmixmod_features([xs for _name, xs in features],
+                                  treatment, timeunit, RCMD=RCMD,
+                                  backend=backend, workers=workers,
+                                  aggregated=aggregated, catch_errors=True)
+    results = [ {"Error": "{}: {}".format(r.__class__.__name__, r)}
+                if isinstance(r, Exception) else r for r in results ]
+    fitted = [ r for r in results if not "Error" in r ]
+    pvals = [r["p-Value (Likelihood Ratio Test)"] for r in fitted]
+    for key, method in [("p-Value (Holm)", "holm"),
+                        ("p-Value (FDR)", "fdr")]:
+        for r, padj in zip(fitted, adjust_pvalues(pvals, method)):
+            r[key] = padj
+    return [(name, r) for (name, _xs), r in zip(features, results)]
+
+
+def batch_summary(results):
+    """ Table of the results of `linmixmod_batch` as a string """
+    columns = ["Estimate", "Std. Error (Estimate)", "Fixed Effect",
+               "Std. Error (Fixed Effect)", "p-Value (Likelihood Ratio Test)",
+               "p-Value (Holm)", "p-Value (FDR)"]
+    lines = ["\t".join(["Feature"] + columns)]
+    for name, r in results:
+        if "Error" in r:
+            lines.append("{}\t{}".format(name, r["Error"]))
+        else:
+            lines.append("\t".join([name] + ["{:.6g}".format(float(r[c]))
+                                            for c in columns]))
+    return "\n".join(lines)+"\n"
+
+
+def adjust_pvalues(pvals, method="holm"):
+    """ Adjust p-Values for multiple comparisons
+    
+    Parameters
+    ----------
+    pvals: 1D array-like
+        The p-Values.
+    method: str
+        Either "holm" (family-wise error rate [4]_) or "fdr" (false
+        discovery rate [5]_), same as "holm" and "BH" of the R
+        function "p.adjust".
+    
+    Returns
+    -------
+    padj: 1D ndarray
+        The adjusted p-Values.
     
+    References
+    ----------
+    .. [4] Holm, S. (1979). A simple sequentially rejective multiple
+           test procedure. Scandinavian Journal of Statistics, 6, 65-70.
+    
+    .. [5] Benjamini, Y. and Hochberg, Y. (1995). Controlling the false
+           discovery rate: a practical and powerful approach to multiple
+           testing. Journal of the Royal Statistical Society Series B,
+           57, 289-300.
+    """
+    pvals = np.asarray(pvals, dtype=float)
+    m = pvals.size
+    order = np.argsort(pvals)
+    psort = pvals[order]
+    if method == "holm":
+        adj = np.maximum.accumulate((m-np.arange(m))*psort)
+    elif method == "fdr":
+        adj = np.minimum.accumulate((m/np.arange(m, 0, -1)*psort[::-1]))[::-1]
+    else:
+        raise ValueError("Unknown method: {}".format(method))
+    padj = np.empty(m)
+    padj[order] = np.minimum(adj, 1)
+    return padj
+
+
+def _check_input(xs, treatment, timeunit):
     #Check if all input lists have the same length
     if len(xs)==len(treatment)==len(timeunit): 
         pass
@@ -110,79 +565,431 @@ def linmixmod(xs, treatment, timeunit, RCMD=cran.rcmd):
     
     if len(xs)<3:
         raise ValueError("Please use Linear Mixed Models only to analyze repeated measurements. Select more measurements") 
+
+
+def _linmixmod_features(xss, treatment, timeunit, RCMD=cran.rcmd,
+                        backend="R", workers=1, aggregated=False,
+                        catch_errors=False):
+    """ Fit `linmixmod` for several response variables `xss`
     
-    for i in range(len(xs)): 
-        #Expand every unit in treatment and timeunit to the same length as the 
-        #xs[i] they are supposed to describe
-        #Using the "repeat" function also characters can be handled
-        treatment[i] = np.array([treatment[i]]).repeat(len(xs[i]), axis=0)  
-        timeunit[i] = np.array([timeunit[i]]).repeat(len(xs[i]), axis=0)
-    
-    #Concat all elements in the lists    
-    xs = np.concatenate(xs)
-    treatment = np.concatenate(treatment)
-    timeunit = np.concatenate(timeunit)
-
-    #Open a pyper instance
-    r1 = pyper.R(use_pandas=True, RCMD=RCMD) 
-    r1.assign("xs", xs) 
-    #Transfer the vectors to R
-    r1.assign("treatment", treatment)
-    r1.assign("timeunit", timeunit)
+    Treatment and time unit are encoded only once and the response
+    variables are transferred to R in one binary file. If
+    `catch_errors` is True, the exception is returned instead of the
+    result for response variables for which the fit fails.
+    """
+    treatment = _factorize(treatment)
+    timeunit = _factorize(timeunit)
+    xsfile = None
+    if backend == "numpy":
+        func = lambda ii: _linmixmod_numpy(_summaries(xss[ii], aggregated),
+                                           treatment, timeunit)
+    elif aggregated:
+        raise ValueError("The aggregated mode requires backend 'numpy'")
+    elif backend == "R":
+        #The response variables are written to a binary file that R
+        #reads with "readBin".
+        fd, xsfile = tempfile.mkstemp(prefix="linmixmod_", suffix=".bin")
+        offsets = []
+        with os.fdopen(fd, "wb") as fobj:
+            for xs in xss:
+                offsets.append(fobj.tell())
+                for x in xs:
+                    np.asarray(x, dtype="<f8").tofile(fobj)
+        pool = get_session_pool(RCMD)
+        func = lambda ii: pool.Run(lambda r1: _linmixmod_r(
+                                            r1, xsfile, offsets[ii],
+                                            [len(x) for x in xss[ii]],
+                                            treatment, timeunit))
+    else:
+        raise ValueError("Unknown backend: {}".format(backend))
+
+    if catch_errors:
+        fit = func
+        def func(ii):
+            try:
+                return fit(ii)
+            except Exception as e:
+                return e
+
+    pool_size = None
+    if xsfile is not None and workers > pool.size:
+        # Keep the R sessions of all workers during the fits, but not
+        # afterwards.
+        pool_size = pool.size
+        pool.Resize(workers)
+    try:
+        if workers <= 1 or len(xss) == 1:
+            results = [func(ii) for ii in range(len(xss))]
+        else:
+            tpool = ThreadPool(processes=min(workers, len(xss)))
+            try:
+                results = tpool.map(func, range(len(xss)))
+            finally:
+                tpool.close()
+                tpool.join()
+    finally:
+        if xsfile is not None:
+            os.remove(xsfile)
+        if pool_size is not None:
+            pool.Resize(pool_size)
+    return results
+
+
+def _linmixmod_r(r1, xsfile, offset, counts, treatment, timeunit):
+    """ `linmixmod` in the R session `r1`
+    
+    The response variable is read from the binary file `xsfile`
+    starting at the byte `offset`. `treatment` and `timeunit` are
+    the levels and codes for each measurement (see `_factorize`).
+    Treatment and time unit are transferred as integer codes for
+    each measurement and expanded in R.
+    """
+    modelfunc="xs~treatment+(1+treatment|timeunit)"
+    nullmodelfunc = "xs~(1+treatment|timeunit)"
+
+    treatment_levels, treatment_codes = treatment
+    timeunit_levels, timeunit_codes = timeunit
+    r1.assign("counts", np.array(counts, dtype=int))
+    r1.assign("treatment_codes", treatment_codes)
+    r1.assign("treatment_levels", treatment_levels)
+    r1.assign("timeunit_codes", timeunit_codes)
+    r1.assign("timeunit_levels", timeunit_levels)
+    r1('xscon = file("{}", "rb")'.format(xsfile.replace("\\", "/")))
+    r1('seek(xscon, {:d})'.format(offset))
+    r1('xs = readBin(xscon, what="double", n=sum(counts), size=8, '
+       'endian="little")')
+    r1('close(xscon)')
+    r1("treatment = factor(rep(treatment_codes, counts), "
+       "levels=seq_along(treatment_levels), labels=treatment_levels)")
+    r1("timeunit = factor(rep(timeunit_codes, counts), "
+       "levels=seq_along(timeunit_levels), labels=timeunit_levels)")
     #Create a dataframe which contains all the data
     r1("RTDC=data.frame(xs,treatment,timeunit)")
-    #Load the necessary library for Linear Mixed Models    
-    lme4resp = r1("library(lme4)") 
-    if lme4resp.count("Error"):
-        # Tell the user that something went wrong
-        raise OSError("R installation at {}: {}\n".format(RCMD, lme4resp)+
-              """Please install 'lme4' via:
-              {} -e "install.packages('lme4', repos='http://cran.r-project.org')
-              """.format(RCMD)
-                      )
-
     #Random intercept and random slope model
     r1("Model = lmer("+modelfunc+",RTDC)")
     r1("NullModel = lmer("+nullmodelfunc+",RTDC)")
+    #"anova" from R does a likelihood ratio test which gives a
+    #p-Value
     r1("Anova = anova(Model,NullModel)")
-    Model_string = r1("summary(Model)")
-    #Delete some first characters made by R
-    Model_string= Model_string[23:]
-    #in case you prefer a dict for the Model output, do:
-    #Model_dict = np.array(r1.get("summary(Model)")) 
-    Anova_string = r1("Anova")
-    Anova_string = Anova_string[14:]
-    #Anova_dict = np.array(r1.get("Anova"))
-    Coef_string = r1("coef(Model)")
-    Coef_string = Coef_string[20:]
-    #"anova" from R does a likelihood ratio test which gives a p-Value 
-    p = np.array(r1.get("Anova$Pr[2]"))
-
-    #Obtain p-Value using a normal approximation
-    #Extract coefficients
+    #Coefficients with p-Values from a normal approximation
     r1("coefs <- data.frame(coef(summary(Model)))")   
     r1("coefs$p.normal=2*(1-pnorm(abs(coefs$t.value)))")
+    #Estimate and Std Error of treatment 1, change of the
+    #Estimate due to treatment 2 ("Fixed Effect") and its Std
+    #Error, and the p-Value of the likelihood ratio test
+    values = r1.get("as.numeric(c(coefs[1,1], coefs[1,2], "
+                    "coefs[2,1], coefs[2,2], Anova$Pr[2]))")
+    Estimate, StdErrorEstimate, FixedEffect, StdErrorFixEffect, p \
+        = np.array(values, dtype=float)
+    
+    Model_string = _r_output(r1, "summary(Model)")
+    Coef_string = _r_output(r1, "coef(Model)")
+    Anova_string = _r_output(r1, "Anova")
+
+    results = {"Full Summary":"LINEAR MIXED MODEL: \n " +
+               Model_string +
+               "\nFULL COEFFICIENT TABLE:\n" + Coef_string + 
+               "\nLIKELIHOOD RATIO TEST (MODEL VS.  NULLMODEL): \n" + 
+               Anova_string,
+               "p-Value (Likelihood Ratio Test)" : p,
+               "Estimate":Estimate,
+               "Std. Error (Estimate)":StdErrorEstimate,
+               "Fixed Effect":FixedEffect,
+               "Std. Error (Fixed Effect)":StdErrorFixEffect}
+    return results
+
+
+def _factorize(labels):
+    """ Sorted unique labels and the 1-based index of each label """
+    levels = sorted(set(labels))
+    codes = np.array([levels.index(l)+1 for l in labels], dtype=int)
+    return levels, codes
+
+
+def _r_output(r1, expression):
+    """ The printed output of an R expression as a string """
+    return r1.get('paste(capture.output(print({})), collapse="\\n")'.format(
+                                                                  expression))
+
+
+def _linmixmod_numpy(summaries, treatment, timeunit):
+    """ `linmixmod` with NumPy and SciPy
+    
+    `summaries` are the number of events, the means, and the sums
+    of squares of the measurements (see `_summaries`). `treatment`
+    and `timeunit` are the levels and codes for each measurement
+    (see `_factorize`).
+    """
+    treatment_levels, treatment_codes = treatment
+    timeunit_levels, timeunit_codes = timeunit
+    k = len(treatment_levels)
+    if k < 2:
+        raise ValueError("Please define at least two different treatments")
+    groups, yty, n, center = _lmm_design(summaries, treatment_codes,
+                                         timeunit_codes, k,
+                                         len(timeunit_levels))
+
+    model = _lmm_fit(groups, k, yty, n, reml=True)
+    model_ml, nullmodel_ml, chisq = _lmm_lrt(groups, k, yty, n)
+    p = stats.chi2.sf(chisq, k-1)
+
+    beta = model["beta"].copy()
+    beta[0] += center
+    stderr = np.sqrt(np.diag(model["sigma2"]*np.linalg.inv(model["XtX"])))
+    
+    # Summary
+    names = ["(Intercept)"] + [ "treatment{}".format(l)
+                                for l in treatment_levels[1:] ]
+    cov = model["sigma2"] * model["L"].dot(model["L"].T)
+    sd = np.sqrt(np.diag(cov))
+    lines = ["Linear mixed model fit by REML (NumPy/SciPy)",
+             "Formula: xs ~ treatment + (1 + treatment | timeunit)",
+             "",
+             "REML criterion at convergence: {:.4f}".format(
+                                                        model["deviance"]),
+             "",
+             "Random effects:",
+             " {:<10} {:<22} {:>12} {:>10}".format("Groups", "Name",
+                                                  "Variance", "Std.Dev.")]
+    for ii in range(k):
+        lines.append(" {:<10} {:<22} {:>12.4f} {:>10.4f}".format(
+                     "timeunit" if ii == 0 else "", names[ii], cov[ii, ii],
+                     sd[ii]))
+    lines.append(" {:<10} {:<22} {:>12.4f} {:>10.4f}".format(
+                 "Residual", "", model["sigma2"], np.sqrt(model["sigma2"])))
+    if np.all(sd > 0):
+        corr = cov / np.outer(sd, sd)
+        for ii in range(1, k):
+            lines.append(" Correlation ({}, {}): {:.3f}".format(
+                         names[0], names[ii], corr[0, ii]))
+    lines += ["Number of obs: {}, groups: timeunit, {}".format(
+              n, len(timeunit_levels)),
+              "",
+              "Fixed effects:",
+              " {:<22} {:>12} {:>12} {:>8}".format("", "Estimate",
+                                                  "Std. Error", "t value")]
+    for ii in range(k):
+        lines.append(" {:<22} {:>12.4f} {:>12.4f} {:>8.3f}".format(
+                     names[ii], beta[ii], stderr[ii], beta[ii]/stderr[ii]))
+    Model_string = "\n".join(lines)
+    
+    anova = [" {:<10} {:>5} {:>10} {:>10} {:>10} {:>10} {:>8} {:>4} "
+             "{:>10}".format("", "Df", "AIC", "BIC", "logLik", "deviance",
+                             "Chisq", "Df", "Pr(>Chisq)")]
+    for name, fit in [("NullModel", nullmodel_ml), ("Model", model_ml)]:
+        npar = fit["npar"]
+        dev = fit["deviance"]
+        row = " {:<10} {:>5} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+              name, npar, dev+2*npar, dev+npar*np.log(n), -dev/2, dev)
+        if name == "Model":
+            row += " {:>8.4f} {:>4} {:>10.4g}".format(chisq, k-1, p)
+        anova.append(row)
+    Anova_string = "\n".join(anova)
 
-    #p_normal = np.array(r1.get("coefs$p.normal"))
-    #p_normal = p_normal[1]
-    
-    # Convert to array, depending on platform or R version, this is a DataFrame
-    # or a numpy array, so we convert it to an array. Because on Windows the
-    # result is an array with subarrays of type np.void, we must access the
-    # elements with Coeffs[0][0] instead of Coeffs[0,0].
-    Coeffs = np.array(r1.get("coefs"))
-    #The Average value of treatment 1
-    Estimate = Coeffs[0][0]
-    #The Std Error of the average value of treatment 1    
-    StdErrorEstimate = Coeffs[0][1]
-    #treatment 2 leads to a change of the Estimate by the value "FixedEffect"
-    FixedEffect = Coeffs[1][0]   
-    StdErrorFixEffect = Coeffs[1][1]
-   
-    results = {"Full Summary":"LINEAR MIXED MODEL: \n " + Model_string+ 
-    "\nFULL COEFFICIENT TABLE:\n" + Coef_string + 
-    "\nLIKELIHOOD RATIO TEST (MODEL VS.  NULLMODEL): \n" + 
-    Anova_string,"p-Value (Likelihood Ratio Test)" : p,
-    "Estimate":Estimate,"Std. Error (Estimate)":StdErrorEstimate,
-    "Fixed Effect":FixedEffect,"Std. Error (Fixed Effect)":StdErrorFixEffect}
+    results = {"Full Summary":"LINEAR MIXED MODEL: \n " + Model_string +
+               "\nLIKELIHOOD RATIO TEST (MODEL VS.  NULLMODEL): \n" + 
+               Anova_string,
+               "p-Value (Likelihood Ratio Test)" : p,
+               "Estimate": beta[0],
+               "Std. Error (Estimate)": stderr[0],
+               "Fixed Effect": beta[1],
+               "Std. Error (Fixed Effect)": stderr[1]}
     return results
+
+
+def summarize(x, mask=None, chunk_size=2**20):
+    """ Summary of the response variables of one measurement
+    
+    Parameters
+    ----------
+    x: 1D ndarray
+        The response variables (e.g. `mm.area_um`).
+    mask: 1D boolean ndarray or None
+        Only use the events where `mask` is True (e.g. `mm._filter`).
+    chunk_size: int
+        The events are processed in chunks of this size, such that
+        the required memory does not depend on the number of events.
+    
+    Returns
+    -------
+    count, mean, ss: int, float, float
+        Number of events, mean, and sum of squared deviations from
+        the mean (see `aggregated` in `linmixmod`).
+    """
+    count = 0
+    mean = 0.
+    ss = 0.
+    for start in range(0, len(x), chunk_size):
+        chunk = np.asarray(x[start:start+chunk_size], dtype=float)
+        if mask is not None:
+            chunk = chunk[mask[start:start+chunk_size]]
+        if chunk.size == 0:
+            continue
+        # combine the mean and the sum of squares of the chunk
+        # with those of the previous chunks (Chan et al.)
+        cmean = np.mean(chunk)
+        delta = cmean - mean
+        total = count + chunk.size
+        ss += np.sum((chunk-cmean)**2) + delta**2*count*chunk.size/total
+        mean += delta*chunk.size/total
+        count = total
+    return count, mean, ss
+
+
+def _summaries(xs, aggregated=False):
+    """ Number of events, mean, and sum of squared deviations from
+    the mean for each measurement
+    
+    If `aggregated` is True, `xs` already contains these values for
+    each measurement (see `summarize`).
+    """
+    if not aggregated:
+        xs = [ summarize(x) for x in xs ]
+    counts = np.array([ s[0] for s in xs ], dtype=int)
+    means = np.array([ s[1] for s in xs ], dtype=float)
+    ss = np.array([ s[2] for s in xs ], dtype=float)
+    return counts, means, ss
+
+
+def _lmm_design(summaries, treatment_codes, timeunit_codes, k, G):
+    """ Cross products of the design and the response (see `_lmm_fit`)
+    
+    Parameters
+    ----------
+    summaries : tuple of 1D ndarrays
+        Number of events, mean, and sum of squares for each
+        measurement (see `_summaries`).
+    treatment_codes, timeunit_codes : 1D ndarrays
+        Treatment and time unit of each measurement (see `_factorize`).
+    k, G : int
+        Number of treatments and time units.
+    
+    Returns
+    -------
+    groups, yty, n :
+        See `_lmm_fit`.
+    center : float
+        The mean of all events that was subtracted from the response.
+    """
+    counts, means, ss = summaries
+    n = np.sum(counts)
+    # The data are centered to avoid loss of precision in the sums
+    # of squares (only the intercept changes).
+    center = np.sum(counts*means) / n
+    dev = means - center
+    yty = np.sum(ss) + np.sum(counts*dev**2)
+    # One row of the design matrix (intercept and treatment contrasts)
+    # for each measurement. The fixed effects design X is the same as
+    # the random effects design Z of each time unit for the model and
+    # the first column of it for the null model.
+    groups = []
+    for g in range(1, G+1):
+        ZtZ = np.zeros((k, k))
+        Zty = np.zeros(k)
+        for ii in np.where(np.asarray(timeunit_codes) == g)[0]:
+            z = np.zeros(k)
+            z[0] = 1
+            z[treatment_codes[ii]-1] = 1
+            ZtZ += counts[ii] * np.outer(z, z)
+            Zty += counts[ii] * dev[ii] * z
+        groups.append((ZtZ, Zty))
+    return groups, yty, n, center
+
+
+def _lmm_lrt(groups, k, yty, n):
+    """ Likelihood ratio test with maximum likelihood fits
+    
+    Returns the fits of the model and the null model and the
+    likelihood ratio statistic.
+    """
+    model_ml = _lmm_fit(groups, k, yty, n, reml=False)
+    nullmodel_ml = _lmm_fit(groups, 1, yty, n, reml=False)
+    chisq = max(0, nullmodel_ml["deviance"] - model_ml["deviance"])
+    return model_ml, nullmodel_ml, chisq
+
+
+def _lmm_fit(groups, p, yty, n, reml=True):
+    """ Fit a linear mixed model by minimizing the profiled deviance
+    
+    Parameters
+    ----------
+    groups : list of tuples (ZtZ, Zty)
+        Cross products of the random effects design Z (k columns)
+        and the response for each level of the grouping factor.
+    p : int
+        The fixed effects design X consists of the first `p`
+        columns of Z.
+    yty : float
+        Sum of squares of the response.
+    n : int
+        Number of observations.
+    reml : bool
+        Minimize the REML criterion instead of the deviance.
+    
+    Returns
+    -------
+    fit : dict
+        The result of `_lmm_solve` at the optimum.
+    """
+    k = groups[0][0].shape[0]
+    rows, cols = np.tril_indices(k)
+    # The relative covariance factor is lower triangular with
+    # non-negative diagonal (starting at the identity, like lme4).
+    theta0 = np.array(rows == cols, dtype=float)
+    bounds = [ (0, None) if r == c else (None, None)
+               for r, c in zip(rows, cols) ]
+    func = lambda theta: _lmm_solve(theta, groups, p, yty, n, reml)["deviance"]
+    theta, _dev, _info = optimize.fmin_l_bfgs_b(func, theta0,
+                                                approx_grad=True,
+                                                bounds=bounds,
+                                                factr=10, pgtol=1e-10)
+    fit = _lmm_solve(theta, groups, p, yty, n, reml)
+    # fixed effects, covariance parameters, and residual variance
+    fit["npar"] = p + theta.size + 1
+    return fit
+
+
+def _lmm_solve(theta, groups, p, yty, n, reml):
+    """ Profiled deviance or REML criterion of a linear mixed model
+    
+    For the relative covariance factor given by `theta`, the
+    penalized least squares problem is solved block-wise for each
+    level of the grouping factor (see `_lmm_fit`).
+    """
+    k = groups[0][0].shape[0]
+    L = np.zeros((k, k))
+    L[np.tril_indices(k)] = theta
+    Xty = np.sum([ Zty[:p] for _ZtZ, Zty in groups ], axis=0)
+    # Schur complement of the random effects block
+    XtX = np.sum([ ZtZ[:p, :p] for ZtZ, _Zty in groups ], axis=0)
+    rhs = Xty.copy()
+    logdet = 0
+    blocks = []
+    for ZtZ, Zty in groups:
+        LtZtZ = L.T.dot(ZtZ)
+        cfac = linalg.cho_factor(LtZtZ.dot(L) + np.eye(k), lower=True)
+        logdet += 2*np.sum(np.log(np.diag(cfac[0])))
+        LtZtX = LtZtZ[:, :p]
+        LtZty = L.T.dot(Zty)
+        AinvX = linalg.cho_solve(cfac, LtZtX)
+        Ainvy = linalg.cho_solve(cfac, LtZty)
+        XtX -= LtZtX.T.dot(AinvX)
+        rhs -= LtZtX.T.dot(Ainvy)
+        blocks.append((AinvX, Ainvy, LtZty))
+    beta = np.linalg.solve(XtX, rhs)
+    # penalized residual sum of squares
+    pwrss = yty - beta.dot(Xty)
+    for AinvX, Ainvy, LtZty in blocks:
+        u = Ainvy - AinvX.dot(beta)
+        pwrss -= u.dot(LtZty)
+    if reml:
+        dof = n - p
+        logdet += np.linalg.slogdet(XtX)[1]
+    else:
+        dof = n
+    deviance = logdet + dof*(1 + np.log(2*np.pi*pwrss/dof))
+    return {"deviance": deviance,
+            "beta": beta,
+            "XtX": XtX,
+            "sigma2": pwrss/dof,
+            "L": L}
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" ShapeOut - persistent cache of batch filtering results
+
+The statistics of a measurement (see `shapeout.batch`) only depend
+on the contents of its files, the filter configuration, and the
+selected axes and statistical parameters. The results are stored
+in an SQLite database under a key computed from these, such that
+unchanged measurements do not have to be processed again.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+import dclab
+from dclab.polygon_filter import PolygonFilter
+
+from .hashcache import HashCache
+
+
+# Increment this if the table layout or the key changes
+RESULTCACHE_VERSION = 2
+
+
+class ResultCache(object):
+    def __init__(self, path):
+        """ Persistent cache of batch filtering results
+
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite database file. The file is created
+            if it does not exist. The hashes of the measurement files
+            are cached in the same file (see
+            `shapeout.hashcache.HashCache`).
+        """
+        self.path = path
+        self.hash_cache = HashCache(path)
+        self._init_database()
+
+
+    def _connect(self):
+        # A new connection is used for every transaction, such that
+        # the cache can be used from several threads and processes.
+        return sqlite3.connect(self.path, timeout=30)
+
+
+    def _init_database(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("""CREATE TABLE IF NOT EXISTS result_version (
+                                    version INTEGER)""")
+                row = conn.execute("SELECT version FROM result_version"
+                                   ).fetchone()
+                if row is None or row[0] != RESULTCACHE_VERSION:
+                    conn.execute("DROP TABLE IF EXISTS results")
+                    conn.execute("DELETE FROM result_version")
+                    conn.execute("INSERT INTO result_version VALUES (?)",
+                                 (RESULTCACHE_VERSION,))
+                conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                                    key TEXT PRIMARY KEY,
+                                    head TEXT,
+                                    row TEXT)""")
+        finally:
+            conn.close()
+
+
+    def Get(self, key):
+        """ The cached `(head, row)` of the statistics for `key` or None
+        """
+        conn = self._connect()
+        try:
+            data = conn.execute("SELECT head, row FROM results WHERE key=?",
+                                (key,)).fetchone()
+        finally:
+            conn.close()
+        if data is None:
+            return None
+        return json.loads(data[0]), json.loads(data[1])
+
+
+    def GetKey(self, tdms_file, settings):
+        """ The key of the results of a measurement
+
+        Parameters
+        ----------
+        tdms_file : str
+            Path to the tdms file.
+        settings : str
+            The canonical filter configuration, axes, and statistical
+            parameters (see `canonical_settings`).
+        """
+        hasher = hashlib.sha256()
+        for f in measurement_files(tdms_file):
+            if os.path.exists(f):
+                hasher.update(self.hash_cache.GetHash(f).encode("utf-8"))
+            else:
+                hasher.update(b"-")
+        hasher.update(settings.encode("utf-8"))
+        return hasher.hexdigest()
+
+
+    def Set(self, key, head, row):
+        """ Store the statistics `(head, row)` of a measurement
+
+        The columns that depend on the location of the measurement
+        (e.g. the tdms file and the title) must not be stored.
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO results (key, head, row) "
+                             "VALUES (?, ?, ?)",
+                             (key, json.dumps(head),
+                              json.dumps(row, default=_json_default)))
+        finally:
+            conn.close()
+
+
+
+def canonical_settings(filter_config, axes=None, columns=None):
+    """ A string that uniquely describes the settings of a batch run
+
+    The "Plotting" section of the configuration is ignored and
+    polygon filters are described by their axes and points instead
+    of their ids. The version of dclab is included, because it
+    computes the statistics.
+    """
+    cfg = copy.deepcopy(filter_config)
+    cfg.pop("Plotting", None)
+    fil = cfg.get("Filtering", {})
+    if "Polygon Filters" in fil:
+        polygons = []
+        for p in PolygonFilter.instances:
+            if p.unique_id in fil["Polygon Filters"]:
+                polygons.append([p.axes, p.points])
+        fil["Polygon Filters"] = polygons
+    settings = {"config": cfg,
+                "axes": axes,
+                "columns": columns,
+                "dclab": dclab.__version__}
+    return json.dumps(settings, sort_keys=True, default=_json_default)
+
+
+def measurement_files(tdms_file):
+    """ The tdms file and the ini files of a measurement """
+    fdir, name = os.path.split(tdms_file)
+    stem = os.path.join(fdir, name.split("_")[0])
+    return [tdms_file, stem+"_camera.ini", stem+"_para.ini"]
+
+
+def _json_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    else:
+        return "{}".format(obj)
@@ -0,0 +1,935 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" ShapeOut - RTDC_DataSet with lazily loaded data columns
+
+"""
+from __future__ import division, print_function, unicode_literals
+
+import atexit
+import copy
+import hashlib
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import os
+import struct
+import threading
+import uuid
+import warnings
+
+from nptdms import TdmsFile
+
+from dclab import rtdc_dataset
+from dclab.rtdc_dataset import obj2str
+from dclab.polygon_filter import PolygonFilter
+import dclab.definitions as dfn
+from dclab import config
+
+from .densitycache import DensityCache
+from .hashcache import HashCache
+from . import kde_methods
+from .tdms_index import TdmsIndex
+
+
+
+#: Densities of scatter and contour plots (see `RTDC_DataSet._kde`)
+density_cache = DensityCache()
+
+
+class RTDC_DataSet(rtdc_dataset.RTDC_DataSet):
+    def __init__(self, tdms_path=None, ddict=None, lazy=False,
+                 sort_index=False, hash_cache=None):
+        """ An RT-DC measurement with optional lazy column loading
+
+        Parameters
+        ----------
+        tdms_path : str
+            Path to a '.tdms' file.
+        ddict : dict
+            Dictionary with data columns (see
+            `dclab.rtdc_dataset.RTDC_DataSet`).
+        lazy : bool
+            If set to `True`, the data columns (e.g. `self.area`) are
+            only read from the tdms file when they are accessed for
+            the first time. Loaded columns are stored in the
+            column cache `self._columns`.
+        sort_index : bool
+            If set to `True`, box filters (e.g. "Area Min" and "Area
+            Max") are computed from a sorted index of the data column,
+            which makes changing the filter range of large data sets
+            fast. The index is computed when a column is filtered for
+            the first time. Monotonic columns (e.g. "Time") do not
+            require an index.
+        hash_cache : str or None
+            Path to a hash cache database (see
+            `shapeout.hashcache.HashCache`). If given, the hashes of
+            the measurement files (`self.file_hashes`) and the
+            identifier are taken from the hash cache, which stores
+            the hashes for other users of the cache (e.g.
+            `shapeout.resultcache.ResultCache`).
+
+        Notes
+        -----
+        The columns "area_um" and "time" are computed from the
+        columns "area" and "frame" with the pixel size and the frame
+        rate of the current configuration.
+        """
+        self._lazy = lazy and ddict is None
+        self._columns = {}
+        # axis -> summary of the data (see `GetAxisSummary`)
+        self._axis_summary = {}
+        self._use_sort_index = sort_index
+        # column -> argsort of the data (`None` for monotonic data)
+        self._sort_index = {}
+        # column -> current box filter range in the sorted data
+        self._filter_ranges = {}
+        # column -> token that changes when the data of the column
+        # change (see `_kde_key`)
+        self._column_version = {}
+
+        super(RTDC_DataSet, self).__init__(tdms_path=tdms_path, ddict=ddict)
+
+        if hash_cache is not None:
+            # Same as in `dclab.rtdc_dataset.RTDC_DataSet.__init__`,
+            # but with the hashes from the hash cache.
+            gethash = HashCache(hash_cache).GetHash
+            self.file_hashes = [(f, gethash(f)) for f, _h in self.file_hashes]
+            ihasher = hashlib.md5()
+            ihasher.update(obj2str(self.tdms_filename))
+            ihasher.update(obj2str(self.file_hashes))
+            self.identifier = ihasher.hexdigest()
+
+
+    def __getattr__(self, name):
+        # Only called if `name` is not found in `self.__dict__`.
+        if name in dfn.rdv and self.__dict__.get("_lazy", False):
+            if not name in self._columns:
+                self._columns[name] = self._load_column(name)
+            return self._columns[name]
+        raise AttributeError("'{}' object has no attribute '{}'".format(
+                             self.__class__.__name__, name))
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Open tdms files are not picklable
+        state.pop("_tdms_file", None)
+        return state
+
+
+    def _init_data_with_tdms(self, tdms_filename):
+        if not self._lazy:
+            super(RTDC_DataSet, self)._init_data_with_tdms(tdms_filename)
+            return
+        try:
+            self._tdms_index = TdmsIndex(tdms_filename)
+        except (NotImplementedError, IOError, struct.error):
+            # Not supported by `TdmsIndex`, load all data with nptdms.
+            self._lazy = False
+            super(RTDC_DataSet, self)._init_data_with_tdms(tdms_filename)
+            return
+        # time is always there
+        self._datalen = self._tdms_index.channel_length("Cell Track", "time")
+
+        # Fluorescence traces
+        self.traces = {}
+        traces_filename = tdms_filename[:-5]+"_traces.tdms"
+        if os.path.exists(traces_filename):
+            # Determine chunk size of traces from the FL1index column
+            sampleids = self._tdms_channel("Cell Track", "FL1index")
+            try:
+                traces_index = TdmsIndex(traces_filename)
+                get_trace = traces_index.channel_data
+            except (NotImplementedError, IOError, struct.error):
+                traces_file = TdmsFile(traces_filename)
+                get_trace = lambda g, c: traces_file.object(g, c).data
+            for group, ch in dfn.tr_data:
+                try:
+                    trdat = get_trace(group, ch)
+                except KeyError:
+                    pass
+                else:
+                    if trdat is not None:
+                        self.traces[ch] = np.split(trdat, sampleids[1:])
+
+        # Cell images (video) and contours are handled in the same
+        # way as for non-lazy data sets.
+        self._init_video_and_contours()
+
+
+    def _init_filters(self):
+        # Same as `dclab.rtdc_dataset.RTDC_DataSet._init_filters`,
+        # but without loading any data columns in lazy mode.
+        if self._lazy:
+            datalen = self._datalen
+        else:
+            datalen = self.time.shape[0]
+        inifilter = np.ones(datalen, dtype=bool)
+        self._plot_filter = inifilter.copy()
+        self._filter = inifilter.copy()
+        self._filter_manual = inifilter.copy()
+        self._filter_limit = inifilter.copy()
+        for attr in dfn.rdv:
+            setattr(self, "_filter_"+attr, inifilter.copy())
+        self._filter_polygon = inifilter.copy()
+        # Number of filter components (box filters, polygon filters,
+        # manual filter) that exclude each event (see `ApplyFilter`).
+        self._failed_filters = np.zeros(datalen, dtype=np.uint16)
+        # manual filter that is accounted for in `self._failed_filters`
+        self._filter_manual_applied = inifilter.copy()
+
+        self.SetConfiguration()
+
+
+    def _init_video_and_contours(self):
+        """ Find video file and load contours (see dclab) """
+        videos = [v for v in os.listdir(self.fdir) if v.endswith(".avi")]
+        meas_id = self.name.split("_")[0]
+        videos = [v for v in videos if v.split("_")[0] == meas_id]
+        videos.sort()
+        if len(videos) == 0:
+            self.video = None
+        else:
+            self.video = videos[0]
+            for v in videos:
+                if v.endswith("imag.avi") or v.endswith("imaq.avi"):
+                    self.video = v
+                    break
+
+        self.contours = {}
+        for f in os.listdir(self.fdir):
+            if f.endswith("_contours.txt") and f.startswith(self.name[:2]):
+                with open(os.path.join(self.fdir, f), "r") as c:
+                    cdat = c.read(-1)
+                for cont in cdat.split("Contour in frame"):
+                    cont = cont.strip()
+                    if len(cont) == 0:
+                        continue
+                    cont = cont.splitlines()
+                    frame = int(cont.pop(0))
+                    cont = [ np.fromstring(c.strip("()"), sep=",")
+                             for c in cont ]
+                    cont = np.array(cont, dtype=np.uint8)
+                    self.contours[frame] = cont
+
+
+    def _load_column(self, name):
+        """ Read a data column from the tdms file """
+        if name == "area_um":
+            return self._compute_area_um()
+        elif name == "time":
+            return self._compute_time()
+        group = dfn.tfd[dfn.rdv.index(name)]
+        table = group[0]
+        if isinstance(group[1], list):
+            channels = group[1]
+        else:
+            channels = [group[1]]
+        func = group[2]
+        args = []
+        try:
+            for ch in channels:
+                data = self._tdms_channel(table, ch)
+                if data is None:
+                    # Sometimes the column is empty. Fill it
+                    # with zeros:
+                    data = np.zeros(self._datalen)
+                args.append(data)
+        except KeyError:
+            # set it to zero
+            func = lambda x: x
+            args = [np.zeros(self._datalen)]
+        return func(*args)
+
+
+    def _compute_area_um(self):
+        area_um = np.zeros(self._datalen)
+        cfg = self.Configuration
+        if "Image" in cfg and "Pix Size" in cfg["Image"]:
+            if not np.allclose(self.area, 0):
+                area_um[:] = self.area * cfg["Image"]["Pix Size"]**2
+        return area_um
+
+
+    def _compute_time(self):
+        time = np.zeros(self._datalen)
+        cfg = self.Configuration
+        if "Framerate" in cfg and "Frame Rate" in cfg["Framerate"]:
+            # FR is in Hz
+            FR = cfg["Framerate"]["Frame Rate"]
+            time[:] = (self.frame - self.frame[0]) / FR
+        return time
+
+
+    def _tdms_channel(self, group, channel):
+        """ Data of a tdms channel (None if the channel is empty)
+
+        Falls back to nptdms for data types not supported by
+        `TdmsIndex`. Raises a `KeyError` if the channel does not exist.
+        """
+        try:
+            return self._tdms_index.channel_data(group, channel)
+        except NotImplementedError:
+            if not "_tdms_file" in self.__dict__:
+                self._tdms_file = TdmsFile(self.tdms_filename)
+            return self._tdms_file.object(group, channel).data
+
+
+    def _get_sort_index(self, attr):
+        """ Argsort of a data column (`None` if the data are monotonic) """
+        if not attr in self._sort_index:
+            data = getattr(self, attr)
+            # columns with NaN values are not monotonic
+            with np.errstate(invalid="ignore"):
+                monotonic = (not np.isnan(data).any() and
+                             np.all(data[1:] >= data[:-1]))
+            if monotonic:
+                self._sort_index[attr] = None
+            else:
+                self._sort_index[attr] = np.argsort(data, kind="mergesort")
+        return self._sort_index[attr]
+
+
+    def _reset_column_index(self, attr):
+        """ Reset summary and sort index after the data of a column changed
+        """
+        self._axis_summary.pop(dfn.cfgmap[attr], None)
+        self._sort_index.pop(attr, None)
+        self._filter_ranges.pop(attr, None)
+        self._column_version[attr] = uuid.uuid4().hex
+
+
+    def _update_box_filter(self, attr, vmin=None, vmax=None):
+        """ Update the box filter component of a data column
+
+        If `vmin` and `vmax` are `None`, the filter is disabled.
+
+        Returns
+        -------
+        events : slice, ndarray, or None
+            The events for which the box filter changed. If `None`
+            is returned, the events are not known (the entire filter
+            has to be recombined).
+        """
+        mask = getattr(self, "_filter_"+attr)
+        if vmin is None:
+            active = False
+        else:
+            active = True
+
+        if not self._use_sort_index:
+            if active:
+                data = getattr(self, attr)
+                new = (vmin <= data)*(data <= vmax)
+            else:
+                new = np.ones_like(mask)
+            self._update_filter_component(mask, new)
+            return None
+
+        # Range filtering with a sorted index: The events that pass
+        # the filter are located in the interval [lo, hi) of the
+        # sorted data.
+        size = mask.shape[0]
+        if active:
+            data = getattr(self, attr)
+            order = self._get_sort_index(attr)
+            lo = _bisect(data, order, vmin, "left")
+            hi = _bisect(data, order, vmax, "right")
+            # An inverted range (Min > Max) is empty.
+            hi = max(hi, lo)
+        else:
+            order = self._sort_index.get(attr, None)
+            lo, hi = 0, size
+
+        if not attr in self._filter_ranges:
+            new = np.zeros_like(mask)
+            new[_sorted_events(order, lo, hi)] = True
+            self._update_filter_component(mask, new)
+            self._filter_ranges[attr] = (lo, hi)
+            return None
+
+        # Only update events that entered or left the interval
+        lo0, hi0 = self._filter_ranges[attr]
+        excluded = [(lo0, min(hi0, lo)), (max(lo0, hi), hi0)]
+        included = [(lo, min(hi, lo0)), (max(lo, hi0), hi)]
+        events = []
+        for p0, p1 in excluded:
+            if p0 < p1:
+                ev = _sorted_events(order, p0, p1)
+                mask[ev] = False
+                self._failed_filters[ev] += 1
+                events.append(ev)
+        for p0, p1 in included:
+            if p0 < p1:
+                ev = _sorted_events(order, p0, p1)
+                mask[ev] = True
+                self._failed_filters[ev] -= 1
+                events.append(ev)
+        self._filter_ranges[attr] = (lo, hi)
+        return events
+
+
+    def _update_filter_component(self, old, new):
+        """ Set the filter component `old` to `new` in-place
+
+        Updates the number of failed filters for each event that is
+        included or excluded by the new filter component.
+        """
+        self._failed_filters += old & ~new
+        self._failed_filters -= new & ~old
+        old[:] = new
+
+
+    def ApplyFilter(self, force=[]):
+        """ Computes the filters for the data set
+
+        See `dclab.rtdc_dataset.RTDC_DataSet.ApplyFilter`.
+
+        Notes
+        -----
+        Each filter component (a min/max box filter of an axis, the
+        polygon filters, the manual filter) is stored separately
+        and the number of components that exclude an event is kept in
+        `self._failed_filters`. Only the components that changed are
+        recomputed and the combined filter `self._filter` is obtained
+        from the number of failed filters. Data columns are only
+        accessed if they are actually filtered (i.e. if their min and
+        max values differ).
+        """
+        if not "Filtering" in self.Configuration:
+            self.Configuration["Filtering"] = dict()
+
+        ## Determine which data was updated
+        FIL = self.Configuration["Filtering"]
+        OLD = self._old_filters
+
+        newkeys = list()
+        for skey in list(FIL.keys()):
+            if not skey in OLD:
+                OLD[skey] = None
+            if OLD[skey] != FIL[skey]:
+                newkeys.append(skey)
+
+        attr2update = list()
+        for k in newkeys:
+            # k[:-4] because we want to crop " Min" and " Max"
+            if k[:-4] in dfn.uid:
+                attr2update.append(dfn.cfgmaprev[k[:-4]])
+
+        if "deform" in attr2update:
+            attr2update.append("circ")
+        elif "circ" in attr2update:
+            attr2update.append("deform")
+
+        for f in force:
+            # Check if a correct variable is forced
+            if f in list(dfn.cfgmaprev.keys()):
+                attr2update.append(dfn.cfgmaprev[f])
+            else:
+                warnings.warn(
+                    "Unknown variable not force-filtered: {}".format(f))
+
+        # Events for which the filter changed. If these are not known,
+        # the entire filter is recombined.
+        changed = []
+        recombine = False
+        for key in ["Enable Filters", "Limit Events"]:
+            if key in newkeys:
+                recombine = True
+
+        # Box filters
+        for attr in np.unique(attr2update):
+            fstart = dfn.cfgmap[attr]+" Min"
+            fend = dfn.cfgmap[attr]+" Max"
+            if (fstart in FIL and
+                fend in FIL and
+                FIL[fstart] != FIL[fend]):
+                events = self._update_box_filter(attr, FIL[fstart],
+                                                 FIL[fend])
+            else:
+                events = self._update_box_filter(attr)
+            if events is None:
+                recombine = True
+            else:
+                changed += events
+
+        # Filter Polygons
+        pf_id = "Polygon Filters"
+        if (
+            (pf_id in FIL and not pf_id in OLD) or
+            (pf_id in FIL and pf_id in OLD and
+             FIL[pf_id] != OLD[pf_id])):
+            new = np.ones_like(self._filter)
+            for p in PolygonFilter.instances:
+                if p.unique_id in FIL["Polygon Filters"]:
+                    datax = getattr(self, dfn.cfgmaprev[p.axes[0]])
+                    datay = getattr(self, dfn.cfgmaprev[p.axes[1]])
+                    new *= p.filter(datax, datay)
+            self._update_filter_component(self._filter_polygon, new)
+            recombine = True
+
+        # Manual filter (edited in-place or replaced by the user)
+        if not np.all(self._filter_manual == self._filter_manual_applied):
+            self._update_filter_component(self._filter_manual_applied,
+                                          self._filter_manual)
+            recombine = True
+
+        if (not recombine and FIL["Enable Filters"] and
+            FIL["Limit Events"] == 0):
+            # Only update the events that changed
+            for ev in changed:
+                self._filter[ev] = self._failed_filters[ev] == 0
+            self._old_filters = copy.deepcopy(FIL)
+            return
+
+        self._filter_limit = np.ones_like(self._filter)
+
+        if FIL["Enable Filters"]:
+            self._filter[:] = self._failed_filters == 0
+
+            # Filter with configuration keyword argument "Limit Events"
+            if FIL["Limit Events"] > 0:
+                limit = FIL["Limit Events"]
+                incl = self._filter.copy()
+                numevents = np.sum(incl)
+                if limit < numevents:
+                    # Perform equally distributed removal of events
+                    remove = numevents - limit
+                    while remove > 10:
+                        there = np.where(incl)[0]
+                        dist = int(np.ceil(there.shape[0]/remove))
+                        incl[there[::dist]] = 0
+                        numevents = np.sum(incl)
+                        remove = numevents - limit
+                    there = np.where(incl)[0]
+                    incl[there[:remove]] = 0
+                    self._filter_limit = incl
+                elif limit > numevents:
+                    warnings.warn("{}: 'Limit Events' must not ".format(
+                                  self.name)+"be larger than length of "+
+                                  "data set! Resetting 'Limit Events'!")
+                    FIL["Limit Events"] = 0
+
+            self._filter *= self._filter_limit
+        else:
+            self._filter[:] = True
+
+        self._old_filters = copy.deepcopy(self.Configuration["Filtering"])
+
+
+    def GetAxisSummary(self, axis):
+        """ Summary of the data of an axis
+
+        Parameters
+        ----------
+        axis : str
+            Axis name from `dclab.definitions.uid`, e.g. "Area".
+
+        Returns
+        -------
+        summary : dict
+            See `summarize_column`.
+
+        Notes
+        -----
+        The summary is computed only once and it is reset when the
+        data of the axis change (e.g. "Area" when the pixel size is
+        changed). In lazy mode, columns that are loaded only for
+        computing the summary are not kept in the column cache.
+        """
+        if not axis in self._axis_summary:
+            loaded = list(self._columns.keys())
+            data = getattr(self, dfn.cfgmaprev[axis])
+            self._axis_summary[axis] = summarize_column(data)
+            for key in list(self._columns.keys()):
+                if not key in loaded:
+                    self._columns.pop(key)
+        return self._axis_summary[axis]
+
+
+    def GetKDE_Contour(self, yax="Defo", xax="Area", levels=None,
+                       accuracy=1):
+        """ The evaluated Gaussian Kernel Density Estimate
+
+        -> for contours
+
+        See `dclab.rtdc_dataset.RTDC_DataSet.GetKDE_Contour`. The
+        "KDE" plotting option may also name one of the methods in
+        `shapeout.kde_methods` (e.g. "Binned"). The densities are
+        stored in `density_cache`. If the contour `levels` are given,
+        the grid is refined adaptively (see `compute_contours`).
+
+        See Also
+        --------
+        `compute_contours` : contours of several measurements in
+                             parallel
+        """
+        return compute_contours([self], yax=yax, xax=xax, workers=1,
+                                levels=levels, accuracy=accuracy)[0]
+
+
+    def GetKDE_Scatter(self, yax="Defo", xax="Area", positions=None):
+        """ The evaluated Gaussian Kernel Density Estimate
+
+        -> for scatter plots
+
+        See `dclab.rtdc_dataset.RTDC_DataSet.GetKDE_Scatter`. The
+        "KDE" plotting option may also name one of the methods in
+        `shapeout.kde_methods` (e.g. "Binned"). The densities are
+        stored in `density_cache`.
+        """
+        x, y = self._kde_events(xax, yax)
+
+        if positions is None:
+            posx = None
+            posy = None
+            output = ("scatter", None)
+        else:
+            posx = positions[0]
+            posy = positions[1]
+            hasher = hashlib.md5()
+            hasher.update(np.ascontiguousarray(posx, dtype=float))
+            hasher.update(np.ascontiguousarray(posy, dtype=float))
+            output = ("scatter", hasher.hexdigest())
+
+        if len(x) != 0:
+            density = self._kde(x, y, posx, posy, xax, yax, output)
+        else:
+            density = []
+        return density
+
+
+    def _kde_events(self, xax, yax):
+        """ The (filtered) events for kernel density estimation """
+        x = getattr(self, dfn.cfgmaprev[xax])
+        y = getattr(self, dfn.cfgmaprev[yax])
+        if self.Configuration["Filtering"]["Enable Filters"]:
+            x = x[self._filter]
+            y = y[self._filter]
+        return x, y
+
+
+    def _kde_key(self, xax, yax):
+        """ The key of the densities of the current events and the
+        current KDE settings in `density_cache`
+        """
+        kde_type = self.Configuration["Plotting"]["KDE"].lower()
+        if kde_type == "multivariate":
+            bwx = self.Configuration["Plotting"]["KDE Multivariate "+xax]
+            bwy = self.Configuration["Plotting"]["KDE Multivariate "+yax]
+            bw = (bwx, bwy)
+        else:
+            bw = None
+        if self.Configuration["Filtering"]["Enable Filters"]:
+            filter_digest = hashlib.md5(np.packbits(self._filter)
+                                        ).hexdigest()
+        else:
+            filter_digest = None
+        versions = tuple([ self._column_version.get(dfn.cfgmaprev[ax])
+                           for ax in [xax, yax] ])
+        return (self.identifier, xax, yax, versions, filter_digest,
+                kde_type, bw)
+
+
+    def _kde(self, x, y, xout, yout, xax, yax, output):
+        """ The density at (xout, yout) from `density_cache`
+
+        `output` identifies (xout, yout) in the cache key. The grids
+        of the binned KDE methods (see `kde_methods.kde_grid`) are
+        cached as well, such that they are shared by scatter and
+        contour plots.
+        """
+        key = self._kde_key(xax, yax)
+        density = density_cache.Get(key+output)
+        if density is None:
+            grid = density_cache.Get(key+("grid",))
+            _ii, density, grid = _compute_kde((0, key[5], key[6], x, y,
+                                               xout, yout, grid, None))
+            _cache_kde(key, output, density, grid)
+        return density
+
+
+    def UpdateConfiguration(self, newcfg):
+        """ Update current configuration `self.Configuration`
+
+        See `dclab.rtdc_dataset.RTDC_DataSet.UpdateConfiguration`.
+        In lazy mode, the derived columns "area_um" and "time" are
+        only recomputed if they have already been loaded.
+        """
+        # data of derived columns change
+        if "Image" in newcfg and "Pix Size" in newcfg["Image"]:
+            self._reset_column_index("area_um")
+        if "Framerate" in newcfg and "Frame Rate" in newcfg["Framerate"]:
+            self._reset_column_index("time")
+
+        if not self._lazy:
+            super(RTDC_DataSet, self).UpdateConfiguration(newcfg)
+            return
+        force = []
+        if "Image" in newcfg and "Pix Size" in newcfg["Image"]:
+            update = "area_um"
+            force.append("Area")
+        elif "Framerate" in newcfg and "Frame Rate" in newcfg["Framerate"]:
+            update = "time"
+            force.append("Time")
+        else:
+            update = None
+
+        config.update_config_dict(self.Configuration, newcfg)
+
+        if update in self._columns:
+            self._columns[update][:] = self._load_column(update)
+
+        if "Filtering" in newcfg:
+            self.ApplyFilter(force=force)
+
+        self.Configuration["General"]["Cell Number"] = self._datalen
+
+
+
+def compute_contours(measurements, yax="Defo", xax="Area", workers=0,
+                     worker_type="process", levels=None, accuracy=1):
+    """ Contour densities of several measurements, optionally in parallel
+
+    Parameters
+    ----------
+    measurements : list of RTDC_DataSet
+        The measurements.
+    xax, yax : str
+        Identifiers for the X and Y axes (e.g. "Area", "Defo"). If
+        set to None, the plotting axes of each measurement are used.
+    workers : int
+        Number of workers. If set to 1, the densities are computed
+        sequentially. If set to 0, one worker per CPU is used.
+    worker_type : str
+        Either "process" or "thread".
+    levels : list of floats in interval (0,1) or None
+        The contour levels relative to the maximum density. If given,
+        the density is evaluated on a coarse grid first and only the
+        cells that are crossed by the contour lines are refined (see
+        `kde_methods.contour_density`). The contour lines are the
+        same, but the density is evaluated at fewer points.
+    accuracy : float
+        Factor for the "Contour Accuracy" settings of the measurements
+        (e.g. 0.25 for a four times finer grid).
+
+    Returns
+    -------
+    contours : list of tuples (X, Y, Z)
+        The kernel density Z evaluated on a rectangular grid (X, Y)
+        for each measurement (see `RTDC_DataSet.GetKDE_Contour`).
+
+    Notes
+    -----
+    Densities in `density_cache` are not computed again and densities
+    of measurements with a cached grid are evaluated in the calling
+    thread. Only the measurements that need a full kernel density
+    estimate are passed to the workers (see `get_worker_pool`). The
+    results are stored in `density_cache` from the calling thread.
+    """
+    if not worker_type in ["process", "thread"]:
+        raise ValueError("Unknown worker type: {}".format(worker_type))
+    contours = [None]*len(measurements)
+    keys = {}
+    tasks = []
+    results = []
+    for ii, mm in enumerate(measurements):
+        if xax is None or yax is None:
+            mxax, myax = mm.GetPlotAxes()
+        else:
+            mxax, myax = xax, yax
+        x, y = mm._kde_events(mxax, myax)
+        deltax = mm.Configuration["Plotting"]["Contour Accuracy "+mxax]
+        deltay = mm.Configuration["Plotting"]["Contour Accuracy "+myax]
+        deltax *= accuracy
+        deltay *= accuracy
+        xlin = np.arange(x.min(), x.max(), deltax)
+        ylin = np.arange(y.min(), y.max(), deltay)
+        xmesh, ymesh = np.meshgrid(xlin, ylin)
+
+        key = mm._kde_key(mxax, myax)
+        if levels is None:
+            output = ("contour", deltax, deltay)
+        else:
+            output = ("contour", deltax, deltay, tuple(levels))
+        keys[ii] = key, output
+        density = density_cache.Get(key+output)
+        if density is None:
+            grid = density_cache.Get(key+("grid",))
+            task = (ii, key[5], key[6], x, y, xmesh, ymesh, grid, levels)
+            if grid is None:
+                tasks.append(task)
+            else:
+                results.append(_compute_kde(task))
+        contours[ii] = (xmesh, ymesh, density)
+
+    if workers == 0:
+        workers = mp.cpu_count()
+    if min(workers, len(tasks)) <= 1:
+        results += [ _compute_kde(t) for t in tasks ]
+    else:
+        pool = get_worker_pool(workers, worker_type)
+        results += pool.map(_compute_kde, tasks, chunksize=1)
+
+    for ii, density, grid in results:
+        key, output = keys[ii]
+        _cache_kde(key, output, density, grid)
+        contours[ii] = contours[ii][:2] + (density,)
+    return contours
+
+
+_worker_pools = {}
+_worker_pools_lock = threading.Lock()
+
+def get_worker_pool(workers, worker_type="process"):
+    """ A persistent pool of workers for `compute_contours`
+
+    Starting a pool of processes takes much longer than most density
+    computations. The pools are reused in subsequent calls (e.g. on
+    every filter change in the GUI) and terminated on exit.
+
+    Parameters
+    ----------
+    workers : int
+        Number of workers.
+    worker_type : str
+        Either "process" or "thread".
+    """
+    if not worker_type in ["process", "thread"]:
+        raise ValueError("Unknown worker type: {}".format(worker_type))
+    with _worker_pools_lock:
+        if not (worker_type, workers) in _worker_pools:
+            if worker_type == "process":
+                pool = mp.Pool(processes=workers)
+            else:
+                pool = ThreadPool(processes=workers)
+            _worker_pools[(worker_type, workers)] = pool
+        return _worker_pools[(worker_type, workers)]
+
+
+@atexit.register
+def _close_worker_pools():
+    with _worker_pools_lock:
+        pools = list(_worker_pools.values())
+        _worker_pools.clear()
+    for pool in pools:
+        pool.terminate()
+        pool.join()
+
+
+def _compute_kde(args):
+    """ Kernel density estimate (must be picklable)
+
+    `args` are `(ii, kde_type, bw, x, y, xout, yout, grid, levels)`,
+    where `grid` is a cached grid (see `kde_methods.kde_grid`) or None
+    and `levels` are the contour levels for adaptive refinement of
+    the grid (xout, yout) or None. Returns `(ii, density, grid)`.
+    """
+    ii, kde_type, bw, x, y, xout, yout, grid, levels = args
+    size = None if xout is None else np.size(xout)
+    if not kde_methods.uses_grid(kde_type, x, size):
+        # same estimator as `kde_methods.kde_multivariate`
+        grid = None
+    elif grid is None:
+        grid = kde_methods.kde_grid(kde_type, x, y, bw=bw, size=size)
+    if grid is not None:
+        density_fct = grid.evaluate
+    else:
+        kde_fct = getattr(kde_methods, "kde_"+kde_type)
+        def density_fct(xo, yo):
+            kde_kwargs = {"events_x": x,
+                          "events_y": y,
+                          "xout": xo,
+                          "yout": yo}
+            if kde_type == "multivariate":
+                # the grid is not used (see `kde_methods.kde_grid`)
+                kde_kwargs["bw"] = list(bw)
+                kde_kwargs["tol"] = 0
+            return kde_fct(**kde_kwargs)
+    if xout is None:
+        xout = x
+        yout = y
+    if levels is None:
+        density = density_fct(xout, yout)
+    else:
+        density, _evaluations = kde_methods.contour_density(
+                                    density_fct, xout[0], yout[:, 0], levels)
+    return ii, density, grid
+
+
+def _cache_kde(key, output, density, grid):
+    if grid is not None:
+        density_cache.Set(key+("grid",), grid)
+    density_cache.Set(key+output, density)
+
+
+def _bisect(data, order, value, side="left"):
+    """ Position of `value` in the data sorted with `order`
+
+    Same as `np.searchsorted(data[order], value, side)` without
+    creating a sorted copy of the data. If `order` is `None`, the
+    data are already sorted. NaN values are sorted to the end.
+    """
+    if order is None:
+        return int(np.searchsorted(data, value, side=side))
+    lo = 0
+    hi = order.shape[0]
+    while lo < hi:
+        mid = (lo+hi)//2
+        item = data[order[mid]]
+        if item < value or (side == "right" and item == value):
+            lo = mid+1
+        else:
+            hi = mid
+    return lo
+
+
+def _sorted_events(order, start, stop):
+    """ Indices of the events at the positions [start, stop) in the
+    sorted data (`order` is `None` for sorted data)
+    """
+    if order is None:
+        return slice(start, stop)
+    else:
+        return order[start:stop]
+
+
+def axis_summary(mm, axis):
+    """ Summary of the data of an axis of a measurement
+
+    Uses the cached summary of `RTDC_DataSet.GetAxisSummary` and
+    falls back to `summarize_column` for other data sets.
+    """
+    if isinstance(mm, RTDC_DataSet):
+        return mm.GetAxisSummary(axis)
+    else:
+        return summarize_column(getattr(mm, dfn.cfgmaprev[axis]))
+
+
+def summarize_column(data):
+    """ Summary of a data column
+
+    Returns
+    -------
+    summary : dict
+        Dictionary with the keys
+        - "present": `False` if all values are zero
+        - "min", "max": minimum and maximum of the finite values
+          (`np.nan` if there are no finite values)
+        - "finite": number of finite values
+    """
+    finite = np.isfinite(data)
+    numfinite = int(np.sum(finite))
+    if numfinite == data.shape[0]:
+        dfinite = data
+    else:
+        dfinite = data[finite]
+    if numfinite:
+        vmin = float(np.min(dfinite))
+        vmax = float(np.max(dfinite))
+    else:
+        vmin = vmax = np.nan
+    return {"present": bool(np.any(data != 0)),
+            "min": vmin,
+            "max": vmax,
+            "finite": numfinite}
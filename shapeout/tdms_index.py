@@ -0,0 +1,328 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" ShapeOut - segment index of tdms files
+
+Only the lead-in and the metadata of the segments of a tdms file are
+read when a `TdmsIndex` is created. The raw data of a channel is read
+from the file on request, which allows to load single columns of large
+RT-DC measurements.
+
+The file format is described in
+http://www.ni.com/white-paper/5696/en/
+"""
+from __future__ import division, print_function, unicode_literals
+
+import numpy as np
+import os
+import struct
+
+
+# Flags of the table of contents (ToC) of a segment
+TOC_METADATA = 1 << 1
+TOC_NEW_OBJ_LIST = 1 << 2
+TOC_RAW_DATA = 1 << 3
+TOC_INTERLEAVED = 1 << 5
+TOC_BIG_ENDIAN = 1 << 6
+TOC_DAQMX_RAW_DATA = 1 << 7
+
+# Raw data index values with a special meaning
+NO_RAW_DATA = 0xFFFFFFFF
+SAME_RAW_DATA_INDEX = 0x00000000
+DAQMX_FORMAT_CHANGING_SCALER = 0x00001269
+DAQMX_DIGITAL_LINE_SCALER = 0x00001369
+
+# tdms data types that can be read as numpy arrays
+TDMS_DTYPES = {
+    0x01: "i1",
+    0x02: "i2",
+    0x03: "i4",
+    0x04: "i8",
+    0x05: "u1",
+    0x06: "u2",
+    0x07: "u4",
+    0x08: "u8",
+    0x09: "f4",
+    0x0A: "f8",
+    0x19: "f4", # single float with unit
+    0x1A: "f8", # double float with unit
+    0x21: "?",
+    }
+
+# Sizes of the other tdms data types in bytes
+TDMS_SIZES = {
+    0x00: 0,  # void
+    0x0B: 16, # extended float
+    0x1B: 16, # extended float with unit
+    0x44: 16, # time stamp
+    0x08000C: 8,  # complex single float
+    0x10000D: 16, # complex double float
+    }
+
+TDMS_STRING = 0x20
+
+
+class TdmsIndex(object):
+    def __init__(self, path):
+        """ Index of the raw data of all channels in a tdms file
+
+        Parameters
+        ----------
+        path : str
+            Path to the tdms file.
+
+        Notes
+        -----
+        Reading data of channels that are stored as strings,
+        time stamps, or DAQmx raw data is not supported.
+        """
+        self.path = path
+        # object path -> list of (file offset, number of values, stride)
+        self._chunks = {}
+        # object path -> tdms data type
+        self._dtypes = {}
+        # all object paths, including objects without raw data
+        self._objects = set()
+        self._read_segments()
+
+
+    def _read_segments(self):
+        """ Read the lead-in and metadata of all segments
+
+        If an index file (".tdms_index") exists, the segment
+        information is read from the index file, which does not
+        contain any raw data.
+        """
+        fsize = os.path.getsize(self.path)
+        index_path = self.path + "_index"
+        if os.path.exists(index_path):
+            source = index_path
+            tag = b"TDSh"
+        else:
+            source = self.path
+            tag = b"TDSm"
+        ssize = os.path.getsize(source)
+        # raw data index information of the last segment
+        objects = []
+        indices = {}
+        with open(source, "rb") as fd:
+            # segment offsets in the source and in the tdms file
+            soffset = 0
+            offset = 0
+            while soffset + 28 <= ssize:
+                fd.seek(soffset)
+                leadin = fd.read(28)
+                if leadin[:4] != tag:
+                    raise IOError("Not a tdms segment at byte {} in {}"
+                                  .format(soffset, source))
+                toc, _version, next_offset, data_offset = \
+                                        struct.unpack(b"<IIQQ", leadin[4:])
+                endian = ">" if toc & TOC_BIG_ENDIAN else "<"
+                data_start = offset + 28 + data_offset
+                if next_offset == 0xFFFFFFFFFFFFFFFF:
+                    # incomplete last segment
+                    segment_end = fsize
+                else:
+                    # Values beyond the end of a truncated file are
+                    # zero (same behavior as nptdms).
+                    segment_end = offset + 28 + next_offset
+
+                if toc & TOC_METADATA:
+                    if toc & TOC_NEW_OBJ_LIST:
+                        objects = []
+                    else:
+                        objects = list(objects)
+                    meta = fd.read(data_offset)
+                    self._read_metadata(meta, endian, objects, indices)
+
+                if toc & TOC_RAW_DATA:
+                    self._index_raw_data(objects, indices, endian,
+                                         start=data_start,
+                                         size=segment_end-data_start,
+                                         interleaved=toc & TOC_INTERLEAVED,
+                                         daqmx=toc & TOC_DAQMX_RAW_DATA)
+                offset = segment_end
+                if source == index_path:
+                    # index files only contain lead-in and metadata
+                    soffset += 28 + data_offset
+                else:
+                    soffset = segment_end
+
+
+    def _read_metadata(self, meta, endian, objects, indices):
+        """ Update `objects` and `indices` with the segment metadata """
+        pos = [0]
+
+        def unpack(fmt):
+            fmt = str(endian+fmt)
+            size = struct.calcsize(fmt)
+            value = struct.unpack(fmt, meta[pos[0]:pos[0]+size])
+            pos[0] += size
+            return value[0]
+
+        def read_string():
+            length = unpack("I")
+            value = meta[pos[0]:pos[0]+length].decode("utf-8")
+            pos[0] += length
+            return value
+
+        num_objects = unpack("I")
+        for _i in range(num_objects):
+            obj = read_string()
+            self._objects.add(obj)
+            raw_index = unpack("I")
+            if raw_index == NO_RAW_DATA:
+                has_data = False
+            elif raw_index == SAME_RAW_DATA_INDEX:
+                has_data = obj in indices
+            elif raw_index in [DAQMX_FORMAT_CHANGING_SCALER,
+                               DAQMX_DIGITAL_LINE_SCALER]:
+                # DAQmx raw data are not supported; skip the scalers
+                has_data = True
+                _dtype = unpack("I")
+                _dim = unpack("I")
+                count = unpack("Q")
+                num_scalers = unpack("I")
+                pos[0] += 20*num_scalers
+                num_widths = unpack("I")
+                pos[0] += 4*num_widths
+                indices[obj] = (None, count, 0)
+                self._dtypes[obj] = None
+            else:
+                has_data = True
+                dtype = unpack("I")
+                _dim = unpack("I")
+                count = unpack("Q")
+                if dtype == TDMS_STRING:
+                    nbytes = unpack("Q")
+                else:
+                    nbytes = count*_type_size(dtype)
+                indices[obj] = (dtype, count, nbytes)
+                self._dtypes[obj] = dtype
+            # skip properties
+            num_props = unpack("I")
+            for _j in range(num_props):
+                read_string()
+                ptype = unpack("I")
+                if ptype == TDMS_STRING:
+                    read_string()
+                else:
+                    pos[0] += _type_size(ptype)
+
+            if obj in objects:
+                if not has_data:
+                    objects.remove(obj)
+            elif has_data:
+                objects.append(obj)
+
+
+    def _index_raw_data(self, objects, indices, endian, start, size,
+                        interleaved, daqmx):
+        """ Compute the file positions of the raw data of a segment """
+        layout = [ (obj,)+indices[obj] for obj in objects ]
+        chunk_size = sum([ lay[3] for lay in layout ])
+        if chunk_size == 0 or size <= 0:
+            return
+        if daqmx:
+            return
+        num_chunks = size // chunk_size
+        # A truncated last chunk (e.g. if the acquisition crashed)
+        # contains a proportional number of values per channel.
+        proportion = (size % chunk_size) / chunk_size
+        for ii in range(num_chunks+int(proportion > 0)):
+            chunk_start = start + ii*chunk_size
+            if ii == num_chunks:
+                scale = proportion
+            else:
+                scale = 1
+            if interleaved:
+                row_size = sum([ _type_size(lay[1]) for lay in layout ])
+                obj_offset = chunk_start
+                for obj, dtype, count, _nbytes in layout:
+                    self._add_chunk(obj, obj_offset, int(count*scale),
+                                    row_size, endian)
+                    obj_offset += _type_size(dtype)
+            else:
+                obj_offset = chunk_start
+                for obj, dtype, count, nbytes in layout:
+                    self._add_chunk(obj, obj_offset, int(count*scale),
+                                    0, endian)
+                    obj_offset += nbytes
+
+
+    def _add_chunk(self, obj, offset, count, stride, endian):
+        if count > 0:
+            if not obj in self._chunks:
+                self._chunks[obj] = []
+            self._chunks[obj].append((offset, count, stride, endian))
+
+
+    def channel_data(self, group, channel):
+        """ Read the data of a channel from the tdms file
+
+        Returns `None` if the channel does not contain any data.
+        Raises a `KeyError` if the channel does not exist and a
+        `NotImplementedError` for unsupported data types.
+        """
+        obj = object_path(group, channel)
+        if not obj in self._objects:
+            raise KeyError("Channel not in {}: {}".format(self.path, obj))
+        chunks = self._chunks.get(obj, [])
+        if len(chunks) == 0:
+            return None
+        dtype = self._dtypes[obj]
+        if not dtype in TDMS_DTYPES:
+            raise NotImplementedError("Unsupported tdms data type {} of {}"
+                                      .format(dtype, obj))
+        total = sum([ ch[1] for ch in chunks ])
+        data = np.zeros(total, dtype=TDMS_DTYPES[dtype])
+        itemsize = data.dtype.itemsize
+        fsize = os.path.getsize(self.path)
+        ii = 0
+        with open(self.path, "rb") as fd:
+            for offset, count, stride, endian in chunks:
+                npdtype = np.dtype(str(endian+TDMS_DTYPES[dtype]))
+                fd.seek(offset)
+                # values beyond the end of the file remain zero
+                step = stride or itemsize
+                nread = min(count, max(0, (fsize-offset-itemsize)//step+1))
+                if nread and stride:
+                    raw = fd.read(stride*(nread-1)+itemsize)
+                    values = np.ndarray(shape=(nread,), dtype=npdtype,
+                                        buffer=raw, strides=(stride,))
+                    data[ii:ii+nread] = values
+                elif nread:
+                    values = np.fromfile(fd, dtype=npdtype, count=nread)
+                    data[ii:ii+nread] = values
+                ii += count
+        return data
+
+
+    def channel_length(self, group, channel):
+        """ Number of values of a channel
+
+        Raises a `KeyError` if the channel does not exist.
+        """
+        obj = object_path(group, channel)
+        if not obj in self._objects:
+            raise KeyError("Channel not in {}: {}".format(self.path, obj))
+        return sum([ ch[1] for ch in self._chunks.get(obj, []) ])
+
+
+    def has_channel(self, group, channel):
+        return object_path(group, channel) in self._objects
+
+
+
+def _type_size(dtype):
+    if dtype in TDMS_DTYPES:
+        return np.dtype(str(TDMS_DTYPES[dtype])).itemsize
+    elif dtype in TDMS_SIZES:
+        return TDMS_SIZES[dtype]
+    else:
+        raise NotImplementedError("Unknown tdms data type: {}".format(dtype))
+
+
+def object_path(group, channel):
+    """ The tdms object path of a channel, e.g. "/'Cell Track'/'time'" """
+    return "/'{}'/'{}'".format(group.replace("'", "''"),
+                               channel.replace("'", "''"))
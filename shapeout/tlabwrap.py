@@ -6,29 +6,120 @@
 from __future__ import division, unicode_literals
 
 import codecs
+from multiprocessing.pool import ThreadPool
 import numpy as np
-from nptdms import TdmsFile
 import os
+import struct
 import warnings
 
+from nptdms import TdmsFile
+
 from dclab.rtdc_dataset import hashfile
-from dclab import GetTDMSFiles, GetProjectNameFromPath
+from dclab import GetProjectNameFromPath
 from dclab import config as dc_config
 
+from .hashcache import HashCache, fingerprint_file
+from .tdms_index import TdmsIndex
 from util import findfile
 
 
-def search_hashed_tdms(tdms_file, tdms_hash, directories):
-    """ Search `directories` for `tdms_file` with matching `tdms_hash`
+def relocate_tdms_files(measurements, directories, hash_cache=None,
+                        workers=8):
+    """ Find several tdms files by their hashes in `directories`
+    
+    The directories are walked only once. Candidates are files with
+    the same name and (if known) the same size as the missing
+    measurement. The candidates are hashed in parallel and each
+    candidate is hashed at most once.
+    
+    Parameters
+    ----------
+    measurements : list of tuples
+        Each tuple contains the path to the missing tdms file, its
+        hash, its fingerprint (see
+        `shapeout.hashcache.fingerprint_file`), and its size in
+        bytes. The fingerprint and the size may be `None`.
+    directories : list of str
+        Directories that are searched recursively.
+    hash_cache : str or None
+        Path to a hash cache database (see
+        `shapeout.hashcache.HashCache`).
+    workers : int
+        Number of threads used for hashing.
+    
+    Returns
+    -------
+    found : list
+        For each measurement, the path to a file with matching hash
+        or `None` if no such file was found.
     """
-    tdms_file = os.path.basename(tdms_file)
+    if hash_cache is None:
+        get_hash = hashfile
+        get_fingerprint = fingerprint_file
+    else:
+        cache = HashCache(hash_cache)
+        get_hash = cache.GetHash
+        get_fingerprint = cache.GetFingerprint
+    
+    # file name -> indices of the measurements
+    names = {}
+    for ii, meas in enumerate(measurements):
+        names.setdefault(os.path.basename(meas[0]), []).append(ii)
+    
+    # candidate file -> indices of the measurements it might be
+    candidates = []
+    visited = set()
     for adir in directories:
         for root, _ds, fs in os.walk(adir):
-            if tdms_file in fs:
-                this_file = os.path.join(root,tdms_file)
-                this_hash = hashfile(this_file)
-                if this_hash == tdms_hash:
-                    return this_file
+            for name in fs:
+                if not name in names:
+                    continue
+                path = os.path.join(root, name)
+                realpath = os.path.realpath(path)
+                if realpath in visited:
+                    continue
+                visited.add(realpath)
+                size = os.path.getsize(path)
+                wanted = [ ii for ii in names[name]
+                           if measurements[ii][3] in [None, size] ]
+                if wanted:
+                    candidates.append((path, wanted))
+    
+    found = [None]*len(measurements)
+    
+    def check(candidate):
+        path, wanted = candidate
+        # skip measurements that have already been found
+        wanted = [ ii for ii in wanted if found[ii] is None ]
+        if wanted and not None in [ measurements[ii][2] for ii in wanted ]:
+            fingerprint = get_fingerprint(path)
+            wanted = [ ii for ii in wanted
+                       if measurements[ii][2] == fingerprint ]
+        if wanted:
+            thash = get_hash(path)
+            wanted = [ ii for ii in wanted if measurements[ii][1] == thash ]
+        return path, wanted
+    
+    if candidates:
+        pool = ThreadPool(processes=min(workers, len(candidates)))
+        try:
+            for path, matches in pool.imap_unordered(check, candidates):
+                for ii in matches:
+                    if found[ii] is None:
+                        found[ii] = path
+        finally:
+            pool.terminate()
+    return found
+
+
+def search_hashed_tdms(tdms_file, tdms_hash, directories, hash_cache=None,
+                       fingerprint=None):
+    """ Search `directories` for `tdms_file` with matching `tdms_hash`
+    
+    See `relocate_tdms_files` for searching several files at once.
+    """
+    return relocate_tdms_files([(tdms_file, tdms_hash, fingerprint, None)],
+                               directories, hash_cache=hash_cache)[0]
 
 
 def crop_linear_data(data, xmin, xmax, ymin, ymax):
@@ -114,79 +205,146 @@ def crop_linear_data(data, xmin, xmax, ymin, ymax):
     return newdata
 
         
-def GetTDMSTreeGUI(directories):
+def GetTDMSTreeGUI(directories, catalog=None, callback=None, workers=8,
+                   abort=None):
     """ Returns projects (folders) and measurements therein
     
-    This is a convenience function for the GUI
+    This is a convenience function for the GUI. Each measurement
+    is a tuple of the displayed name, the tdms file, and the
+    measurement info (see `GetMeasurementInfo`).
+    
+    Parameters
+    ----------
+    directories : str or list of str
+        The directories that are searched recursively.
+    catalog : str or None
+        Path to a measurement catalog (see
+        `shapeout.catalog.MeasurementCatalog`). If given, only
+        measurements that changed since the last scan are read
+        from disk.
+    callback : callable or None
+        Called with a partial result `(treelist, cols)` for each
+        folder that contains measurements, as soon as the folder
+        has been scanned.
+    workers : int
+        Number of threads used for scanning the folders.
+    abort : threading.Event or None
+        If this event is set, scanning is stopped and the
+        measurements found so far are returned.
     """
     if not isinstance(directories, list):
         directories = [directories]
     
-    directories = np.unique(directories)
+    if catalog is not None:
+        # (imported here, because the catalog module uses tlabwrap)
+        from .catalog import MeasurementCatalog
+        catalog = MeasurementCatalog(catalog)
+    
+    #cols = [_("Measurement"), _("Creation Date")]
+    #to = os.path.getctime(f)
+    #t = time.strftime("%Y-%m-%d %H:%M", time.gmtime(to))
+    cols = ["Measurement"]
+
+    directories = [ os.path.realpath(d) for d in directories ]
+    scan = lambda directory: _scan_folder(directory, catalog)
+    tdms_files = []
+    measurements = []
+    visited = set()
+    aborted = False
     
+    pool = ThreadPool(processes=workers)
+    try:
+        # The folders are scanned level by level. All folders of
+        # one level are scanned concurrently.
+        level = directories
+        while level and not aborted:
+            level = sorted(set(level) - visited)
+            visited.update(level)
+            nextlevel = []
+            for subdirs, files, found in pool.imap_unordered(scan, level):
+                if abort is not None and abort.is_set():
+                    aborted = True
+                    break
+                nextlevel += subdirs
+                tdms_files += files
+                if found:
+                    measurements += found
+                    if callback is not None:
+                        callback((_get_project_tree(found), cols))
+            level = nextlevel
+    finally:
+        pool.terminate()
+
+    if catalog is not None and not aborted:
+        for directory in directories:
+            catalog.RemoveMissing(directory, tdms_files)
+        
+    return _get_project_tree(measurements), cols
+
+
+def _get_project_tree(measurements):
+    """ Group measurements by folder (see `GetTDMSTreeGUI`) """
     pathdict = dict()
     treelist = list()
+    for meas in sorted(measurements, key=lambda m: m[1]):
+        path = os.path.dirname(meas[1])
+        # try to find the path in pathdict
+        if pathdict.has_key(path):
+            i = pathdict[path]
+        else:
+            treelist.append([])
+            i = len(treelist)-1
+            pathdict[path] = i
+            # The first element of a tree contains the measurement name
+            project = GetProjectNameFromPath(path)
+            treelist[i].append((project, path))
+        treelist[i].append(meas)
+    return treelist
+
+
+def _scan_folder(directory, catalog=None):
+    """ Find measurements in a folder (not recursive)
     
-    for directory in directories:
-        files = GetTDMSFiles(directory)
-
-        #cols = [_("Measurement"), _("Creation Date")]
-        #to = os.path.getctime(f)
-        #t = time.strftime("%Y-%m-%d %H:%M", time.gmtime(to))
-        cols = ["Measurement"]
-
-        for f in files:
-            if not IsFullMeasurement(f):
-                # Ignore broken measurements
-                continue
-            path, name = os.path.split(f)
-            # try to find the path in pathdict
-            if pathdict.has_key(path):
-                i = pathdict[path]
-            else:
-                treelist.append([])
-                i = len(treelist)-1
-                pathdict[path] = i
-                # The first element of a tree contains the measurement name
-                project = GetProjectNameFromPath(path)
-                treelist[i].append((project, path))
-            # Get data from filename
-            mx = name.split("_")[0]
-            dn = u"{} {}".format(mx, GetRegion(f))
-            if not GetRegion(f).lower() in ["reservoir"]:
-                # outlet (flow rate is not important)
-                dn += u"  {} µls⁻¹".format(GetFlowRate(f))
-            dn += "  ({} events)".format(GetEvents(f))
-                                   
-            treelist[i].append((dn, f))
-        
-    return treelist, cols
+    Returns a list of subfolders, a list of all tdms files, and
+    a list of valid measurements (see `GetTDMSTreeGUI`).
+    """
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        # Ignore folders that cannot be accessed (like `os.walk`)
+        return [], [], []
+    subdirs = []
+    files = []
+    for name in names:
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            # Do not follow symbolic links (like `os.walk`)
+            if not os.path.islink(path):
+                subdirs.append(path)
+        # Exclude traces files of fRT-DC setup
+        elif name.endswith(".tdms") and not name.endswith("_traces.tdms"):
+            files.append(os.path.realpath(path))
+    
+    if catalog is None:
+        infos = dict([ (f, GetMeasurementInfo(f)) for f in files ])
+    else:
+        infos = catalog.Scan(files)
+    
+    measurements = []
+    for f in files:
+        info = infos[f]
+        if info is None:
+            # Ignore broken measurements
+            continue
+        measurements.append((GetMeasurementLabel(f, info), f, info))
+    return subdirs, files, measurements
 
 
 def IsFullMeasurement(fname):
     """ Checks for existence of ini files and returns False if some
         files are missing.
     """
-    is_ok = True
-    path, name = os.path.split(fname)
-    mx = name.split("_")[0]
-    stem = os.path.join(path, mx)
-    
-    # Check if all config files are present
-    if ( (not os.path.exists(stem+"_para.ini")) or
-         (not os.path.exists(stem+"_camera.ini")) or
-         (not os.path.exists(fname))                ):
-        is_ok = False
-    
-    # Check if we can perform all standard file operations
-    for test in [GetRegion, GetFlowRate, GetEvents]:
-        try:
-            test(fname)
-        except:
-            is_ok = False
-            break
-    
-    return is_ok
+    return GetMeasurementInfo(fname) is not None
 
 
 def GetDefaultConfiguration(key=None):
@@ -200,10 +358,15 @@ def GetDefaultConfiguration(key=None):
 
 def GetEvents(fname):
     """ Get the number of events for a tdms file
+    
+    Only the segment headers of the tdms file are read. Files that
+    are not supported by `TdmsIndex` are read with nptdms.
     """
-    tdms_file = TdmsFile(fname)
-    datalen = len(tdms_file.object("Cell Track", "time").data)
-    return datalen
+    try:
+        return TdmsIndex(fname).channel_length("Cell Track", "time")
+    except (NotImplementedError, IOError, struct.error):
+        tdms_file = TdmsFile(fname)
+        return len(tdms_file.object("Cell Track", "time").data)
 
 
 def GetFlowRate(fname):
@@ -224,6 +387,59 @@ def GetFlowRate(fname):
         return float(flrate)
 
 
+def GetMeasurementInfo(fname):
+    """ Get the metadata of a measurement in a single pass
+    
+    The "para.ini" file is parsed only once and the number of events
+    is determined from the segment headers of the tdms file.
+    
+    Returns
+    -------
+    info : dict or None
+        Dictionary with the keys "events", "flow rate", and
+        "region". `None` is returned for incomplete or broken
+        measurements (e.g. missing ini files).
+    """
+    path, name = os.path.split(fname)
+    mx = name.split("_")[0]
+    stem = os.path.join(path, mx)
+    
+    # Check if all config files are present
+    if ( (not os.path.exists(stem+"_para.ini")) or
+         (not os.path.exists(stem+"_camera.ini")) or
+         (not os.path.exists(fname))                ):
+        return None
+    
+    try:
+        paracfg = dc_config.load_config_file(stem+"_para.ini")
+        info = {"events": GetEvents(fname),
+                "flow rate": paracfg["General"]["Flow Rate [ul/s]"],
+                "region": paracfg["General"]["Region"].lower(),
+                }
+    except:
+        return None
+    return info
+
+
+def GetMeasurementLabel(fname, info):
+    """ Get the label of a measurement for the GUI
+    
+    Parameters
+    ----------
+    fname : str
+        Path to the tdms file.
+    info : dict
+        Metadata of the measurement (see `GetMeasurementInfo`).
+    """
+    mx = os.path.basename(fname).split("_")[0]
+    dn = u"{} {}".format(mx, info["region"])
+    if not info["region"] in ["reservoir"]:
+        # outlet (flow rate is not important)
+        dn += u"  {} µls⁻¹".format(info["flow rate"])
+    dn += "  ({} events)".format(info["events"])
+    return dn
+
+
 def GetRegion(fname):
     """ Get the region (inlet/outlet) for a measurement
     """
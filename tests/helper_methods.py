@@ -26,6 +26,38 @@ def dl_file(url, dest, chunk_size=6553):
     r.release_conn()
 
 
+def example_tdms_file(size=100, mid=1, dirname=None):
+    """ Write a minimal RT-DC measurement (tdms and ini files)
+    
+    Returns the path to the tdms file.
+    """
+    import nptdms
+    if dirname is None:
+        dirname = tempfile.mkdtemp(prefix="example_tdms_")
+    state = np.random.RandomState(size+mid)
+    channels = {"time": np.arange(size, dtype=float),
+                "area": state.random_sample(size)*100+50,
+                "circularity": 1-state.random_sample(size)*.1,
+                "x": state.random_sample(size)*200,
+                "y": state.random_sample(size)*20,
+                }
+    tdms_file = join(dirname, "M{}_data.tdms".format(mid))
+    with nptdms.TdmsWriter(tdms_file) as tdms_writer:
+        tdms_writer.write_segment([ nptdms.ChannelObject("Cell Track",
+                                                         ch, channels[ch])
+                                    for ch in sorted(channels.keys()) ])
+    with open(join(dirname, "M{}_para.ini".format(mid)), "w") as fd:
+        fd.writelines(["[General]\n",
+                       "Flow Rate [ul/s] = 0.12\n",
+                       "Region = Channel\n",
+                       "[Image]\n",
+                       "Pix Size = 0.34\n"])
+    with open(join(dirname, "M{}_camera.ini".format(mid)), "w") as fd:
+        fd.writelines(["[Framerate]\n",
+                       "Frame Rate = 2000\n"])
+    return tdms_file
+
+
 def example_data_dict(size=100, keys=["Area", "Defo"]):
     """ Example dict with which an RTDC_DataSet can be instantiated.
     """
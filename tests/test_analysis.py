@@ -3,18 +3,20 @@
 
 from __future__ import division, print_function
 import sys
+import os
 from os.path import abspath, dirname
 
 import numpy as np
+import shutil
 import tempfile
 
 import dclab
 
 # Add parent directory to beginning of path variable
 sys.path.insert(0, dirname(dirname(abspath(__file__))))
-from shapeout import analysis
+from shapeout import analysis, tlabwrap
 
-from helper_methods import example_data_dict
+from helper_methods import example_data_dict, example_tdms_file
 
 
 def test_basic():
@@ -59,6 +61,74 @@ def test_axes_usable():
 
 
 
+def test_load_parallel():
+    tdir = tempfile.mkdtemp()
+    files = [ example_tdms_file(s, mid=ii+1, dirname=tdir)
+              for ii, s in enumerate([10, 100, 12, 382]) ]
+    progress = []
+    callback = lambda loaded, total, f: progress.append((loaded, total))
+    for worker_type in ["process", "thread"]:
+        del progress[:]
+        anal = analysis.Analysis(files, workers=3, worker_type=worker_type,
+                                 callback=callback)
+        # order of the measurements must be the order of the files
+        assert anal.GetTDMSFilenames() == files
+        assert [ mm.time.shape[0] for mm in anal.measurements ] == [10, 100, 12, 382]
+        assert progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_session_fingerprint():
+    tdir = tempfile.mkdtemp()
+    files = [ example_tdms_file(s, mid=ii+1, dirname=tdir)
+              for ii, s in enumerate([10, 100]) ]
+    dbfile = os.path.join(tdir, "catalog.sqlite")
+    anal = analysis.Analysis(files, hash_cache=dbfile)
+    odir = tempfile.mkdtemp()
+    index = anal.DumpData(odir)
+    anal2 = analysis.Analysis(index, hash_cache=dbfile)
+    assert anal2.GetTDMSFilenames() == files
+    # modified measurement
+    with open(os.path.join(tdir, "M2_para.ini"), "a") as fd:
+        fd.write("\n")
+    try:
+        analysis.Analysis(index, hash_cache=dbfile)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Modified measurement files must be detected")
+    shutil.rmtree(tdir, ignore_errors=True)
+    shutil.rmtree(odir, ignore_errors=True)
+
+
+def test_session_relocate():
+    tdir = tempfile.mkdtemp()
+    mdir = os.path.join(tdir, "data")
+    os.mkdir(mdir)
+    files = [ example_tdms_file(s, mid=ii+1, dirname=mdir)
+              for ii, s in enumerate([10, 100]) ]
+    anal = analysis.Analysis(files)
+    odir = tempfile.mkdtemp()
+    index = anal.DumpData(odir, rel_path=odir)
+    # move the measurements
+    newdir = os.path.join(tdir, "moved")
+    shutil.move(mdir, newdir)
+    missing = analysis.session_check_index(index)["missing tdms"]
+    assert [ m[1] for m in missing ] == files
+    assert [ m[4] for m in missing ] == [ os.path.getsize(os.path.join(
+                                          newdir, os.path.basename(f)))
+                                          for f in files ]
+    found = tlabwrap.relocate_tdms_files([ m[1:] for m in missing ], [tdir])
+    assert [ os.path.dirname(f) for f in found ] == [newdir, newdir]
+    analysis.session_update_index(index, dict([ (m[0], {"fdir": newdir})
+                                                for m in missing ]))
+    anal2 = analysis.Analysis(index)
+    assert [ mm.time.shape[0] for mm in anal2.measurements ] == [10, 100]
+    shutil.rmtree(tdir, ignore_errors=True)
+    shutil.rmtree(odir, ignore_errors=True)
+
+
+
 if __name__ == "__main__":
     # Run all tests
     loc = locals()
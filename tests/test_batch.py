@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division, print_function
+import sys
+import os
+from os.path import abspath, dirname, join
+
+import codecs
+import numpy as np
+import shutil
+import tempfile
+import threading
+
+import dclab
+from dclab import config as dc_config
+
+# Add parent directory to beginning of path variable
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from shapeout import batch
+from shapeout.resultcache import canonical_settings
+from shapeout.rtdc_dataset import RTDC_DataSet
+
+from helper_methods import example_tdms_file
+
+
+def read_tsv(path):
+    with codecs.open(path, "r", encoding="utf-8") as fd:
+        lines = fd.read().strip().split("\n")
+    head = lines[0][2:].split("\t")
+    rows = sorted([ l.split("\t") for l in lines[1:] ])
+    return head, rows
+
+
+def test_batch_filter():
+    tdir = tempfile.mkdtemp()
+    files = [ example_tdms_file(s, mid=ii+1, dirname=tdir)
+              for ii, s in enumerate([100, 200, 300]) ]
+    cfg = {"Filtering": {"Defo Min": .02, "Defo Max": .08}}
+    axes = ["Area", "Defo"]
+    columns = ["Events", "Mean"]
+    # reference
+    ref = []
+    for f in files:
+        mm = RTDC_DataSet(f)
+        mm.UpdateConfiguration(cfg)
+        mm.ApplyFilter()
+        h, v = dclab.statistics.get_statistics(rtdc_ds=mm, columns=columns,
+                                               axes=axes)
+        ref.append(batch.format_row([mm.tdms_filename, mm.title]+v).
+                   split("\t"))
+    ref.sort()
+    calls = []
+    for workers in [1, 2]:
+        out = join(tdir, "out{}.tsv".format(workers))
+        report = batch.batch_filter(files, out, cfg, axes=axes,
+                                    columns=columns, workers=workers,
+                                    callback=lambda *args: calls.append(args))
+        assert report["rows"] == 3
+        head, data = read_tsv(out)
+        assert head == ["TDMS file", "Title"] + h
+        assert data == ref
+    assert sorted([ c[0] for c in calls ]) == [1, 1, 2, 2, 3, 3]
+    assert float(ref[0][2]) < 100
+    # command line
+    cfgfile = join(tdir, "config.txt")
+    dc_config.save_config_file(cfgfile, cfg)
+    out = join(tdir, "cli.tsv")
+    batch.main([tdir, "-c", cfgfile, "-o", out, "-a", "Area,Defo",
+                "-s", "Events,Mean", "-w", "1"])
+    assert read_tsv(out) == (head, ref)
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_batch_in_flight():
+    tdir = tempfile.mkdtemp()
+    files = [ example_tdms_file(100, mid=ii+1, dirname=tdir)
+              for ii in range(4) ]
+    events = []
+    process = batch.process_measurement
+    def logging_process(tdms_file, **kwargs):
+        events.append("load")
+        return process(tdms_file, **kwargs)
+    batch.process_measurement = logging_process
+    try:
+        for _ii, _h, _row, _c in batch.batch_statistics(files, {},
+                                                    axes=["Area"],
+                                                    columns=["Mean"],
+                                                    workers=1):
+            events.append("row")
+    finally:
+        batch.process_measurement = process
+    # only one measurement at a time
+    assert events == ["load", "row"]*4
+    # the pool does not deadlock if the consumer stops early
+    results = batch.batch_statistics(files, {}, axes=["Area"],
+                                     columns=["Mean"], workers=2,
+                                     max_in_flight=2)
+    assert len(list(results)) == 4
+    results = batch.batch_statistics(files, {}, axes=["Area"],
+                                     columns=["Mean"], workers=2,
+                                     max_in_flight=1)
+    next(results)
+    results.close()
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_batch_result_cache():
+    tdir = tempfile.mkdtemp()
+    files = [ example_tdms_file(100+ii, mid=ii+1, dirname=tdir)
+              for ii in range(3) ]
+    cache = join(tdir, "cache.sqlite")
+    cfg = {"Filtering": {"Defo Min": .02, "Defo Max": .08},
+           "Plotting": {"KDE": "Gauss"}}
+    kwargs = {"axes": ["Area"], "columns": ["Mean"], "workers": 1,
+              "result_cache": cache}
+    out = join(tdir, "out.tsv")
+    report = batch.batch_filter(files[:2], out, cfg, **kwargs)
+    assert (report["cache hits"], report["cache misses"]) == (0, 2)
+    data = read_tsv(out)
+    # the plotting settings do not matter
+    cfg["Plotting"]["KDE"] = "Multivariate"
+    report = batch.batch_filter(files, out, cfg, **kwargs)
+    assert (report["cache hits"], report["cache misses"]) == (2, 1)
+    assert read_tsv(out)[1][:2] == data[1]
+    # changed filter settings, axes, or files
+    cfg["Filtering"]["Defo Max"] = .09
+    report = batch.batch_filter(files, out, cfg, **kwargs)
+    assert report["cache misses"] == 3
+    kwargs["axes"] = ["Defo"]
+    report = batch.batch_filter(files, out, cfg, **kwargs)
+    assert report["cache misses"] == 3
+    with open(join(tdir, "M1_para.ini"), "a") as fd:
+        fd.write("\n")
+    report = batch.batch_filter(files, out, cfg, **kwargs)
+    assert (report["cache hits"], report["cache misses"]) == (2, 1)
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_batch_result_cache_moved():
+    tdir = tempfile.mkdtemp()
+    pdirs = [join(tdir, p, "online") for p in ["ProjA", "ProjB"]]
+    os.makedirs(pdirs[0])
+    src = example_tdms_file(100, dirname=pdirs[0])
+    shutil.copytree(pdirs[0], pdirs[1])
+    dst = join(pdirs[1], os.path.basename(src))
+    cache = join(tdir, "cache.sqlite")
+    kwargs = {"axes": ["Area"], "columns": ["Mean"], "workers": 1,
+              "result_cache": cache}
+    out = join(tdir, "out.tsv")
+    batch.batch_filter([src], out, {}, **kwargs)
+    data = read_tsv(out)
+    report = batch.batch_filter([dst], out, {}, **kwargs)
+    assert report["cache hits"] == 1
+    moved = read_tsv(out)
+    assert moved[0] == data[0]
+    # the same statistics with the path and title of the copy
+    ref = batch.process_measurement(dst, {}, axes=["Area"],
+                                    columns=["Mean"])[1]
+    assert moved[1][0][:2] == [dst, "ProjB - M1"] == ref[:2]
+    assert moved[1][0][2:] == data[1][0][2:]
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_batch_abort_resume():
+    tdir = tempfile.mkdtemp()
+    files = [ example_tdms_file(100, mid=ii+1, dirname=tdir)
+              for ii in range(3) ]
+    abort = threading.Event()
+    def callback(done, total, tdms_file):
+        abort.set()
+    out = join(tdir, "out.tsv")
+    kwargs = {"axes": ["Area"], "columns": ["Mean"], "workers": 1}
+    report = batch.batch_filter(files, out, {}, callback=callback,
+                                abort=abort, **kwargs)
+    assert report["rows"] == 1
+    assert not report["complete"]
+    # the output file is only written when all rows are computed
+    assert not os.path.exists(out)
+    assert len(list(batch.read_journal(out+".journal",
+                                       canonical_settings({}, ["Area"],
+                                                          ["Mean"])))) == 1
+    # interrupted while writing the journal
+    with open(out+".journal", "a") as fd:
+        fd.write('{"path": "')
+    calls = []
+    report = batch.batch_filter(files, out, {},
+                                callback=lambda *args: calls.append(args),
+                                **kwargs)
+    assert report["complete"]
+    assert (report["rows"], report["resumed"]) == (3, 1)
+    assert [ c[:2] for c in calls ] == [(2, 3), (3, 3)]
+    assert not os.path.exists(out+".journal")
+    ref = read_tsv(out)
+    assert len(ref[1]) == 3
+    # a journal with other settings is not used
+    abort.clear()
+    batch.batch_filter(files, out, {"Filtering": {"Defo Max": .1}},
+                       callback=callback, abort=abort, **kwargs)
+    report = batch.batch_filter(files, out, {}, **kwargs)
+    assert report["resumed"] == 0
+    assert read_tsv(out) == ref
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division, print_function
+import sys
+import os
+from os.path import abspath, dirname, join
+
+import shutil
+import tempfile
+
+from dclab.rtdc_dataset import hashfile
+
+# Add parent directory to beginning of path variable
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from shapeout import catalog, tlabwrap
+
+from helper_methods import example_tdms_file
+
+
+def test_catalog_rescan():
+    tdir = tempfile.mkdtemp()
+    files = [ example_tdms_file(s, mid=ii+1, dirname=tdir)
+              for ii, s in enumerate([10, 100, 12]) ]
+    files = [ os.path.realpath(f) for f in files ]
+    dbfile = join(tdir, "catalog.sqlite")
+    # count how often the measurement files are read
+    calls = []
+    get_info = tlabwrap.GetMeasurementInfo
+    def counting_get_info(fname):
+        calls.append(fname)
+        return get_info(fname)
+    tlabwrap.GetMeasurementInfo = counting_get_info
+    try:
+        cat = catalog.MeasurementCatalog(dbfile)
+        infos = cat.ScanDirectory(tdir)
+        assert sorted(infos.keys()) == files
+        assert infos[files[1]]["events"] == 100
+        assert len(calls) == 3
+        # a new catalog instance uses the database file
+        cat = catalog.MeasurementCatalog(dbfile)
+        assert cat.ScanDirectory(tdir) == infos
+        assert len(calls) == 3
+        # modified measurement
+        with open(join(tdir, "M2_para.ini"), "a") as fd:
+            fd.write("\n")
+        cat.ScanDirectory(tdir)
+        assert calls[3:] == [files[1]]
+        # removed measurement
+        os.remove(files[2])
+        assert sorted(cat.ScanDirectory(tdir).keys()) == files[:2]
+        assert len(calls) == 4
+        # tree for the GUI
+        treelist, _cols = tlabwrap.GetTDMSTreeGUI(tdir, catalog=dbfile)
+        assert [ m[1] for m in treelist[0][1:] ] == files[:2]
+        assert len(calls) == 4
+    finally:
+        tlabwrap.GetMeasurementInfo = get_info
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_catalog_hash():
+    tdir = tempfile.mkdtemp()
+    path = example_tdms_file(size=50, dirname=tdir)
+    cat = catalog.MeasurementCatalog(join(tdir, "catalog.sqlite"))
+    assert cat.GetHash(path) == hashfile(path)
+    assert cat.GetInfo(path)["events"] == 50
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division, print_function
+import sys
+from os.path import abspath, dirname
+
+import numpy as np
+
+# Add parent directory to beginning of path variable
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from shapeout import kde_methods
+from shapeout import rtdc_dataset
+from shapeout.densitycache import DensityCache
+
+from helper_methods import example_tdms_file
+
+
+def test_lru():
+    cache = DensityCache(max_bytes=3*800)
+    for ii in range(3):
+        cache.Set(ii, np.zeros(100))
+    assert cache.nbytes == 2400
+    # 0 becomes the most recently used entry
+    assert cache.Get(0) is not None
+    cache.Set(3, (np.zeros(50), np.zeros(50)))
+    assert 0 in cache
+    assert not 1 in cache
+    assert cache.Get(1) is None
+    assert len(cache) == 3
+    assert cache.nbytes == 2400
+    # too large
+    cache.Set(4, np.zeros(301))
+    assert not 4 in cache
+    # replace
+    cache.Set(3, np.zeros(10))
+    assert cache.nbytes == 1680
+    cache.Clear()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+def test_dataset_cache():
+    rtdc_dataset.density_cache.Clear()
+    mm = rtdc_dataset.RTDC_DataSet(example_tdms_file(size=300))
+    mm.UpdateConfiguration({"Plotting": {"KDE": "Binned"}})
+    calls = []
+    kde_grid = kde_methods.kde_grid
+    def counting_kde_grid(*args, **kwargs):
+        calls.append(args[0])
+        return kde_grid(*args, **kwargs)
+    kde_methods.kde_grid = counting_kde_grid
+    try:
+        density = mm.GetKDE_Scatter(yax="Defo", xax="Area")
+        assert mm.GetKDE_Scatter(yax="Defo", xax="Area") is density
+        # the grid is shared with the contour plot
+        _x, _y, contour = mm.GetKDE_Contour(yax="Defo", xax="Area")
+        assert len(calls) == 1
+        # changed filter
+        mm.UpdateConfiguration({"Filtering": {"Area Min": 0,
+                                              "Area Max":
+                                              np.median(mm.area_um)}})
+        density2 = mm.GetKDE_Scatter(yax="Defo", xax="Area")
+        assert len(calls) == 2
+        assert density2.shape[0] == mm._filter.sum()
+        # changed data
+        area = mm.area_um.copy()
+        mm.UpdateConfiguration({"Image": {"Pix Size": 0.5}})
+        assert not np.allclose(mm.area_um, area)
+        mm.GetKDE_Scatter(yax="Defo", xax="Area")
+        assert len(calls) == 3
+        # other KDE methods
+        mm.UpdateConfiguration({"Plotting": {"KDE": "Gauss"}})
+        gauss = mm.GetKDE_Scatter(yax="Defo", xax="Area")
+        assert mm.GetKDE_Scatter(yax="Defo", xax="Area") is gauss
+        # no grid is computed for "Gauss"
+        assert len(calls) == 3
+    finally:
+        kde_methods.kde_grid = kde_grid
+    rtdc_dataset.density_cache.Clear()
+
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
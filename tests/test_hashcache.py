@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division, print_function
+import sys
+import os
+from os.path import abspath, dirname, join
+
+import shutil
+import tempfile
+
+from dclab import rtdc_dataset
+from dclab.rtdc_dataset import hashfile
+
+# Add parent directory to beginning of path variable
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from shapeout import hashcache
+from shapeout.rtdc_dataset import RTDC_DataSet
+
+from helper_methods import example_tdms_file
+
+
+def test_hash_cache():
+    tdir = tempfile.mkdtemp()
+    path = example_tdms_file(size=50, dirname=tdir)
+    dbfile = join(tdir, "catalog.sqlite")
+    # count how often files are hashed
+    calls = []
+    get_hash = hashcache.hashfile
+    def counting_hashfile(fname):
+        calls.append(fname)
+        return get_hash(fname)
+    hashcache.hashfile = counting_hashfile
+    try:
+        cache = hashcache.HashCache(dbfile)
+        thash = cache.GetHash(path)
+        assert thash == hashfile(path)
+        assert len(calls) == 1
+        # a new instance uses the database file
+        assert hashcache.HashCache(dbfile).GetHash(path) == thash
+        assert len(calls) == 1
+        # measurements use the cache
+        mm = RTDC_DataSet(path, lazy=True, hash_cache=dbfile)
+        assert mm.file_hashes == RTDC_DataSet(path, lazy=True).file_hashes
+        assert mm.identifier == RTDC_DataSet(path, lazy=True).identifier
+        # dclab is not modified
+        assert rtdc_dataset.hashfile is hashfile
+        assert len(calls) == 3
+        # modified file
+        with open(path, "ab") as fd:
+            fd.write(b"\0")
+        assert cache.GetHash(path) == hashfile(path)
+        assert len(calls) == 4
+    finally:
+        hashcache.hashfile = get_hash
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_fingerprint():
+    tdir = tempfile.mkdtemp()
+    path = join(tdir, "data.bin")
+    data = bytearray(os.urandom(200000))
+    with open(path, "wb") as fd:
+        fd.write(data)
+    fp1 = hashcache.fingerprint_file(path)
+    # the middle of the file is not part of the fingerprint
+    data[100000] = (data[100000] + 1) % 256
+    with open(path, "wb") as fd:
+        fd.write(data)
+    assert hashcache.fingerprint_file(path) == fp1
+    # the end of the file is
+    data[-1] = (data[-1] + 1) % 256
+    with open(path, "wb") as fd:
+        fd.write(data)
+    fp2 = hashcache.fingerprint_file(path)
+    assert fp2 != fp1
+    cache = hashcache.HashCache(join(tdir, "catalog.sqlite"))
+    assert cache.GetFingerprint(path) == fp2
+    thash = hashfile(path)
+    assert cache.VerifyHash(path, thash)
+    assert cache.VerifyHash(path, thash, fingerprint=fp2)
+    assert not cache.VerifyHash(path, thash, fingerprint=fp1)
+    assert not cache.VerifyHash(path, "wrong hash")
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
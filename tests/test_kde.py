@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division, print_function
+import sys
+from os.path import abspath, dirname
+
+import numpy as np
+
+# Add parent directory to beginning of path variable
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from shapeout import kde_methods
+from shapeout import rtdc_dataset
+from shapeout.rtdc_dataset import RTDC_DataSet, compute_contours, \
+                                  density_cache, get_worker_pool
+
+from helper_methods import example_tdms_file
+
+
+def test_kde_binned():
+    rs = np.random.RandomState(42)
+    x = rs.normal(100, 20, size=5000)
+    y = .5*(x-100)/20 + rs.gamma(2, size=5000)
+    y /= 100
+    xout = x[:500]
+    yout = y[:500]
+    exact = kde_methods.kde_gauss(x, y, xout, yout)
+    binned = kde_methods.kde_binned(x, y, xout, yout)
+    error = kde_methods.kde_binned_error(x, y, xout, yout)
+    assert binned.shape == xout.shape
+    assert np.all(np.abs(binned - exact) <= error)
+    assert np.abs(binned - exact).max() < 1e-2*exact.max()
+    # output positions default to the events
+    assert np.allclose(kde_methods.kde_binned(x[:100], y[:100]),
+                       kde_methods.kde_gauss(x[:100], y[:100]),
+                       rtol=0, atol=1e-2*exact.max())
+
+
+def test_kde_multivariate():
+    rs = np.random.RandomState(42)
+    x = rs.gamma(4, 20, size=2000)
+    y = .02 + .01*rs.gamma(2, size=2000)
+    exact = kde_methods.kde_multivariate(x, y, bw=[5, .004], tol=0)
+    # small problems are computed exactly
+    assert np.all(kde_methods.kde_multivariate(x, y, bw=[5, .004]) == exact)
+    exact_size = kde_methods.MULTIVARIATE_EXACT_SIZE
+    kde_methods.MULTIVARIATE_EXACT_SIZE = 0
+    try:
+        for tol in [1e-1, 1e-2]:
+            approx = kde_methods.kde_multivariate(x, y, bw=[5, .004],
+                                                  tol=tol)
+            assert approx.shape == exact.shape
+            assert np.any(approx != exact)
+            assert np.abs(approx - exact).max() <= tol*exact.max()
+        # The grid size is limited, the exact estimator is used
+        # instead.
+        assert kde_methods._multivariate_grid(x, y, [5, .004], 1e-6) is None
+        approx = kde_methods.kde_multivariate(x, y, bw=[5, .004], tol=1e-6)
+        assert np.all(approx == exact)
+        # a few outliers
+        xo = x.copy()
+        xo[:5] = 2000
+        assert kde_methods._multivariate_grid(xo, y, [5, .004], 1e-2) is None
+        assert kde_methods.kde_grid("Multivariate", xo, y,
+                                    bw=[5, .004]) is None
+        approx = kde_methods.kde_multivariate(xo, y, bw=[5, .004])
+        assert np.all(approx == kde_methods.kde_multivariate(xo, y,
+                                                             bw=[5, .004],
+                                                             tol=0))
+    finally:
+        kde_methods.MULTIVARIATE_EXACT_SIZE = exact_size
+
+
+def test_contour_density():
+    rs = np.random.RandomState(1)
+    x = np.concatenate([rs.normal(0, 1, 3000), rs.normal(3, .5, 1000)])
+    y = np.concatenate([rs.normal(0, 1, 3000), rs.normal(2, .3, 1000)])
+    xlin = np.linspace(x.min(), x.max(), 141)
+    ylin = np.linspace(y.min(), y.max(), 130)
+    xmesh, ymesh = np.meshgrid(xlin, ylin)
+    grid = kde_methods.kde_grid("Binned", x, y)
+    full = grid.evaluate(xmesh, ymesh)
+    levels = [.5, .95]
+    density, evaluations = kde_methods.contour_density(grid.evaluate,
+                                                       xlin, ylin, levels)
+    assert density.shape == full.shape
+    assert evaluations < .2*full.size
+    assert density.max() == full.max()
+    for lev in levels:
+        # the same grid cells are crossed by the contour lines
+        crossed = []
+        for d in [full, density]:
+            corners = np.array([d[:-1, :-1], d[1:, :-1],
+                                d[:-1, 1:], d[1:, 1:]])
+            crossed.append((corners.min(axis=0) <= lev*d.max()) &
+                           (corners.max(axis=0) >= lev*d.max()))
+        assert np.all(crossed[0] == crossed[1])
+        rows, cols = np.nonzero(crossed[0])
+        for dr in [0, 1]:
+            for dc in [0, 1]:
+                assert np.all(density[rows+dr, cols+dc] ==
+                              full[rows+dr, cols+dc])
+    # no refinement
+    density, evaluations = kde_methods.contour_density(grid.evaluate,
+                                                       xlin, ylin, levels,
+                                                       step=1)
+    assert evaluations == full.size
+    assert np.all(density == full)
+
+
+def test_kde_dataset():
+    mm = RTDC_DataSet(example_tdms_file(size=300))
+    mm.UpdateConfiguration({"Plotting": {"KDE": "Gauss"}})
+    exact = mm.GetKDE_Scatter(yax="Defo", xax="Area")
+    xe, ye, cexact = mm.GetKDE_Contour(yax="Defo", xax="Area")
+    mm.UpdateConfiguration({"Plotting": {"KDE": "Binned"}})
+    binned = mm.GetKDE_Scatter(yax="Defo", xax="Area")
+    xb, ye, cbinned = mm.GetKDE_Contour(yax="Defo", xax="Area")
+    assert binned.shape == exact.shape
+    assert np.allclose(binned, exact, rtol=0, atol=1e-2*exact.max())
+    assert np.all(xb == xe)
+    assert np.allclose(cbinned, cexact, rtol=0, atol=1e-2*cexact.max())
+    mm.UpdateConfiguration({"Plotting": {"KDE": "Multivariate"}})
+    multi = mm.GetKDE_Scatter(yax="Defo", xax="Area")
+    assert multi.shape == exact.shape
+    # small problems are computed exactly, as in `kde_multivariate`
+    x, y = mm._kde_events("Area", "Defo")
+    bw = mm._kde_key("Area", "Defo")[6]
+    assert np.all(multi == kde_methods.kde_multivariate(x, y, bw=list(bw)))
+    xm, ym, cmulti = mm.GetKDE_Contour(yax="Defo", xax="Area")
+    assert np.all(cmulti == kde_methods.kde_multivariate(x, y, bw=list(bw),
+                                                         xout=xm, yout=ym))
+
+
+
+def test_compute_contours():
+    measurements = [RTDC_DataSet(example_tdms_file(size=s, mid=ii+1))
+                    for ii, s in enumerate([100, 200, 300])]
+    expected = [mm.GetKDE_Contour(yax="Defo", xax="Area")
+                for mm in measurements]
+    for worker_type in ["process", "thread"]:
+        density_cache.Clear()
+        contours = compute_contours(measurements, yax="Defo", xax="Area",
+                                    workers=2, worker_type=worker_type)
+        assert len(contours) == 3
+        for (x, y, z), (ex, ey, ez) in zip(contours, expected):
+            assert np.all(x == ex)
+            assert np.all(y == ey)
+            assert np.allclose(z, ez)
+    # adaptive refinement
+    for mm in measurements:
+        _x, _y, z = mm.GetKDE_Contour(yax="Defo", xax="Area",
+                                      levels=[.5, .95], accuracy=.5)
+        assert z.shape[1] >= 2*mm.GetKDE_Contour(yax="Defo",
+                                                 xax="Area")[2].shape[1]-1
+    # the results are cached
+    assert all([compute_contours([mm], yax="Defo", xax="Area")[0][2] is c[2]
+                for mm, c in zip(measurements, contours)])
+    density_cache.Clear()
+
+
+def test_compute_contours_pool():
+    measurements = [RTDC_DataSet(example_tdms_file(size=s, mid=ii+1))
+                    for ii, s in enumerate([100, 200])]
+    for mm in measurements:
+        mm.UpdateConfiguration({"Plotting": {"KDE": "Binned"}})
+    # the pools are reused
+    assert get_worker_pool(2, "thread") is get_worker_pool(2, "thread")
+    c1 = compute_contours(measurements, yax="Defo", xax="Area",
+                          workers=2, worker_type="thread")
+    # cached grids are evaluated in the calling thread
+    get_pool = rtdc_dataset.get_worker_pool
+    def no_pool(*args, **kwargs):
+        raise AssertionError("cached grids must not be sent to workers")
+    rtdc_dataset.get_worker_pool = no_pool
+    try:
+        c2 = compute_contours(measurements, yax="Defo", xax="Area",
+                              workers=2, worker_type="thread", accuracy=.5)
+    finally:
+        rtdc_dataset.get_worker_pool = get_pool
+    for (_x, _y, z1), (_x2, _y2, z2) in zip(c1, c2):
+        # every other point of the finer grid is on the coarse grid
+        z2 = z2[::2, ::2][:z1.shape[0], :z1.shape[1]]
+        assert np.allclose(z1, z2)
+    density_cache.Clear()
+
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -16,7 +16,9 @@ import numpy as np
 
 # Add parent directory to beginning of path variable
 sys.path.insert(0, dirname(dirname(abspath(__file__))))
-from shapeout.lin_mix_mod import linmixmod
+from shapeout.lin_mix_mod import (linmixmod, linmixmod_batch, batch_summary,
+                                  adjust_pvalues, get_session_pool,
+                                  resampling_test, summarize, RSessionPool)
 
 
 def test_linmixmod():
@@ -32,6 +34,183 @@ def test_linmixmod():
     res = linmixmod(xs=xs, treatment=treatment, timeunit=timeunit)
     
     assert np.allclose([res["Estimate"]], [136.63650509])
+    # the input lists are not modified
+    assert treatment == ['Control', 'Drug', 'Control', 'Drug']
+    assert timeunit == [1, 1, 2, 2]
+    assert 0 < res["p-Value (Likelihood Ratio Test)"] < 1
+    assert res["Full Summary"].count("Linear mixed model fit")
+
+
+def test_session_pool():
+    pool = get_session_pool()
+    pool.Close()
+    treatment = ['Control', 'Drug', 'Control', 'Drug']
+    timeunit = [1, 1, 2, 2]
+    xs = [ np.arange(10)+ii for ii in range(4) ]
+    res1 = linmixmod(xs=xs, treatment=list(treatment),
+                     timeunit=list(timeunit))
+    assert len(pool._idle) == 1
+    pid = pool._idle[0].prog.pid
+    # the R session is reused
+    res2 = linmixmod(xs=xs, treatment=list(treatment),
+                     timeunit=list(timeunit))
+    assert pool._idle[0].prog.pid == pid
+    assert np.allclose(res1["Estimate"], res2["Estimate"])
+    # a dead R session is replaced
+    pool._idle[0].prog.kill()
+    pool._idle[0].prog.wait()
+    res3 = linmixmod(xs=xs, treatment=list(treatment),
+                     timeunit=list(timeunit))
+    assert pool._idle[0].prog.pid != pid
+    assert np.allclose(res1["Estimate"], res3["Estimate"])
+    # batches do not change the number of idle sessions
+    size = pool.size
+    linmixmod_batch([("a", xs), ("b", xs), ("c", xs)],
+                    treatment=treatment, timeunit=timeunit, workers=3)
+    assert pool.size == size
+    assert len(pool._idle) <= size
+
+
+def test_session_pool_resize():
+    class Session(object):
+        prog = None
+    pool = RSessionPool(size=4)
+    pool._idle = [Session() for ii in range(4)]
+    pool.Resize(1)
+    assert pool.size == 1
+    assert len(pool._idle) == 1
+    pool.Close()
+    assert pool._idle == []
+
+
+def test_linmixmod_numpy():
+    treatment = ['Control', 'Drug', 'Control', 'Drug']
+    timeunit = [1, 1, 2, 2]
+    xs = [
+          [100,99,80,120,140,150,100,100,110,111,140,145],
+          [115,110,90,110,145,155,110,120,115,120,120,150,100,90,100],
+          [150,150,130,170,190,250,150,150,160,161,180,195,130,120,125,130,125],
+          [155,155,135,175,195,255,155,155,165,165,185, 200,135,125,130,135,140,150,135,140]
+         ]
+
+    res = linmixmod(xs=xs, treatment=treatment, timeunit=timeunit,
+                    backend="numpy")
+    # same results as lme4
+    assert np.allclose([res["Estimate"]], [136.63650509])
+    assert np.allclose([res["Fixed Effect"]], [1.40856], atol=1e-4)
+    assert np.allclose([res["p-Value (Likelihood Ratio Test)"]], [0.84346],
+                       atol=1e-4)
+    # shifting the data only changes the estimate
+    res2 = linmixmod(xs=[ np.array(x)+1000 for x in xs ],
+                     treatment=treatment, timeunit=timeunit,
+                     backend="numpy")
+    assert np.allclose([res2["Estimate"]], [1136.63650509])
+    assert np.allclose([res2["Fixed Effect"]], [res["Fixed Effect"]])
+
+
+def test_linmixmod_numpy_treatments():
+    state = np.random.RandomState(42)
+    treatment = ['Control', 'Drug', 'Drug 2']*3
+    timeunit = [1, 1, 1, 2, 2, 2, 3, 3, 3]
+    xs = [ state.normal(loc=10+ii%3+ii//3, size=500) for ii in range(9) ]
+    res = linmixmod(xs=xs, treatment=treatment, timeunit=timeunit,
+                    backend="numpy")
+    assert np.allclose([res["Estimate"]], [11], atol=.1)
+    assert np.allclose([res["Fixed Effect"]], [1], atol=.1)
+    assert res["p-Value (Likelihood Ratio Test)"] < .01
+
+
+def test_linmixmod_aggregated():
+    state = np.random.RandomState(47)
+    treatment = ['Control', 'Drug']*3
+    timeunit = [1, 1, 2, 2, 3, 3]
+    xs = [ state.normal(loc=100+ii, scale=10, size=1000) for ii in range(6) ]
+    masks = [ state.rand(1000) > .3 for ii in range(6) ]
+    summaries = [ summarize(x, mask=m, chunk_size=64)
+                  for x, m in zip(xs, masks) ]
+    for (count, mean, ss), x, m in zip(summaries, xs, masks):
+        assert count == np.sum(m)
+        assert np.allclose(mean, np.mean(x[m]))
+        assert np.allclose(ss, np.sum((x[m]-np.mean(x[m]))**2))
+    res = linmixmod(xs=[ x[m] for x, m in zip(xs, masks) ],
+                    treatment=treatment, timeunit=timeunit, backend="numpy")
+    res2 = linmixmod(xs=summaries, treatment=treatment, timeunit=timeunit,
+                     backend="numpy", aggregated=True)
+    for key in ["Estimate", "Fixed Effect", "p-Value (Likelihood Ratio Test)"]:
+        assert np.allclose([res[key]], [res2[key]])
+    try:
+        linmixmod(xs=summaries, treatment=treatment, timeunit=timeunit,
+                  aggregated=True)
+    except ValueError:
+        pass
+    else:
+        assert False, "aggregated mode requires numpy backend"
+
+
+def test_linmixmod_batch():
+    treatment = ['Control', 'Drug', 'Control', 'Drug']
+    timeunit = [1, 1, 2, 2]
+    xs = [
+          [100,99,80,120,140,150,100,100,110,111,140,145],
+          [115,110,90,110,145,155,110,120,115,120,120,150,100,90,100],
+          [150,150,130,170,190,250,150,150,160,161,180,195,130,120,125,130,125],
+          [155,155,135,175,195,255,155,155,165,165,185, 200,135,125,130,135,140,150,135,140]
+         ]
+    features = [("Area", xs),
+                ("Area 2", [ 2*np.array(x) for x in xs ])]
+    results = linmixmod_batch(features, treatment=treatment,
+                              timeunit=timeunit, backend="numpy", workers=2)
+    assert [ name for name, _r in results ] == ["Area", "Area 2"]
+    res = linmixmod(xs=xs, treatment=treatment, timeunit=timeunit,
+                    backend="numpy")
+    assert np.allclose([results[0][1]["Estimate"]], [res["Estimate"]])
+    assert np.allclose([results[1][1]["Estimate"]], [2*res["Estimate"]])
+    p = res["p-Value (Likelihood Ratio Test)"]
+    assert np.allclose([results[0][1]["p-Value (Holm)"]], [min(1, 2*p)])
+    assert np.allclose([results[0][1]["p-Value (FDR)"]], [p])
+    assert batch_summary(results).count("\n") == 3
+    # a failing feature does not abort the batch
+    features.insert(1, ("Const", [np.ones(10)]*4))
+    results = linmixmod_batch(features, treatment=treatment,
+                              timeunit=timeunit, backend="numpy", workers=2)
+    assert [ name for name, _r in results ] == ["Area", "Const", "Area 2"]
+    assert list(results[1][1].keys()) == ["Error"]
+    assert np.allclose([results[0][1]["p-Value (Holm)"]], [min(1, 2*p)])
+    summary = batch_summary(results)
+    assert summary.count("\n") == 4
+    assert "Const\tValueError" in summary
+
+
+def test_linmixmod_resampling():
+    treatment = ['Control', 'Drug']*3
+    timeunit = [1, 1, 2, 2, 3, 3]
+    state = np.random.RandomState(42)
+    xs = [ state.normal(loc=10+ii%2+ii//2, size=100) for ii in range(6) ]
+    res = linmixmod(xs=xs, treatment=treatment, timeunit=timeunit,
+                    backend="numpy", significance="bootstrap",
+                    resamples=20, workers=1, chunk_size=5)
+    assert res["Resamples"] == 20
+    low, high = res["Confidence Interval"]
+    assert 0 <= low <= res["p-Value"] <= high <= 1
+    assert "BOOTSTRAP TEST" in res["Full Summary"]
+    # the result does not depend on the number of workers
+    res2 = resampling_test(xs, treatment, timeunit, method="bootstrap",
+                           resamples=20, workers=2, chunk_size=5)
+    assert res2["p-Value"] == res["p-Value"]
+    # early stopping
+    res3 = resampling_test(xs, treatment, timeunit, method="permutation",
+                           resamples=20, workers=1, chunk_size=5,
+                           ci_width=.9)
+    assert res3["Resamples"] == 5
+    assert res3["Confidence Interval"][1]-res3["Confidence Interval"][0] < .9
+
+
+def test_adjust_pvalues():
+    p = [.01, .04, .03, .005]
+    assert np.allclose(adjust_pvalues(p, "holm"), [.03, .06, .06, .02])
+    assert np.allclose(adjust_pvalues(p, "fdr"), [.02, .04, .04, .02])
+    assert np.allclose(adjust_pvalues([.5, .9], "holm"), [1, 1])
+
 
 
 if __name__ == "__main__":
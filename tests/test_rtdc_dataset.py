@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division, print_function
+import sys
+from os.path import abspath, dirname
+
+import numpy as np
+import shutil
+import struct
+import tempfile
+import warnings
+
+import dclab
+import dclab.definitions as dfn
+from nptdms import TdmsFile
+
+# Add parent directory to beginning of path variable
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from shapeout import rtdc_dataset, tdms_index
+from shapeout.rtdc_dataset import RTDC_DataSet
+from shapeout.tdms_index import TdmsIndex
+
+from helper_methods import example_data_dict, example_tdms_file
+
+
+def test_tdms_index():
+    tdir = tempfile.mkdtemp()
+    path = example_tdms_file(size=314, dirname=tdir)
+    tdms_file = TdmsFile(path)
+    index = TdmsIndex(path)
+    for ch in ["time", "area", "circularity", "x", "y"]:
+        assert np.all(index.channel_data("Cell Track", ch) ==
+                      tdms_file.object("Cell Track", ch).data)
+        assert index.channel_length("Cell Track", ch) == 314
+    assert not index.has_channel("Cell Track", "ax1")
+    # write a ".tdms_index" file (lead-in and metadata only)
+    with open(path, "rb") as fd:
+        raw = fd.read()
+    indexdata = b""
+    offset = 0
+    while offset < len(raw):
+        _toc, _ver, next_offset, meta_size = struct.unpack(
+                                        b"<IIQQ", raw[offset+4:offset+28])
+        indexdata += b"TDSh" + raw[offset+4:offset+28+meta_size]
+        offset += 28 + next_offset
+    with open(path+"_index", "wb") as fd:
+        fd.write(indexdata)
+    index2 = TdmsIndex(path)
+    assert index2._chunks == index._chunks
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_dclab_attributes():
+    tdir = tempfile.mkdtemp()
+    path = example_tdms_file(size=314, dirname=tdir)
+    ds = dclab.RTDC_DataSet(path)
+    mm = RTDC_DataSet(path)
+    for name in ["tdms_filename", "name", "fdir", "title", "file_hashes",
+                 "identifier"]:
+        assert getattr(mm, name) == getattr(ds, name)
+    # dclab converts the "Circ" and "Defo" filter ranges of the global
+    # default configuration when a measurement is loaded.
+    for key in ds.Configuration:
+        if key != "Filtering":
+            assert mm.Configuration[key] == ds.Configuration[key]
+    assert np.all(mm._filter == ds._filter)
+    for name in dfn.rdv:
+        assert np.all(getattr(mm, name) == getattr(ds, name))
+    # data dictionaries
+    dd = RTDC_DataSet(ddict=example_data_dict(size=10))
+    assert len(dd._filter) == 10
+    assert np.all(dd.area == dclab.RTDC_DataSet(
+                                ddict=example_data_dict(size=10)).area)
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_lazy():
+    tdir = tempfile.mkdtemp()
+    path = example_tdms_file(size=314, dirname=tdir)
+    mm = RTDC_DataSet(path)
+    lz = RTDC_DataSet(path, lazy=True)
+    assert lz._columns == {}
+    assert lz.Configuration["General"] == mm.Configuration["General"]
+    assert lz.file_hashes == mm.file_hashes
+    # only the accessed column is loaded
+    assert np.all(lz.deform == mm.deform)
+    assert list(lz._columns.keys()) == ["deform"]
+    for col in dfn.rdv:
+        assert np.allclose(getattr(lz, col), getattr(mm, col), equal_nan=True)
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_lazy_unsupported():
+    tdir = tempfile.mkdtemp()
+    path = example_tdms_file(size=314, dirname=tdir)
+    mm = RTDC_DataSet(path)
+    # data types that are not supported by `TdmsIndex`
+    type_size = tdms_index._type_size
+    def unsupported(dtype):
+        raise NotImplementedError("Unknown tdms data type: {}".format(dtype))
+    tdms_index._type_size = unsupported
+    try:
+        lz = RTDC_DataSet(path, lazy=True)
+    finally:
+        tdms_index._type_size = type_size
+    assert not lz._lazy
+    for col in dfn.rdv:
+        assert np.allclose(getattr(lz, col), getattr(mm, col), equal_nan=True)
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_lazy_filter():
+    tdir = tempfile.mkdtemp()
+    path = example_tdms_file(size=314, dirname=tdir)
+    mm = RTDC_DataSet(path)
+    lz = RTDC_DataSet(path, lazy=True)
+    cfg = {"Filtering": {"Defo Min": .05,
+                         "Defo Max": .1,
+                         "Limit Events": 20}}
+    mm.UpdateConfiguration(cfg)
+    lz.UpdateConfiguration(cfg)
+    assert np.all(lz._filter == mm._filter)
+    assert sorted(lz._columns.keys()) == ["circ", "deform"]
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+
+def test_axis_summary():
+    tdir = tempfile.mkdtemp()
+    path = example_tdms_file(size=314, dirname=tdir)
+    for lazy in [False, True]:
+        mm = RTDC_DataSet(path, lazy=lazy)
+        summary = mm.GetAxisSummary("Area")
+        assert summary["present"]
+        assert summary["finite"] == 314
+        assert np.allclose(summary["max"], mm.area_um.max())
+        assert not mm.GetAxisSummary("FL-1max")["present"]
+        # summary is reset when the pixel size changes
+        mm.UpdateConfiguration({"Image": {"Pix Size": .5}})
+        assert np.allclose(mm.GetAxisSummary("Area")["max"],
+                           mm.area.max()*.25)
+    # columns loaded for the summary are not cached in lazy mode
+    mm = RTDC_DataSet(path, lazy=True)
+    mm.GetAxisSummary("Aspect")
+    assert mm._columns == {}
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_filter_components():
+    ddict = example_data_dict(size=1234, keys=["Area", "Defo", "Time"])
+    ref = dclab.RTDC_DataSet(ddict=ddict)
+    mm = RTDC_DataSet(ddict=ddict)
+    cfgs = [{"Area Min": .2, "Area Max": .8},
+            {"Defo Min": .1, "Defo Max": .5},
+            {"Area Min": .4},
+            {"Time Min": 100, "Time Max": 1000, "Limit Events": 200},
+            {"Enable Filters": False},
+            {"Enable Filters": True, "Area Max": .4}]
+    for ii, cfg in enumerate(cfgs):
+        if ii == 2:
+            # manual filter is edited in-place
+            ref._filter_manual[10:20] = False
+            mm._filter_manual[10:20] = False
+        ref.UpdateConfiguration({"Filtering": cfg})
+        mm.UpdateConfiguration({"Filtering": cfg})
+        assert np.all(ref._filter == mm._filter)
+    # excluded events fail at least one filter component
+    assert np.all(mm._failed_filters[~mm._filter] > 0)
+
+
+def test_sort_index():
+    ddict = example_data_dict(size=1234, keys=["Area", "Defo", "Time"])
+    ddict["Circ"] = 1 - ddict["Defo"]
+    ddict["Area"][::10] = np.nan
+    ref = RTDC_DataSet(ddict=ddict)
+    mm = RTDC_DataSet(ddict=ddict, sort_index=True)
+    cfgs = [{"Area Min": .2, "Area Max": .8},
+            {"Area Min": .3, "Area Max": .9},
+            {"Time Min": 100, "Time Max": 1000},
+            {"Area Min": .1, "Area Max": .1},
+            {"Defo Min": .2, "Defo Max": .7, "Time Min": 500},
+            {"Area Min": .5, "Area Max": .4},
+            # inverted range followed by other ranges
+            {"Area Min": .2, "Area Max": .8},
+            {"Area Min": .5, "Area Max": .4},
+            {"Area Min": .45, "Area Max": .9},
+            {"Area Min": 0, "Area Max": 1}]
+    for cfg in cfgs:
+        ref.UpdateConfiguration({"Filtering": cfg})
+        mm.UpdateConfiguration({"Filtering": cfg})
+        assert np.all(ref._filter == mm._filter)
+    # Time is monotonic and does not need an index
+    assert mm._sort_index["time"] is None
+    assert mm._sort_index["area_um"] is not None
+    # an increasing column with NaN values is not monotonic
+    ddict["Time"] = ddict["Time"].astype(float)
+    ddict["Time"][5] = np.nan
+    nn = RTDC_DataSet(ddict=ddict, sort_index=True)
+    # (warnings that were already issued are not shown again)
+    getattr(rtdc_dataset, "__warningregistry__", {}).clear()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert nn._get_sort_index("time") is not None
+        assert nn._get_sort_index("area_um") is not None
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
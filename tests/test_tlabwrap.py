@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division, print_function
+import sys
+import os
+from os.path import abspath, dirname
+
+import shutil
+import tempfile
+import threading
+
+from dclab.rtdc_dataset import hashfile
+
+# Add parent directory to beginning of path variable
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from shapeout import tdms_index, tlabwrap
+from shapeout.hashcache import fingerprint_file
+
+from helper_methods import example_tdms_file
+
+
+def test_measurement_info():
+    tdir = tempfile.mkdtemp()
+    path = example_tdms_file(size=314, dirname=tdir)
+    info = tlabwrap.GetMeasurementInfo(path)
+    assert info == {"events": 314,
+                    "flow rate": 0.12,
+                    "region": "channel"}
+    assert tlabwrap.GetEvents(path) == 314
+    # data types that are not supported by `TdmsIndex`
+    type_size = tdms_index._type_size
+    def unsupported(dtype):
+        raise NotImplementedError("Unknown tdms data type: {}".format(dtype))
+    tdms_index._type_size = unsupported
+    try:
+        assert tlabwrap.GetEvents(path) == 314
+    finally:
+        tdms_index._type_size = type_size
+    # missing ini file
+    os.remove(os.path.join(tdir, "M1_camera.ini"))
+    assert tlabwrap.GetMeasurementInfo(path) is None
+    assert not tlabwrap.IsFullMeasurement(path)
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_relocate():
+    tdir = tempfile.mkdtemp()
+    files = []
+    for sd, size in [("a", 10), ("b", 100), ("c", 12)]:
+        os.makedirs(os.path.join(tdir, sd))
+        files.append(example_tdms_file(size, dirname=os.path.join(tdir, sd)))
+    # all files are called "M1_data.tdms"
+    measurements = [ ("/old/path/M1_data.tdms", hashfile(f),
+                      fingerprint_file(f), os.path.getsize(f))
+                     for f in files[:2] ]
+    # not in the directory
+    measurements.append(("/old/path/M2_data.tdms", "123", None, None))
+    calls = []
+    get_hash = tlabwrap.hashfile
+    def counting_hashfile(fname):
+        calls.append(fname)
+        return get_hash(fname)
+    tlabwrap.hashfile = counting_hashfile
+    try:
+        found = tlabwrap.relocate_tdms_files(measurements, [tdir])
+        assert found == files[:2] + [None]
+        # candidates with the wrong size are not hashed
+        assert sorted(calls) == files[:2]
+        # without size and fingerprint
+        assert tlabwrap.search_hashed_tdms("M1_data.tdms",
+                                           measurements[1][1],
+                                           [tdir]) == files[1]
+    finally:
+        tlabwrap.hashfile = get_hash
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_tree():
+    tdir = tempfile.mkdtemp()
+    files = [ example_tdms_file(s, mid=ii+1, dirname=tdir)
+              for ii, s in enumerate([10, 100]) ]
+    treelist, _cols = tlabwrap.GetTDMSTreeGUI(tdir)
+    assert len(treelist) == 1
+    assert [ m[1] for m in treelist[0][1:] ] == files
+    assert treelist[0][2][0] == u"M2 channel  0.12 µls⁻¹  (100 events)"
+    assert treelist[0][2][2]["events"] == 100
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_tree_callback():
+    tdir = tempfile.mkdtemp()
+    subdirs = [tdir, os.path.join(tdir, "b"), os.path.join(tdir, "a", "c")]
+    files = []
+    for ii, sd in enumerate(subdirs):
+        if not os.path.exists(sd):
+            os.makedirs(sd)
+        files.append(example_tdms_file(10, mid=ii+1, dirname=sd))
+    # a folder without measurements
+    os.makedirs(os.path.join(tdir, "d"))
+    parts = []
+    treelist, cols = tlabwrap.GetTDMSTreeGUI(tdir, callback=parts.append,
+                                             workers=3)
+    # one project per folder, sorted by path
+    assert [ p[0][1] for p in treelist ] == sorted(subdirs)
+    assert sorted([ m[1] for p in treelist for m in p[1:] ]) == sorted(files)
+    # each folder is reported once
+    assert len(parts) == 3
+    assert sorted([ p[0][0] for p in parts ],
+                  key=lambda p: p[0][1]) == treelist
+    assert parts[0][0][0][0][1] == tdir
+    assert parts[0][1] == cols
+    # directories that are given twice are scanned once
+    treelist2, _cols = tlabwrap.GetTDMSTreeGUI([tdir, subdirs[1]])
+    assert treelist2 == treelist
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_tree_abort():
+    tdir = tempfile.mkdtemp()
+    example_tdms_file(10, mid=1, dirname=tdir)
+    abort = threading.Event()
+    abort.set()
+    treelist, _cols = tlabwrap.GetTDMSTreeGUI(tdir, abort=abort)
+    assert treelist == []
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()